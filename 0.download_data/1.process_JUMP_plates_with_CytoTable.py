@@ -2,89 +2,374 @@
 Processes JUMP plates from manifest using CytoTable
 to produce joined compartment data in Parquet format
 for use in downstream analysis.
+
+Plates are processed concurrently (one process per plate) within a CPU and
+memory budget, where each plate goes through the states
+downloaded -> converted -> compacted -> verified, which are saved in a state
+file per plate so an interrupted run resumes where each plate left off.
+Compaction sorts the cells of a plate by well, site and object into bounded row
+groups, so reads of a few wells or sites skip the row groups of other wells.
+Verified plates can also be split into a Parquet file per column group
+(metadata, Nuclei, Cells, Cytoplasm and Image) for reads of a few columns.
+The SQLite file of each plate is removed from the cache as soon as its Parquet
+file is verified, so only the SQLite files of in-flight plates use disk space.
 """
 
+import argparse
+import json
+import multiprocessing
+import os
 import pathlib
 import shutil
+import sqlite3
+import sys
+import time
+import traceback
+from typing import Optional
 
-import cytotable
 import pandas as pd
-from parsl.config import Config
-from parsl.executors import ThreadPoolExecutor
+from cloudpathlib import S3Client, S3Path
 from pyarrow import parquet
 
-# create plates directory if it doesn't exist already
-if not (plates_folder := pathlib.Path("./0.download_data/data/plates")).is_dir():
-    plates_folder.mkdir()
-
-# process each plate from the manifest individually
-for _, plate_name, plate_s3_path in pd.read_csv(
-    "./0.download_data/data/jump_dataset_location_manifest.csv", header=0
-).to_records():
-    print("Processing plate ", plate_name)
-
-    # create a folder for the plate
-    if not (
-        plate_folder := pathlib.Path(f"./0.download_data/data/plates/{plate_name}")
-    ).is_dir():
-        plate_folder.mkdir(parents=True, exist_ok=True)
-
-    # if we don't have the cytotable output for a plate, process it
-    if not (
-        cytotable_output_path := pathlib.Path(
-            f"./0.download_data/data/plates/{plate_name}/{plate_name}.parquet"
+sys.path.append(str(pathlib.Path(__file__).resolve().parent / "utils"))
+from cytotable_conversion import convert_jump_plate, select_chunk_size
+from plate_compaction import compact_plate
+from plate_partitions import partition_plate
+
+# location of the sqlite files downloaded from AWS S3
+SQLITE_CACHE_DIR = pathlib.Path("./0.download_data/jump_sqlite_s3_cache/")
+
+# location of the processed plates
+PLATES_DIR = pathlib.Path("./0.download_data/data/plates")
+
+# rows-per-GB model of this machine for selecting chunk sizes automatically,
+# written by benchmark_cytotable_chunk_size.py
+CHUNK_SIZE_MODEL_PATH = pathlib.Path(
+    "./0.download_data/data/chunk_size_benchmark/cytotable_chunk_size_model.json"
+)
+
+
+def read_plate_state(plate_name: str) -> dict:
+    """Read the processing state of a plate."""
+
+    state_path = PLATES_DIR / plate_name / f"{plate_name}.state.json"
+
+    if state_path.is_file():
+        with state_path.open() as state_file:
+            return json.load(state_file)
+
+    # outputs of runs before state files were written are trusted, as before
+    if (PLATES_DIR / plate_name / f"{plate_name}.parquet").is_file():
+        return {"plate": plate_name, "status": "converted"}
+
+    return {"plate": plate_name, "status": "pending"}
+
+
+def write_plate_state(state: dict, **updates: object) -> dict:
+    """Update the state of a plate, replacing its state file atomically."""
+
+    state = {**state, **updates, "updated": time.time()}
+    state_path = PLATES_DIR / state["plate"] / f"{state['plate']}.state.json"
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+
+    tmp_state_path = state_path.with_name(f".{state_path.name}.tmp")
+    with tmp_state_path.open("w") as state_file:
+        json.dump(state, state_file, indent=2)
+    os.replace(tmp_state_path, state_path)
+
+    return state
+
+
+def download_plate(plate_s3_path: str) -> pathlib.Path:
+    """Download the sqlite file of a plate to the cache, if not already cached."""
+
+    # allows AWS S3 requests without login
+    client = S3Client(no_sign_request=True, local_cache_dir=SQLITE_CACHE_DIR)
+
+    return pathlib.Path(S3Path(plate_s3_path, client=client).fspath)
+
+
+def verify_plate(
+    output_path: pathlib.Path, sqlite_path: Optional[pathlib.Path] = None
+) -> int:
+    """
+    Check that the Parquet file of a plate is readable and has one row per
+    cytoplasm of the sqlite file (when available), returning its row count.
+    """
+
+    # read only the metadata from parquet file
+    num_rows = parquet.ParquetFile(output_path).metadata.num_rows
+
+    if sqlite_path is not None and sqlite_path.is_file():
+        with sqlite3.connect(f"file:{sqlite_path}?mode=ro", uri=True) as connection:
+            (num_cytoplasm,) = connection.execute(
+                "SELECT COUNT(*) FROM Cytoplasm"
+            ).fetchone()
+
+        if num_rows != num_cytoplasm:
+            raise ValueError(
+                f"{output_path} has {num_rows} rows, but the sqlite file has "
+                f"{num_cytoplasm} cytoplasm objects"
+            )
+
+    elif num_rows == 0:
+        raise ValueError(f"{output_path} has no rows")
+
+    return num_rows
+
+
+def evict_plate_sqlite(sqlite_path: pathlib.Path) -> None:
+    """Remove the sqlite file of a plate and its empty cache directories."""
+
+    sqlite_path.unlink(missing_ok=True)
+
+    for parent in sqlite_path.parents:
+        if parent == SQLITE_CACHE_DIR.resolve() or not parent.is_dir():
+            break
+
+        if any(parent.iterdir()):
+            break
+
+        parent.rmdir()
+
+
+def convert_downloaded_plate(
+    state: dict,
+    plate_s3_path: str,
+    output_path: pathlib.Path,
+    threads_per_plate: int,
+    chunk_size: int,
+) -> dict:
+    """Convert the downloaded sqlite file of a plate to Parquet."""
+
+    sqlite_path = pathlib.Path(state["sqlite_path"])
+
+    # the sqlite file may have been removed since it was downloaded
+    if not sqlite_path.is_file():
+        sqlite_path = download_plate(plate_s3_path)
+
+    print("Processing plate", state["plate"])
+    convert_jump_plate(
+        sqlite_path,
+        output_path,
+        chunk_size=chunk_size,
+        num_workers=threads_per_plate,
+    )
+
+    return write_plate_state(state, status="converted")
+
+
+def verify_converted_plate(state: dict, output_path: pathlib.Path) -> dict:
+    """
+    Verify the Parquet file of a converted (or compacted) plate, where plates
+    with an incomplete output are marked to be converted again.
+    """
+
+    sqlite_path = state.get("sqlite_path")
+    sqlite_path = pathlib.Path(sqlite_path) if sqlite_path else None
+
+    try:
+        num_rows = verify_plate(output_path, sqlite_path)
+
+    except ValueError:
+        # an incomplete output is converted again by the next run
+        if sqlite_path is not None:
+            write_plate_state(state, status="downloaded")
+        raise
+
+    return write_plate_state(state, status="verified", num_rows=num_rows, error=None)
+
+
+def process_plate(
+    plate_name: str,
+    plate_s3_path: str,
+    threads_per_plate: int,
+    chunk_size: int,
+    compaction: Optional[dict] = None,
+    partition_columns: bool = False,
+) -> dict:
+    """
+    Process a plate from its current state until it's verified, where plates
+    are compacted with the `compaction` arguments of compact_plate (or not
+    compacted when None), and verified plates are partitioned by column group
+    when `partition_columns` is set.
+    """
+
+    output_path = PLATES_DIR / plate_name / f"{plate_name}.parquet"
+    state = read_plate_state(plate_name)
+
+    try:
+        if state["status"] == "pending":
+            print("Downloading plate", plate_name)
+            sqlite_path = download_plate(plate_s3_path)
+            state = write_plate_state(
+                state, status="downloaded", sqlite_path=str(sqlite_path.resolve())
+            )
+
+        if state["status"] == "downloaded":
+            state = convert_downloaded_plate(
+                state, plate_s3_path, output_path, threads_per_plate, chunk_size
+            )
+
+        if state["status"] == "converted" and compaction is not None:
+            print("Compacting plate", plate_name)
+            state = write_plate_state(
+                state,
+                status="compacted",
+                compaction=compact_plate(output_path, **compaction),
+            )
+
+        if state["status"] in ("converted", "compacted"):
+            state = verify_converted_plate(state, output_path)
+
+        # the sqlite file is only needed until the output is verified
+        if state.get("sqlite_path"):
+            evict_plate_sqlite(pathlib.Path(state["sqlite_path"]))
+
+        if partition_columns and not state.get("partitions_manifest"):
+            print("Partitioning plate", plate_name)
+            manifest_path = partition_plate(
+                output_path, PLATES_DIR / plate_name / "partitions"
+            )
+            state = write_plate_state(
+                state, partitions_manifest=str(manifest_path), error=None
+            )
+
+    except Exception:
+        # the state file has the last state reached, e.g. after a failed verify
+        state = write_plate_state(
+            read_plate_state(plate_name), error=traceback.format_exc()
         )
-    ).is_file():
-        # process plate using CytoTable
-        cytotable_output_path = cytotable.convert(
-            source_path=plate_s3_path,
-            dest_path=cytotable_output_path,
-            dest_datatype="parquet",
-            source_datatype="sqlite",
-            chunk_size=8000,
-            preset="cellprofiler_sqlite_cpg0016_jump",
-            # allows AWS S3 requests without login
-            no_sign_request=True,
-            # use explicit cache to avoid temp cache removal
-            local_cache_dir="./0.download_data/jump_sqlite_s3_cache/",
-            parsl_config=Config(
-                executors=[ThreadPoolExecutor(label="tpe_for_jump_processing")]
-            ),
-            sort_output=False,
-            # add a custom join statement to include all image data
-            # for use during analysis.
-            joins="""
-                SELECT
-                image.*,
-                cytoplasm.* EXCLUDE (Metadata_ImageNumber),
-                cells.* EXCLUDE (Metadata_ImageNumber),
-                nuclei.* EXCLUDE (Metadata_ImageNumber)
-            FROM
-                read_parquet('cytoplasm.parquet') AS cytoplasm
-            LEFT JOIN read_parquet('cells.parquet') AS cells ON
-                cells.Metadata_ImageNumber = cytoplasm.Metadata_ImageNumber
-                AND cells.Metadata_ObjectNumber = cytoplasm.Cytoplasm_Parent_Cells
-            LEFT JOIN read_parquet('nuclei.parquet') AS nuclei ON
-                nuclei.Metadata_ImageNumber = cytoplasm.Metadata_ImageNumber
-                AND nuclei.Metadata_ObjectNumber = cytoplasm.Cytoplasm_Parent_Nuclei
-            LEFT JOIN read_parquet('image.parquet') AS image ON
-                image.Metadata_ImageNumber = cytoplasm.Metadata_ImageNumber
-            """,
+
+    return state
+
+
+def process_plate_task(plate_args: tuple) -> dict:
+    """Process a plate from a tuple of the arguments of process_plate."""
+
+    return process_plate(*plate_args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    # maximum number of plates processed at the same time
+    parser.add_argument("--max_concurrent_plates", type=int, default=2)
+
+    # threads used to convert each plate
+    parser.add_argument("--threads_per_plate", type=int, default=2)
+
+    # cpus and memory available to all plates, where the number of concurrent
+    # plates is reduced to fit within them
+    parser.add_argument("--cpu_budget", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--memory_budget_gb",
+        type=float,
+        default=0.8 * os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 2**30,
+    )
+    parser.add_argument("--memory_per_plate_gb", type=float, default=16)
+
+    # rows of each compartment read at a time, where "auto" selects the largest
+    # chunk size expected to fit in the memory of a plate
+    parser.add_argument("--chunk_size", default="8000")
+
+    # compaction of the converted plates (see utils/plate_compaction.py)
+    parser.add_argument("--skip_compaction", action="store_true")
+    parser.add_argument("--max_row_group_size", type=int, default=5_000)
+    parser.add_argument("--write_page_index", action="store_true")
+
+    # also write the columns of each plate as a file per column group
+    # (see utils/plate_partitions.py)
+    parser.add_argument("--partition_columns", action="store_true")
+    args = parser.parse_args()
+
+    num_workers = max(
+        1,
+        min(
+            args.max_concurrent_plates,
+            args.cpu_budget // args.threads_per_plate,
+            int(args.memory_budget_gb // args.memory_per_plate_gb),
+        ),
+    )
+
+    # create plates directory if it doesn't exist already
+    PLATES_DIR.mkdir(parents=True, exist_ok=True)
+
+    manifest = pd.read_csv(
+        "./0.download_data/data/jump_dataset_location_manifest.csv", header=0
+    )
+
+    if args.chunk_size == "auto":
+        chunk_size = select_chunk_size(
+            CHUNK_SIZE_MODEL_PATH, args.memory_per_plate_gb, args.threads_per_plate
         )
 
-    # read only the metadata from parquet file
-    meta = parquet.ParquetFile(cytotable_output_path).metadata
+    else:
+        chunk_size = int(args.chunk_size)
+
+    compaction = (
+        None
+        if args.skip_compaction
+        else {
+            "max_row_group_size": args.max_row_group_size,
+            "write_page_index": args.write_page_index,
+        }
+    )
+
     print(
-        "Finished processing plate",
-        plate_name,
-        "with output",
-        cytotable_output_path,
-        "which has shape (",
-        meta.num_rows,
-        ",",
-        meta.num_columns,
-        ").",
+        "Processing up to",
+        num_workers,
+        "plates concurrently with a chunk size of",
+        chunk_size,
     )
 
-# remove the SQLite plates
-shutil.rmtree("./0.download_data/jump_sqlite_s3_cache/")
+    failed_plates = []
+
+    plate_tasks = [
+        (
+            plate_name,
+            plate_s3_path,
+            args.threads_per_plate,
+            chunk_size,
+            compaction,
+            args.partition_columns,
+        )
+        for _, plate_name, plate_s3_path in manifest.to_records()
+        if read_plate_state(plate_name)["status"] != "verified"
+        or (
+            args.partition_columns
+            and not read_plate_state(plate_name).get("partitions_manifest")
+        )
+    ]
+
+    # each plate is processed in a new process (a worker per task), since parsl
+    # and cytotable keep global state within a process
+    with multiprocessing.get_context("spawn").Pool(
+        processes=num_workers, maxtasksperchild=1
+    ) as pool:
+        for state in pool.imap_unordered(process_plate_task, plate_tasks):
+            if state["status"] != "verified" or state.get("error"):
+                failed_plates.append(state["plate"])
+                print(
+                    "Failed processing plate",
+                    state["plate"],
+                    "while",
+                    state["status"],
+                    ":\n",
+                    state.get("error"),
+                )
+                continue
+
+            print(
+                "Finished processing plate",
+                state["plate"],
+                "which has",
+                state["num_rows"],
+                "rows.",
+            )
+
+    if failed_plates:
+        raise RuntimeError(f"Failed processing plates {failed_plates}")
+
+    # remove the SQLite cache once every plate is verified
+    shutil.rmtree(SQLITE_CACHE_DIR, ignore_errors=True)
@@ -20,24 +20,28 @@
 # [Papermill](https://github.com/nteract/papermill) 
 # paramterization.
 
-# + editable=true papermill={"duration": 0.008132, "end_time": "2025-01-06T22:28:25.436456", "exception": false, "start_time": "2025-01-06T22:28:25.428324", "status": "completed"} slideshow={"slide_type": ""} tags=["parameters"]
-# Papermill notebook parameters
-# (including notebook cell tag).
-# We set a default here which may be overridden
-# during Papermill execution.
-# See here for more information:
-# https://papermill.readthedocs.io/en/latest/usage-parameterize.html
-plate_id = "BR00117006"
-
 # + editable=true papermill={"duration": 3.150857, "end_time": "2025-01-06T22:28:28.598904", "exception": false, "start_time": "2025-01-06T22:28:25.448047", "status": "completed"} slideshow={"slide_type": ""}
 import json
 import pathlib
+import sys
 from typing import List, Tuple
 
 import pandas as pd
 import pyarrow as pa
 import pyarrow.parquet as pq
-from cloudpathlib import S3Client
+
+# Import the S3 download utils
+sys.path.append(str(pathlib.Path("utils").resolve(strict=True)))
+from s3_downloads import download_s3_objects
+
+# + editable=true papermill={"duration": 0.008132, "end_time": "2025-01-06T22:28:25.436456", "exception": false, "start_time": "2025-01-06T22:28:25.428324", "status": "completed"} slideshow={"slide_type": ""} tags=["parameters"]
+# Papermill notebook parameters
+# (including notebook cell tag).
+# We set a default here which may be overridden
+# during Papermill execution.
+# See here for more information:
+# https://papermill.readthedocs.io/en/latest/usage-parameterize.html
+plate_id = "BR00117006"
 
 
 # + papermill={"duration": 0.021248, "end_time": "2025-01-06T22:28:28.623359", "exception": false, "start_time": "2025-01-06T22:28:28.602111", "status": "completed"}
@@ -116,6 +120,7 @@ def download_jump_cpg000_images_from_s3(
     df: pd.DataFrame,
     s3_columns: List[str],
     data_path: str,
+    max_workers: int = 16,
 ) -> str:
     """
     Downloads images from S3 paths in specified
@@ -125,6 +130,9 @@ def download_jump_cpg000_images_from_s3(
     and downloads files from S3 paths listed
     in the specified columns, using anonymous
     (no-sign-request) access.
+    Images are downloaded concurrently and once
+    each (images are shared by the cells of a site),
+    where failed downloads are retried.
 
     Args:
         df (pd.DataFrame):
@@ -135,40 +143,43 @@ def download_jump_cpg000_images_from_s3(
             that contain the S3 paths.
         data_path (str):
             A path where images will be downloaded.
+        max_workers (int):
+            Number of images downloaded
+            at the same time.
 
     Returns:
         str:
             string based path to the images dir
     """
 
-    # create a custom s3 client to utilize no-sign-request
-    # (for anonymous access to s3 resources)
-    s3_client = S3Client(no_sign_request=True)
-
-    # Create directories for downloading images
-    pathlib.Path(base_outline_path := f"{data_path}/outlines").mkdir(
-        parents=True, exist_ok=True
+    downloads = []
+
+    # Pair each unique image with its local path
+    for s3_column in s3_columns:
+        # Download outlines images
+        if "Outlines" in s3_column:
+            base_path = f"{data_path}/outlines"
+
+        # Download original images
+        elif "Orig" in s3_column:
+            base_path = f"{data_path}/orig"
+
+        else:
+            continue
+
+        downloads.extend(
+            (s3_path, f"{base_path}/{s3_path.rsplit('/', 1)[-1]}")
+            for s3_path in df[s3_column].dropna().unique()
+        )
+
+    # Download the images with a shared anonymous client,
+    # where existing images are skipped
+    report = download_s3_objects(downloads, max_workers=max_workers)
+    print(
+        f"Downloaded {report['num_downloaded']} images "
+        f"({report['num_skipped']} already downloaded) "
+        f"in {report['elapsed_s']:.1f}s ({report['mb_per_s']:.1f} MB/s)"
     )
-    pathlib.Path(base_orig_path := f"{data_path}/orig").mkdir(
-        parents=True, exist_ok=True
-    )
-
-    # Iterate over each record in the DataFrame and download the images
-    for record in df[s3_columns].to_dict(orient="records"):
-        for s3_column in s3_columns:
-            image_cloudpath = s3_client.CloudPath(record[s3_column])
-
-            # Download outlines images
-            if "Outlines" in s3_column:
-                candidate_path = f"{base_outline_path}/{image_cloudpath.name}"
-                if not pathlib.Path(candidate_path).is_file():
-                    image_cloudpath.download_to(candidate_path)
-
-            # Download original images
-            elif "Orig" in s3_column:
-                candidate_path = f"{base_orig_path}/{image_cloudpath.name}"
-                if not pathlib.Path(candidate_path).is_file():
-                    image_cloudpath.download_to(candidate_path)
 
     return "data/images"
 
@@ -0,0 +1,165 @@
+"""
+Benchmarks the CytoTable conversion of a locally stored sample SQLite plate
+across chunk sizes and parsl executor types, recording the wall time, peak
+memory (RSS) and output size of each run.
+The peak memory of the thread executor runs is fit as a rows-per-GB model of
+this machine, which 1.process_JUMP_plates_with_CytoTable.py uses to select
+chunk sizes automatically (--chunk_size auto).
+"""
+
+import argparse
+import itertools
+import json
+import pathlib
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent / "utils"))
+from cytotable_conversion import (
+    EXECUTOR_TYPES,
+    convert_jump_plate,
+    fit_chunk_size_model,
+    write_chunk_size_model,
+)
+
+
+def run_conversion(
+    sqlite_path: pathlib.Path, chunk_size: int, executor_type: str, num_workers: int
+) -> dict:
+    """Convert the sample plate once, measuring the current process."""
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        output_path = convert_jump_plate(
+            sqlite_path,
+            pathlib.Path(tmp_dir) / f"{sqlite_path.stem}.parquet",
+            chunk_size=chunk_size,
+            executor_type=executor_type,
+            num_workers=num_workers,
+        )
+        wall_time_s = time.perf_counter() - start
+        output_gb = output_path.stat().st_size / 2**30
+
+    # ru_maxrss is in KB on Linux, where the largest worker process is
+    # included for process-based executors
+    peak_rss_kb = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+
+    return {
+        "chunk_size": chunk_size,
+        "executor_type": executor_type,
+        "num_workers": num_workers,
+        "wall_time_s": wall_time_s,
+        "peak_rss_gb": peak_rss_kb / 2**20,
+        "output_gb": output_gb,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sqlite_path", type=pathlib.Path, required=True)
+    parser.add_argument(
+        "--chunk_sizes",
+        type=int,
+        nargs="+",
+        default=[1_000, 2_000, 4_000, 8_000, 16_000, 32_000],
+    )
+    parser.add_argument(
+        "--executor_types",
+        nargs="+",
+        choices=EXECUTOR_TYPES,
+        default=list(EXECUTOR_TYPES),
+    )
+    parser.add_argument("--num_workers", type=int, default=2)
+    parser.add_argument(
+        "--output_dir",
+        type=pathlib.Path,
+        default=pathlib.Path("./0.download_data/data/chunk_size_benchmark"),
+    )
+
+    # runs a single conversion, and writes its measurements as json to this path
+    parser.add_argument("--single_run", type=pathlib.Path)
+    args = parser.parse_args()
+
+    sqlite_path = args.sqlite_path.resolve(strict=True)
+
+    if args.single_run is not None:
+        measurements = run_conversion(
+            sqlite_path,
+            args.chunk_sizes[0],
+            args.executor_types[0],
+            args.num_workers,
+        )
+
+        with args.single_run.open("w") as measurements_file:
+            json.dump(measurements, measurements_file)
+        sys.exit()
+
+    benchmark = []
+
+    # each run is a separate process, so its peak memory is only its own
+    with tempfile.TemporaryDirectory() as measurements_dir:
+        for executor_type, chunk_size in itertools.product(
+            args.executor_types, args.chunk_sizes
+        ):
+            print(
+                "Converting with", executor_type, "executor and chunk size", chunk_size
+            )
+            measurements_path = (
+                pathlib.Path(measurements_dir) / f"{executor_type}-{chunk_size}.json"
+            )
+
+            # failed runs are reported and left out of the benchmark
+            run = subprocess.run(
+                [
+                    sys.executable,
+                    __file__,
+                    "--single_run",
+                    str(measurements_path),
+                    "--sqlite_path",
+                    str(sqlite_path),
+                    "--chunk_sizes",
+                    str(chunk_size),
+                    "--executor_types",
+                    executor_type,
+                    "--num_workers",
+                    str(args.num_workers),
+                ],
+                capture_output=True,
+                text=True,
+                check=False,
+            )
+
+            if run.returncode != 0:
+                print(run.stderr)
+                continue
+
+            with measurements_path.open() as measurements_file:
+                benchmark.append(json.load(measurements_file))
+
+    benchmarkdf = pd.DataFrame(benchmark)
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    benchmarkdf.to_csv(
+        args.output_dir / "cytotable_chunk_size_benchmark.csv", index=False
+    )
+    print(benchmarkdf.to_string(index=False))
+
+    # the plates are converted with the thread executor
+    if "thread" not in args.executor_types:
+        sys.exit()
+
+    threaddf = benchmarkdf.loc[benchmarkdf["executor_type"] == "thread"]
+    model = {
+        **fit_chunk_size_model(threaddf),
+        "sqlite_path": str(sqlite_path),
+        "sqlite_gb": sqlite_path.stat().st_size / 2**30,
+    }
+    write_chunk_size_model(model, args.output_dir / "cytotable_chunk_size_model.json")
+    print("Chunk size model:", model)
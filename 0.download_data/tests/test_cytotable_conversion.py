@@ -0,0 +1,71 @@
+import pathlib
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1] / "utils"))
+
+pytest.importorskip("cytotable")
+pytest.importorskip("parsl")
+
+import cytotable_conversion as cc  # noqa: E402
+
+BASE_GB = 1.5
+ROWS_PER_GB = 20_000
+
+
+@pytest.fixture
+def benchmarkdf() -> pd.DataFrame:
+    """Peak memory of a baseline plus a cost per row held in memory."""
+
+    benchmarkdf = pd.DataFrame(
+        {
+            "chunk_size": [1_000, 4_000, 8_000, 16_000, 8_000],
+            "num_workers": [1, 1, 2, 2, 4],
+        }
+    )
+
+    return benchmarkdf.assign(
+        peak_rss_gb=BASE_GB
+        + benchmarkdf["chunk_size"] * benchmarkdf["num_workers"] / ROWS_PER_GB
+    )
+
+
+def test_fit_chunk_size_model(benchmarkdf: pd.DataFrame) -> None:
+    model = cc.fit_chunk_size_model(benchmarkdf)
+
+    assert model["base_gb"] == pytest.approx(BASE_GB)
+    assert model["rows_per_gb"] == pytest.approx(ROWS_PER_GB)
+
+    with pytest.raises(ValueError, match="two different chunk sizes"):
+        cc.fit_chunk_size_model(benchmarkdf.iloc[:1])
+
+    with pytest.raises(ValueError, match="doesn't increase"):
+        cc.fit_chunk_size_model(
+            benchmarkdf.assign(peak_rss_gb=benchmarkdf["peak_rss_gb"].to_numpy()[::-1])
+        )
+
+
+@pytest.mark.parametrize(
+    "memory_gb, num_workers, expected",
+    [
+        # (16 - 1.5) GB * 20,000 rows per GB / 2 workers, rounded down
+        (16, 2, 145_000),
+        (16, 4, 72_000),
+        # within the chunk size bounds
+        (1.5, 2, cc.MIN_CHUNK_SIZE),
+        (512, 1, cc.MAX_CHUNK_SIZE),
+    ],
+)
+def test_select_chunk_size(
+    benchmarkdf: pd.DataFrame,
+    tmp_path: pathlib.Path,
+    memory_gb: float,
+    num_workers: int,
+    expected: int,
+) -> None:
+    model_path = tmp_path / "model" / "cytotable_chunk_size_model.json"
+    cc.write_chunk_size_model(cc.fit_chunk_size_model(benchmarkdf), model_path)
+
+    assert cc.select_chunk_size(model_path, memory_gb, num_workers) == expected
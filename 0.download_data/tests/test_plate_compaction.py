@@ -0,0 +1,102 @@
+import pathlib
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1] / "utils"))
+import plate_compaction as pcomp
+
+NUM_CELLS = 2_000
+WELLS = ["A01", "B02", "C03", None]
+MAX_ROW_GROUP_SIZE = 100
+BATCH_SIZE = 300
+
+
+@pytest.fixture
+def platedf() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+
+    return pd.DataFrame(
+        {
+            "Metadata_Well": rng.choice(WELLS, NUM_CELLS),
+            "Image_Metadata_Site": rng.integers(1, 10, NUM_CELLS),
+            "Metadata_ObjectNumber": rng.permutation(NUM_CELLS),
+            "Cells_AreaShape_Area": rng.normal(size=NUM_CELLS),
+        }
+    )
+
+
+@pytest.mark.parametrize("write_page_index", [False, True])
+def test_compact_plate_sorts_cells(
+    platedf: pd.DataFrame, tmp_path: pathlib.Path, write_page_index: bool
+) -> None:
+    plate_path = tmp_path / "plate.parquet"
+    platedf.to_parquet(plate_path, index=False)
+
+    compaction = pcomp.compact_plate(
+        plate_path,
+        max_row_group_size=MAX_ROW_GROUP_SIZE,
+        write_page_index=write_page_index,
+        batch_size=BATCH_SIZE,
+    )
+
+    assert compaction["num_rows"] == NUM_CELLS
+    assert compaction["num_wells"] == len(WELLS)
+    assert compaction["write_page_index"] == write_page_index
+    # only the compacted plate is left
+    assert [path.name for path in tmp_path.iterdir()] == ["plate.parquet"]
+
+    # cells without a well are sorted last
+    expected = platedf.sort_values(
+        pcomp.SORT_COLS, na_position="last", ignore_index=True
+    )
+    pd.testing.assert_frame_equal(pd.read_parquet(plate_path), expected)
+
+    # each row group is bounded and holds the cells of a single well
+    metadata = pq.ParquetFile(plate_path).metadata
+    assert metadata.num_row_groups == compaction["num_row_groups"]
+
+    well_col = pq.ParquetFile(plate_path).schema_arrow.get_field_index("Metadata_Well")
+    for i in range(metadata.num_row_groups):
+        row_group = metadata.row_group(i)
+        stats = row_group.column(well_col).statistics
+
+        assert row_group.num_rows <= MAX_ROW_GROUP_SIZE
+        assert stats.null_count == row_group.num_rows or stats.min == stats.max
+
+
+def test_read_plate_cells(platedf: pd.DataFrame, tmp_path: pathlib.Path) -> None:
+    plate_path = tmp_path / "plate.parquet"
+    platedf.to_parquet(plate_path, index=False)
+    pcomp.compact_plate(plate_path, max_row_group_size=MAX_ROW_GROUP_SIZE)
+
+    celldf = pcomp.read_plate_cells(
+        plate_path,
+        columns=pcomp.SORT_COLS,
+        wells=["B02"],
+        sites=[2, 3],
+    ).to_pandas()
+
+    expected = (
+        platedf[
+            (platedf["Metadata_Well"] == "B02")
+            & platedf["Image_Metadata_Site"].isin([2, 3])
+        ][pcomp.SORT_COLS]
+        .sort_values(pcomp.SORT_COLS)
+        .reset_index(drop=True)
+    )
+
+    pd.testing.assert_frame_equal(celldf, expected)
+
+
+def test_compact_plate_without_sort_columns(
+    platedf: pd.DataFrame, tmp_path: pathlib.Path
+) -> None:
+    plate_path = tmp_path / "plate.parquet"
+    platedf.drop(columns="Image_Metadata_Site").to_parquet(plate_path, index=False)
+
+    with pytest.raises(ValueError, match="missing the sort columns"):
+        pcomp.compact_plate(plate_path)
@@ -0,0 +1,127 @@
+import json
+import pathlib
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1] / "utils"))
+import plate_partitions as pp
+
+NUM_CELLS = 1_000
+ROW_GROUP_SIZE = 300
+
+
+@pytest.fixture
+def plate_path(tmp_path: pathlib.Path) -> pathlib.Path:
+    rng = np.random.default_rng(0)
+
+    platedf = pd.DataFrame(
+        {
+            "Metadata_Well": rng.choice(["A01", "B02"], NUM_CELLS),
+            "Metadata_ObjectNumber": np.arange(NUM_CELLS),
+            "Cells_AreaShape_Area": rng.normal(size=NUM_CELLS),
+            "Nuclei_AreaShape_Area": rng.normal(size=NUM_CELLS),
+            "Cytoplasm_AreaShape_Area": rng.normal(size=NUM_CELLS),
+            "Image_Metadata_Site": rng.integers(1, 10, NUM_CELLS),
+            "Cells_Intensity_MeanIntensity_DNA": rng.normal(size=NUM_CELLS),
+        }
+    )
+
+    plate_path = tmp_path / "BR00117006.parquet"
+    platedf.to_parquet(plate_path, index=False, row_group_size=ROW_GROUP_SIZE)
+
+    return plate_path
+
+
+@pytest.mark.parametrize(
+    "column, group",
+    [
+        ("Metadata_Well", "metadata"),
+        ("Nuclei_AreaShape_Area", "Nuclei"),
+        ("Cells_AreaShape_Area", "Cells"),
+        ("Cytoplasm_AreaShape_Area", "Cytoplasm"),
+        ("Image_Metadata_Site", "Image"),
+        ("ObjectNumber", "metadata"),
+    ],
+)
+def test_column_group(column: str, group: str) -> None:
+    assert pp.column_group(column) == group
+
+
+def test_partitioned_plate_round_trip(
+    plate_path: pathlib.Path, tmp_path: pathlib.Path
+) -> None:
+    partitions_dir = tmp_path / "partitions"
+    manifest_path = pp.partition_plate(plate_path, partitions_dir)
+
+    with manifest_path.open() as manifest_file:
+        manifest = json.load(manifest_file)
+
+    plate_table = pq.read_table(plate_path)
+
+    assert manifest_path == partitions_dir / "BR00117006.manifest.json"
+    assert manifest["num_rows"] == NUM_CELLS
+    assert manifest["row_group_num_rows"] == [ROW_GROUP_SIZE] * 3 + [
+        NUM_CELLS - 3 * ROW_GROUP_SIZE
+    ]
+    assert sorted(manifest["partitions"]) == [
+        "Cells",
+        "Cytoplasm",
+        "Image",
+        "Nuclei",
+        "metadata",
+    ]
+    # only the partitions and their manifest are left
+    assert sorted(path.name for path in partitions_dir.iterdir()) == sorted(
+        [manifest_path.name]
+        + [partition["path"] for partition in manifest["partitions"].values()]
+    )
+
+    # all columns are read in the order of the plate
+    assert pp.read_partitioned_plate(manifest_path).equals(
+        plate_table.replace_schema_metadata()
+    )
+
+    # columns are read in the order given, from the row groups of the plate
+    columns = ["Cells_AreaShape_Area", "Metadata_ObjectNumber", "Image_Metadata_Site"]
+    assert pp.read_partitioned_plate(
+        manifest_path, columns=columns, row_groups=[1, 3]
+    ).equals(
+        pa.concat_tables(
+            [
+                plate_table.slice(ROW_GROUP_SIZE, ROW_GROUP_SIZE),
+                plate_table.slice(3 * ROW_GROUP_SIZE),
+            ]
+        )
+        .select(columns)
+        .replace_schema_metadata()
+    )
+
+    with pytest.raises(ValueError, match="doesn't have the columns"):
+        pp.read_partitioned_plate(manifest_path, columns=["Cells_missing"])
+
+
+def test_mismatched_partitions_raise(
+    plate_path: pathlib.Path, tmp_path: pathlib.Path
+) -> None:
+    partitions_dir = tmp_path / "partitions"
+    manifest_path = pp.partition_plate(plate_path, partitions_dir)
+
+    # a partition written by another run of the plate
+    pq.write_table(
+        pq.read_table(partitions_dir / "BR00117006.Cells.parquet").slice(1),
+        partitions_dir / "BR00117006.Cells.parquet",
+    )
+
+    with pytest.raises(ValueError, match="Cells partition"):
+        pp.read_partitioned_plate(manifest_path, columns=["Cells_AreaShape_Area"])
+
+    # partitions which aren't read aren't checked
+    assert (
+        pp.read_partitioned_plate(manifest_path, columns=["Metadata_Well"]).num_rows
+        == NUM_CELLS
+    )
@@ -0,0 +1,119 @@
+import importlib.util
+import pathlib
+import sqlite3
+from types import ModuleType
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("cloudpathlib")
+pytest.importorskip("cytotable")
+pytest.importorskip("parsl")
+
+PLATE_NAME = "BR00117006"
+PLATE_S3_PATH = f"s3://cellpainting-gallery/jump/{PLATE_NAME}.sqlite"
+NUM_CELLS = 50
+
+
+@pytest.fixture
+def process_plates(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> ModuleType:
+    """The plate processing script, with downloads and conversions faked."""
+
+    script_path = (
+        pathlib.Path(__file__).resolve().parents[1]
+        / "1.process_JUMP_plates_with_CytoTable.py"
+    )
+    spec = importlib.util.spec_from_file_location("process_plates", script_path)
+    process_plates = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(process_plates)
+
+    monkeypatch.setattr(process_plates, "PLATES_DIR", tmp_path / "plates")
+    monkeypatch.setattr(process_plates, "SQLITE_CACHE_DIR", tmp_path / "cache")
+
+    process_plates.calls = []
+
+    def download_plate(plate_s3_path: str) -> pathlib.Path:
+        process_plates.calls.append("download")
+
+        sqlite_path = tmp_path / "cache" / "jump" / f"{PLATE_NAME}.sqlite"
+        sqlite_path.parent.mkdir(parents=True, exist_ok=True)
+
+        with sqlite3.connect(sqlite_path) as connection:
+            connection.execute("CREATE TABLE Cytoplasm (ObjectNumber INTEGER)")
+            connection.executemany(
+                "INSERT INTO Cytoplasm VALUES (?)", [(i,) for i in range(NUM_CELLS)]
+            )
+
+        return sqlite_path
+
+    def convert_jump_plate(
+        sqlite_path: pathlib.Path, output_path: pathlib.Path, **kwargs: object
+    ) -> pathlib.Path:
+        process_plates.calls.append("convert")
+
+        if process_plates.conversion_error is not None:
+            raise process_plates.conversion_error
+
+        pd.DataFrame(
+            {"Metadata_ObjectNumber": range(process_plates.num_converted_cells)}
+        ).to_parquet(output_path, index=False)
+
+        return output_path
+
+    process_plates.conversion_error = None
+    process_plates.num_converted_cells = NUM_CELLS
+
+    monkeypatch.setattr(process_plates, "download_plate", download_plate)
+    monkeypatch.setattr(process_plates, "convert_jump_plate", convert_jump_plate)
+
+    return process_plates
+
+
+def process_plate(process_plates: ModuleType) -> dict:
+    return process_plates.process_plate(
+        PLATE_NAME, PLATE_S3_PATH, threads_per_plate=1, chunk_size=1_000
+    )
+
+
+def test_interrupted_plate_resumes_from_its_state(
+    process_plates: ModuleType,
+) -> None:
+    process_plates.conversion_error = MemoryError("Interrupted")
+
+    state = process_plate(process_plates)
+
+    assert state["status"] == "downloaded"
+    assert "Interrupted" in state["error"]
+    assert process_plates.read_plate_state(PLATE_NAME) == state
+
+    # the downloaded sqlite file is converted, without downloading it again
+    process_plates.conversion_error = None
+    state = process_plate(process_plates)
+
+    assert state["status"] == "verified"
+    assert state["num_rows"] == NUM_CELLS
+    assert state["error"] is None
+    assert not pathlib.Path(state["sqlite_path"]).exists()
+    assert process_plates.calls == ["download", "convert", "convert"]
+
+    # verified plates aren't processed again
+    assert process_plate(process_plates)["status"] == "verified"
+    assert process_plates.calls == ["download", "convert", "convert"]
+
+
+def test_incomplete_conversion_is_converted_again(
+    process_plates: ModuleType,
+) -> None:
+    process_plates.num_converted_cells = NUM_CELLS - 1
+
+    state = process_plate(process_plates)
+
+    assert state["status"] == "downloaded"
+    assert "cytoplasm objects" in state["error"]
+
+    process_plates.num_converted_cells = NUM_CELLS
+
+    assert process_plate(process_plates)["status"] == "verified"
+    assert process_plates.calls == ["download", "convert", "convert"]
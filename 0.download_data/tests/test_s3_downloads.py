@@ -0,0 +1,138 @@
+import pathlib
+import sys
+from collections import Counter
+from typing import Optional
+
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1] / "utils"))
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+from s3_downloads import download_s3_objects  # noqa: E402
+
+BUCKET = "jump-test-bucket"
+OBJECTS = {
+    f"images/r01c01f0{site}p01-ch1.tiff": bytes([site]) * 1024 for site in range(3)
+}
+
+
+class CountingS3Client:
+    """
+    S3 client which counts the downloads of each key, where the first
+    downloads of the keys in `key_failures` fail with a connection error.
+    """
+
+    def __init__(
+        self: "CountingS3Client",
+        s3_client: object,
+        key_failures: Optional[dict[str, int]] = None,
+    ) -> None:
+        self.s3_client = s3_client
+        self.key_failures = key_failures or {}
+        self.key_calls = Counter()
+
+    def download_file(
+        self: "CountingS3Client",
+        bucket: str,
+        key: str,
+        filename: str,
+        **kwargs: object,
+    ) -> None:
+        self.key_calls[key] += 1
+
+        if self.key_calls[key] <= self.key_failures.get(key, 0):
+            # a partial file is left behind, like an interrupted download
+            pathlib.Path(filename).write_bytes(b"partial")
+            raise ConnectionError(f"Injected failure of {key}")
+
+        self.s3_client.download_file(bucket, key, filename, **kwargs)
+
+
+@pytest.fixture
+def s3_client(monkeypatch: pytest.MonkeyPatch) -> object:
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+
+    with moto.mock_aws():
+        s3_client = boto3.client("s3", region_name="us-east-1")
+        s3_client.create_bucket(Bucket=BUCKET)
+
+        for key, body in OBJECTS.items():
+            s3_client.put_object(Bucket=BUCKET, Key=key, Body=body)
+
+        yield s3_client
+
+
+def object_downloads(local_dir: pathlib.Path) -> list[tuple[str, pathlib.Path]]:
+    return [
+        (f"s3://{BUCKET}/{key}", local_dir / pathlib.Path(key).name) for key in OBJECTS
+    ]
+
+
+def test_download_s3_objects(s3_client: object, tmp_path: pathlib.Path) -> None:
+    counting_client = CountingS3Client(s3_client)
+    downloads = object_downloads(tmp_path)
+
+    # repeated local paths are downloaded once
+    report = download_s3_objects(
+        downloads + downloads[:1], max_workers=2, s3_client=counting_client
+    )
+
+    assert report["num_objects"] == len(OBJECTS)
+    assert report["num_downloaded"] == len(OBJECTS)
+    assert report["num_bytes"] == sum(len(body) for body in OBJECTS.values())
+    assert set(counting_client.key_calls.values()) == {1}
+
+    for key, body in OBJECTS.items():
+        assert (tmp_path / pathlib.Path(key).name).read_bytes() == body
+
+    # downloaded objects are skipped by a rerun
+    rerun_report = download_s3_objects(downloads, s3_client=counting_client)
+
+    assert rerun_report["num_skipped"] == len(OBJECTS)
+    assert rerun_report["num_downloaded"] == 0
+    assert set(counting_client.key_calls.values()) == {1}
+
+
+def test_download_s3_objects_retries(s3_client: object, tmp_path: pathlib.Path) -> None:
+    flaky_client = CountingS3Client(s3_client, dict.fromkeys(OBJECTS, 2))
+
+    report = download_s3_objects(
+        object_downloads(tmp_path), max_attempts=3, backoff_s=0, s3_client=flaky_client
+    )
+
+    assert report["num_downloaded"] == len(OBJECTS)
+    assert set(flaky_client.key_calls.values()) == {3}
+    assert not list(tmp_path.glob("*.part"))
+
+    for key, body in OBJECTS.items():
+        assert (tmp_path / pathlib.Path(key).name).read_bytes() == body
+
+
+def test_download_s3_objects_failures(
+    s3_client: object, tmp_path: pathlib.Path
+) -> None:
+    flaky_key = next(iter(OBJECTS))
+    missing_key = "images/missing.tiff"
+    max_attempts = 2
+    flaky_client = CountingS3Client(s3_client, {flaky_key: max_attempts})
+
+    with pytest.raises(RuntimeError, match="Failed downloading 2 objects"):
+        download_s3_objects(
+            [
+                (f"s3://{BUCKET}/{flaky_key}", tmp_path / "flaky.tiff"),
+                (f"s3://{BUCKET}/{missing_key}", tmp_path / "missing.tiff"),
+            ],
+            max_attempts=max_attempts,
+            backoff_s=0,
+            s3_client=flaky_client,
+        )
+
+    # missing objects aren't retried, while other errors are retried until the
+    # attempts run out
+    assert flaky_client.key_calls[missing_key] == 1
+    assert flaky_client.key_calls[flaky_key] == max_attempts
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,179 @@
+"""
+Conversion of JUMP SQLite plates to joined compartment data with CytoTable,
+shared by the plate processing and the chunk size benchmark.
+"""
+
+import json
+import os
+import pathlib
+from typing import Union
+
+import cytotable
+import numpy as np
+import pandas as pd
+from parsl.config import Config
+from parsl.executors import HighThroughputExecutor, ThreadPoolExecutor
+from parsl.providers import LocalProvider
+
+# custom join statement to include all image data for use during analysis
+JUMP_JOINS = """
+    SELECT
+    image.*,
+    cytoplasm.* EXCLUDE (Metadata_ImageNumber),
+    cells.* EXCLUDE (Metadata_ImageNumber),
+    nuclei.* EXCLUDE (Metadata_ImageNumber)
+FROM
+    read_parquet('cytoplasm.parquet') AS cytoplasm
+LEFT JOIN read_parquet('cells.parquet') AS cells ON
+    cells.Metadata_ImageNumber = cytoplasm.Metadata_ImageNumber
+    AND cells.Metadata_ObjectNumber = cytoplasm.Cytoplasm_Parent_Cells
+LEFT JOIN read_parquet('nuclei.parquet') AS nuclei ON
+    nuclei.Metadata_ImageNumber = cytoplasm.Metadata_ImageNumber
+    AND nuclei.Metadata_ObjectNumber = cytoplasm.Cytoplasm_Parent_Nuclei
+LEFT JOIN read_parquet('image.parquet') AS image ON
+    image.Metadata_ImageNumber = cytoplasm.Metadata_ImageNumber
+"""
+
+# parsl executors CytoTable can run with: threads of the converting process,
+# or worker processes of a local high throughput executor
+EXECUTOR_TYPES = ("thread", "htex")
+
+# chunk sizes selected automatically are rounded down to this step and kept
+# within these bounds
+CHUNK_SIZE_STEP = 1_000
+MIN_CHUNK_SIZE = 1_000
+MAX_CHUNK_SIZE = 200_000
+
+
+def jump_parsl_config(executor_type: str = "thread", num_workers: int = 2) -> Config:
+    """Parsl configuration with `num_workers` threads or worker processes."""
+
+    if executor_type == "thread":
+        executor = ThreadPoolExecutor(
+            label="tpe_for_jump_processing", max_threads=num_workers
+        )
+
+    elif executor_type == "htex":
+        executor = HighThroughputExecutor(
+            label="htex_for_jump_processing",
+            max_workers=num_workers,
+            provider=LocalProvider(init_blocks=1, max_blocks=1),
+        )
+
+    else:
+        raise ValueError(f"Unknown executor type: {executor_type}")
+
+    return Config(executors=[executor])
+
+
+def convert_jump_plate(
+    sqlite_path: Union[str, pathlib.Path],
+    output_path: Union[str, pathlib.Path],
+    chunk_size: int = 8000,
+    executor_type: str = "thread",
+    num_workers: int = 2,
+) -> pathlib.Path:
+    """
+    Convert the sqlite file of a plate to joined compartment data.
+    The output is written to a temporary file first, so a partial output is
+    never mistaken for a converted plate.
+    """
+
+    output_path = pathlib.Path(output_path)
+    tmp_output_path = output_path.with_name(f".{output_path.stem}.tmp.parquet")
+    tmp_output_path.unlink(missing_ok=True)
+
+    # process plate using CytoTable
+    cytotable.convert(
+        source_path=str(sqlite_path),
+        dest_path=str(tmp_output_path),
+        dest_datatype="parquet",
+        source_datatype="sqlite",
+        chunk_size=chunk_size,
+        preset="cellprofiler_sqlite_cpg0016_jump",
+        parsl_config=jump_parsl_config(executor_type, num_workers),
+        sort_output=False,
+        joins=JUMP_JOINS,
+    )
+
+    os.replace(tmp_output_path, output_path)
+
+    return output_path
+
+
+def fit_chunk_size_model(benchmarkdf: pd.DataFrame) -> dict:
+    """
+    Fit the peak memory of conversions as a baseline plus a cost per row held
+    in memory (chunk size times the number of workers converting chunks at once).
+
+    Parameters
+    ----------
+    benchmarkdf : pd.DataFrame
+        Benchmark runs (chunk_size, num_workers, peak_rss_gb) of one machine
+        and executor type.
+
+    Returns
+    -------
+    dict
+        Model with the baseline memory (base_gb) and the rows per GB of memory
+        (rows_per_gb).
+    """
+
+    rows_in_memory = (benchmarkdf["chunk_size"] * benchmarkdf["num_workers"]).to_numpy()
+
+    if len(np.unique(rows_in_memory)) < 2:
+        raise ValueError("At least two different chunk sizes are needed")
+
+    gb_per_row, base_gb = np.polyfit(
+        rows_in_memory.astype(float), benchmarkdf["peak_rss_gb"].to_numpy(), deg=1
+    )
+
+    if gb_per_row <= 0:
+        raise ValueError("Peak memory doesn't increase with the chunk size")
+
+    return {"base_gb": float(max(base_gb, 0.0)), "rows_per_gb": float(1 / gb_per_row)}
+
+
+def write_chunk_size_model(model: dict, model_path: Union[str, pathlib.Path]) -> None:
+    """Write a chunk size model, replacing any previous model atomically."""
+
+    model_path = pathlib.Path(model_path)
+    model_path.parent.mkdir(parents=True, exist_ok=True)
+
+    tmp_model_path = model_path.with_name(f".{model_path.name}.tmp")
+    with tmp_model_path.open("w") as model_file:
+        json.dump(model, model_file, indent=2)
+    os.replace(tmp_model_path, model_path)
+
+
+def select_chunk_size(
+    model_path: Union[str, pathlib.Path], memory_gb: float, num_workers: int
+) -> int:
+    """
+    Largest chunk size whose conversion is expected to fit in `memory_gb`, with
+    `num_workers` workers converting chunks at once.
+
+    Parameters
+    ----------
+    model_path : str | pathlib.Path
+        Chunk size model measured on this machine (see
+        benchmark_cytotable_chunk_size.py).
+    memory_gb : float
+        Memory available to the conversion of one plate.
+    num_workers : int
+        Number of workers converting chunks at once.
+
+    Returns
+    -------
+    int
+        Chunk size, rounded down to CHUNK_SIZE_STEP and within
+        [MIN_CHUNK_SIZE, MAX_CHUNK_SIZE].
+    """
+
+    with pathlib.Path(model_path).open() as model_file:
+        model = json.load(model_file)
+
+    chunk_size = (memory_gb - model["base_gb"]) * model["rows_per_gb"] / num_workers
+    chunk_size = int(chunk_size // CHUNK_SIZE_STEP * CHUNK_SIZE_STEP)
+
+    return min(max(chunk_size, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE)
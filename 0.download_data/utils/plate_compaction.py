@@ -0,0 +1,166 @@
+"""
+Compaction of converted plates into Parquet files sorted by well, site and
+object, with bounded row groups whose statistics let well or site scoped reads
+skip the row groups of other wells.
+"""
+
+import os
+import pathlib
+import tempfile
+from typing import Optional, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# columns the cells of compacted plates are sorted by
+SORT_COLS = ["Metadata_Well", "Image_Metadata_Site", "Metadata_ObjectNumber"]
+
+
+def compact_plate(
+    plate_path: Union[str, pathlib.Path],
+    max_row_group_size: int = 5_000,
+    write_page_index: bool = False,
+    batch_size: int = 10_000,
+) -> dict:
+    """
+    Rewrite the Parquet file of a plate sorted by SORT_COLS, where each well
+    starts a new row group of at most `max_row_group_size` rows.
+    The plate is sorted out of memory: cells are first split into a temporary
+    file per well, then each well is sorted and written in order, so only one
+    batch or well is in memory at a time.
+    The plate file is replaced atomically.
+
+    Parameters
+    ----------
+    plate_path : str | pathlib.Path
+        Parquet file of the plate, which is replaced by its compacted data.
+    max_row_group_size : int
+        Maximum number of rows of each row group.
+    write_page_index : bool
+        Whether to write page indexes, which allow skipping pages within the
+        row groups read.
+    batch_size : int
+        Number of rows read at a time when splitting the cells by well.
+
+    Returns
+    -------
+    dict
+        Compaction details (num_rows, num_wells, num_row_groups,
+        max_row_group_size, write_page_index).
+    """
+
+    plate_path = pathlib.Path(plate_path)
+    plate_file = pq.ParquetFile(plate_path)
+    schema = plate_file.schema_arrow
+
+    if missing_cols := [col for col in SORT_COLS if col not in schema.names]:
+        raise ValueError(f"{plate_path} is missing the sort columns {missing_cols}")
+
+    tmp_plate_path = plate_path.with_name(f".{plate_path.stem}.compacted.parquet")
+
+    # the wells are split next to the plate, which may not fit elsewhere
+    with tempfile.TemporaryDirectory(dir=plate_path.parent) as tmp_dir:
+        well_paths = {}
+        well_writers = {}
+
+        try:
+            for batch in plate_file.iter_batches(batch_size=batch_size):
+                batch_table = pa.Table.from_batches([batch], schema=schema)
+
+                # cells without a well are kept, as an empty well name
+                wells = pc.fill_null(batch_table["Metadata_Well"], "")
+                well_order = pc.sort_indices(wells)
+                sorted_table = batch_table.take(well_order)
+                wells = wells.take(well_order).to_numpy(zero_copy_only=False)
+
+                # contiguous cells of each well in the sorted batch
+                batch_wells, well_starts = np.unique(wells, return_index=True)
+                well_stops = [*well_starts[1:], len(wells)]
+
+                for well, start, stop in zip(batch_wells, well_starts, well_stops):
+                    if well not in well_writers:
+                        well_paths[well] = f"{tmp_dir}/{len(well_paths)}.arrow"
+                        well_writers[well] = pa.ipc.new_stream(well_paths[well], schema)
+                    well_writers[well].write_table(
+                        sorted_table.slice(start, stop - start)
+                    )
+
+        finally:
+            for well_writer in well_writers.values():
+                well_writer.close()
+
+        num_rows = 0
+        with pq.ParquetWriter(
+            tmp_plate_path,
+            schema,
+            write_statistics=True,
+            write_page_index=write_page_index,
+        ) as plate_writer:
+            # cells without a well are written last
+            for well in sorted(well_paths, key=lambda well: (well == "", well)):
+                with pa.ipc.open_stream(well_paths[well]) as reader:
+                    well_table = reader.read_all()
+
+                well_table = well_table.sort_by(
+                    [(col, "ascending") for col in SORT_COLS[1:]]
+                )
+                plate_writer.write_table(well_table, row_group_size=max_row_group_size)
+                num_rows += well_table.num_rows
+
+    if num_rows != plate_file.metadata.num_rows:
+        tmp_plate_path.unlink(missing_ok=True)
+        raise ValueError(
+            f"Compacted {num_rows} of the {plate_file.metadata.num_rows} rows "
+            f"of {plate_path}"
+        )
+
+    os.replace(tmp_plate_path, plate_path)
+
+    return {
+        "num_rows": num_rows,
+        "num_wells": len(well_paths),
+        "num_row_groups": pq.ParquetFile(plate_path).metadata.num_row_groups,
+        "max_row_group_size": max_row_group_size,
+        "write_page_index": write_page_index,
+    }
+
+
+def read_plate_cells(
+    plate_path: Union[str, pathlib.Path],
+    columns: Optional[list[str]] = None,
+    wells: Optional[list[str]] = None,
+    sites: Optional[list[int]] = None,
+) -> pa.Table:
+    """
+    Read the cells of a plate in the given wells and sites, where only the row
+    groups whose statistics may include them are read (all row groups of
+    plates which aren't compacted).
+
+    Parameters
+    ----------
+    plate_path : str | pathlib.Path
+        Parquet file of the plate.
+    columns : list[str], optional
+        Columns to read (all columns by default).
+    wells : list[str], optional
+        Wells of the cells (all wells by default).
+    sites : list[int], optional
+        Sites of the cells (all sites by default).
+
+    Returns
+    -------
+    pa.Table
+        Cells of the plate in the wells and sites.
+    """
+
+    filters = []
+
+    if wells is not None:
+        filters.append(("Metadata_Well", "in", list(wells)))
+
+    if sites is not None:
+        filters.append(("Image_Metadata_Site", "in", list(sites)))
+
+    return pq.read_table(plate_path, columns=columns, filters=filters or None)
@@ -0,0 +1,192 @@
+"""
+Vertically partitioned plates, where the columns of a plate are split into one
+Parquet file per column group (metadata, Nuclei, Cells, Cytoplasm and Image)
+sharing the row order and row groups of the plate, so narrow reads only parse
+the footers and read the columns of the groups they need.
+"""
+
+import json
+import os
+import pathlib
+from typing import Optional, Union
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# column groups by the prefix of their columns, where any other columns
+# (e.g. Metadata_*) are in the metadata group
+COLUMN_GROUP_PREFIXES = {
+    "Nuclei": "Nuclei_",
+    "Cells": "Cells_",
+    "Cytoplasm": "Cytoplasm_",
+    "Image": "Image_",
+}
+
+
+def column_group(column: str) -> str:
+    """Column group of a plate column."""
+
+    for group, prefix in COLUMN_GROUP_PREFIXES.items():
+        if column.startswith(prefix):
+            return group
+
+    return "metadata"
+
+
+def partition_plate(
+    plate_path: Union[str, pathlib.Path], partitions_dir: Union[str, pathlib.Path]
+) -> pathlib.Path:
+    """
+    Split the columns of a plate into a Parquet file per column group, with
+    the row groups of the plate, and write a manifest of the partitions.
+    The plate is read one row group at a time, and the manifest is written last,
+    so partitions with a manifest are complete.
+
+    Parameters
+    ----------
+    plate_path : str | pathlib.Path
+        Parquet file of the plate.
+    partitions_dir : str | pathlib.Path
+        Directory of the partitions, where previous partitions are replaced.
+
+    Returns
+    -------
+    pathlib.Path
+        Path of the manifest ({plate}.manifest.json) of the partitions.
+    """
+
+    plate_path = pathlib.Path(plate_path)
+    partitions_dir = pathlib.Path(partitions_dir)
+    partitions_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest_path = partitions_dir / f"{plate_path.stem}.manifest.json"
+    manifest_path.unlink(missing_ok=True)
+
+    plate_file = pq.ParquetFile(plate_path)
+
+    # the pandas metadata of the plate describes all of its columns
+    schema = plate_file.schema_arrow.remove_metadata()
+
+    group_cols = {}
+    for column in schema.names:
+        group_cols.setdefault(column_group(column), []).append(column)
+
+    partitions = {
+        group: {"path": f"{plate_path.stem}.{group}.parquet", "columns": columns}
+        for group, columns in group_cols.items()
+    }
+
+    group_writers = {
+        group: pq.ParquetWriter(
+            partitions_dir / f".{partition['path']}.tmp",
+            pa.schema([schema.field(column) for column in partition["columns"]]),
+            write_statistics=True,
+        )
+        for group, partition in partitions.items()
+    }
+
+    row_group_num_rows = []
+
+    try:
+        for row_group in range(plate_file.num_row_groups):
+            table = plate_file.read_row_group(row_group)
+            row_group_num_rows.append(table.num_rows)
+
+            # one row group per plate row group, so row groups align across groups
+            for group, group_writer in group_writers.items():
+                group_writer.write_table(
+                    table.select(partitions[group]["columns"]),
+                    row_group_size=max(table.num_rows, 1),
+                )
+
+    finally:
+        for group_writer in group_writers.values():
+            group_writer.close()
+
+    for partition in partitions.values():
+        os.replace(
+            partitions_dir / f".{partition['path']}.tmp",
+            partitions_dir / partition["path"],
+        )
+
+    manifest = {
+        "plate": plate_path.stem,
+        "num_rows": plate_file.metadata.num_rows,
+        "row_group_num_rows": row_group_num_rows,
+        "columns": schema.names,
+        "partitions": partitions,
+    }
+
+    tmp_manifest_path = manifest_path.with_name(f".{manifest_path.name}.tmp")
+    with tmp_manifest_path.open("w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(tmp_manifest_path, manifest_path)
+
+    return manifest_path
+
+
+def read_partitioned_plate(
+    manifest_path: Union[str, pathlib.Path],
+    columns: Optional[list[str]] = None,
+    row_groups: Optional[list[int]] = None,
+) -> pa.Table:
+    """
+    Read columns of a partitioned plate, where only the partitions with the
+    columns are opened and their columns are combined without copying.
+
+    Parameters
+    ----------
+    manifest_path : str | pathlib.Path
+        Manifest of the partitions.
+    columns : list[str], optional
+        Columns to read, in the order returned (all columns by default).
+    row_groups : list[int], optional
+        Row groups of the plate to read (all row groups by default).
+
+    Returns
+    -------
+    pa.Table
+        Columns of the plate, in the row order of the plate.
+    """
+
+    manifest_path = pathlib.Path(manifest_path)
+
+    with manifest_path.open() as manifest_file:
+        manifest = json.load(manifest_file)
+
+    if columns is None:
+        columns = manifest["columns"]
+
+    if missing_cols := [col for col in columns if col not in manifest["columns"]]:
+        raise ValueError(f"{manifest['plate']} doesn't have the columns {missing_cols}")
+
+    group_cols = {}
+    for column in columns:
+        group_cols.setdefault(column_group(column), []).append(column)
+
+    group_tables = {}
+
+    for group, group_columns in group_cols.items():
+        partition_file = pq.ParquetFile(
+            manifest_path.parent / manifest["partitions"][group]["path"]
+        )
+
+        # partitions written by another run of the plate don't share its rows
+        if partition_file.metadata.num_rows != manifest["num_rows"]:
+            raise ValueError(
+                f"The {group} partition of {manifest['plate']} has "
+                f"{partition_file.metadata.num_rows} rows instead of "
+                f"{manifest['num_rows']}"
+            )
+
+        if row_groups is None:
+            group_tables[group] = partition_file.read(columns=group_columns)
+        else:
+            group_tables[group] = partition_file.read_row_groups(
+                row_groups, columns=group_columns
+            )
+
+    return pa.Table.from_arrays(
+        [group_tables[column_group(column)].column(column) for column in columns],
+        names=columns,
+    )
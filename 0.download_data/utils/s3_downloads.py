@@ -0,0 +1,190 @@
+"""
+Concurrent downloads of AWS S3 objects with a shared client, where each object
+is retried with exponential backoff and downloaded to a partial file which is
+renamed once complete, so existing files are always complete.
+"""
+
+import os
+import pathlib
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Union
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore import UNSIGNED
+from botocore.client import BaseClient
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+# errors of objects which won't be downloaded by retrying
+PERMANENT_ERROR_CODES = {"403", "404", "AccessDenied", "NoSuchBucket", "NoSuchKey"}
+
+
+def anonymous_s3_client(max_pool_connections: int = 16) -> BaseClient:
+    """
+    S3 client for anonymous (no-sign-request) access, with a connection pool
+    shared by the threads using it.
+    """
+
+    return boto3.client(
+        "s3",
+        config=Config(
+            signature_version=UNSIGNED, max_pool_connections=max_pool_connections
+        ),
+    )
+
+
+def download_s3_object(
+    s3_client: BaseClient,
+    s3_path: str,
+    local_path: Union[str, pathlib.Path],
+    max_attempts: int = 5,
+    backoff_s: float = 1.0,
+) -> int:
+    """
+    Download an S3 object (s3://bucket/key) to `local_path` through a partial
+    file (.part), retrying failed attempts after an exponential backoff.
+
+    Returns
+    -------
+    int
+        Size of the downloaded file in bytes.
+    """
+
+    bucket, key = s3_path.removeprefix("s3://").split("/", 1)
+    local_path = pathlib.Path(local_path)
+    part_path = local_path.with_name(f"{local_path.name}.part")
+
+    for attempt in range(max_attempts):
+        try:
+            # objects are downloaded concurrently, each in a single thread
+            s3_client.download_file(
+                bucket, key, str(part_path), Config=TransferConfig(use_threads=False)
+            )
+            break
+
+        except Exception as error:
+            is_permanent = (
+                isinstance(error, ClientError)
+                and error.response.get("Error", {}).get("Code") in PERMANENT_ERROR_CODES
+            )
+
+            if is_permanent or attempt == max_attempts - 1:
+                part_path.unlink(missing_ok=True)
+                raise
+
+        # jitter keeps the threads from retrying at the same time
+        time.sleep(backoff_s * 2**attempt * random.uniform(0.5, 1.5))
+
+    os.replace(part_path, local_path)
+
+    return local_path.stat().st_size
+
+
+def download_s3_objects(
+    downloads: list[tuple[str, Union[str, pathlib.Path]]],
+    max_workers: int = 16,
+    max_attempts: int = 5,
+    backoff_s: float = 1.0,
+    s3_client: Optional[BaseClient] = None,
+    progress_interval_s: float = 10.0,
+) -> dict:
+    """
+    Download S3 objects concurrently, skipping objects already downloaded.
+
+    Parameters
+    ----------
+    downloads : list[tuple[str, str | pathlib.Path]]
+        S3 path and local path of each object, where repeated local paths are
+        downloaded once.
+    max_workers : int
+        Number of objects downloaded at the same time.
+    max_attempts : int
+        Number of attempts to download each object.
+    backoff_s : float
+        Wait before the second attempt, which doubles for each attempt after.
+    s3_client : optional
+        boto3 S3 client shared by the downloads (an anonymous client with a
+        connection per worker by default).
+    progress_interval_s : float
+        Minimum time between progress reports.
+
+    Returns
+    -------
+    dict
+        Download report (num_objects, num_downloaded, num_skipped, num_failed,
+        num_bytes, elapsed_s, mb_per_s).
+    """
+
+    if s3_client is None:
+        s3_client = anonymous_s3_client(max_pool_connections=max_workers)
+
+    # one download per local path
+    local_s3_paths = {
+        pathlib.Path(local_path): s3_path for s3_path, local_path in downloads
+    }
+
+    # list each directory once, instead of checking each file
+    existing_files = set()
+    for local_dir in {local_path.parent for local_path in local_s3_paths}:
+        local_dir.mkdir(parents=True, exist_ok=True)
+        existing_files.update(local_dir / name for name in os.listdir(local_dir))
+
+    pending_paths = [path for path in local_s3_paths if path not in existing_files]
+
+    num_downloaded = 0
+    num_bytes = 0
+    failed_downloads = {}
+    start = last_report = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        download_futures = {
+            executor.submit(
+                download_s3_object,
+                s3_client,
+                local_s3_paths[local_path],
+                local_path,
+                max_attempts,
+                backoff_s,
+            ): local_path
+            for local_path in pending_paths
+        }
+
+        for download_future in as_completed(download_futures):
+            try:
+                num_bytes += download_future.result()
+                num_downloaded += 1
+
+            except Exception as error:
+                s3_path = local_s3_paths[download_futures[download_future]]
+                failed_downloads[s3_path] = error
+
+            if time.perf_counter() - last_report >= progress_interval_s:
+                last_report = time.perf_counter()
+                print(
+                    f"Downloaded {num_downloaded} of {len(pending_paths)} objects "
+                    f"({num_bytes / 2**20:.1f} MB, "
+                    f"{num_bytes / 2**20 / (last_report - start):.1f} MB/s)"
+                )
+
+    elapsed_s = time.perf_counter() - start
+    report = {
+        "num_objects": len(local_s3_paths),
+        "num_downloaded": num_downloaded,
+        "num_skipped": len(local_s3_paths) - len(pending_paths),
+        "num_failed": len(failed_downloads),
+        "num_bytes": num_bytes,
+        "elapsed_s": elapsed_s,
+        "mb_per_s": num_bytes / 2**20 / elapsed_s if elapsed_s > 0 else 0.0,
+    }
+
+    if failed_downloads:
+        s3_path, error = next(iter(failed_downloads.items()))
+        raise RuntimeError(
+            f"Failed downloading {len(failed_downloads)} objects "
+            f"(e.g. {s3_path}: {error!r}), report: {report}"
+        )
+
+    return report
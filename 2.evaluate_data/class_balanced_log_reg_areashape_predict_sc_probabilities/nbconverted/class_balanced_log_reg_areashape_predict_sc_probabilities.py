@@ -3,6 +3,7 @@
 
 # # Predict Single Cell Probabilities
 # In this part of the analysis, the predicted single cell probabilities are stored in parquet files per plate.
+# The models are loaded once, and the plates are predicted concurrently, where plates with saved probabilities are skipped.
 # Predicted probabilities are generated from a weighted logistic regression trained on AreaShape features from the mitocheck morphology features.
 
 # ### Import Libraries
@@ -10,15 +11,19 @@
 # In[ ]:
 
 
-import gzip
-import io
+import argparse
+import multiprocessing
 import pathlib
 import sys
 
 import pandas as pd
-import requests
 from joblib import load
 
+# Import the artifact cache and plate prediction utils
+sys.path.append("../utils")
+from artifact_cache import fetch_artifact
+from plate_probabilities import predict_plate_probabilities
+
 
 # ## Find the path of the git directory
 
@@ -50,7 +55,8 @@ if root_dir is None:
 
 def load_joblib_from_url(url):
     """
-    Retirieve joblib or gzip csv file from url
+    Retirieve joblib or gzip csv file from url, which is only downloaded if it
+    isn't in the local artifact cache (see artifact_cache.fetch_artifact)
 
     Parameters
     ----------
@@ -62,15 +68,13 @@ def load_joblib_from_url(url):
     obj : any Python object
     """
 
-    response = requests.get(url)
-    file_object = io.BytesIO(response.content)
+    file_path = fetch_artifact(url)
 
     if ".csv" in url:
-        file_object = gzip.GzipFile(fileobj=file_object)
-        obj = pd.read_csv(file_object)
+        obj = pd.read_csv(file_path, compression="gzip")
 
     elif ".joblib" in url:
-        obj = load(file_object)
+        obj = load(file_path)
 
     return obj
 
@@ -78,6 +82,17 @@ def load_joblib_from_url(url):
 # In[ ]:
 
 
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--big_drive_path",
+    type=pathlib.Path,
+    default=root_dir / "big_drive",
+)
+
+# Number of plates to predict concurrently
+parser.add_argument("--num_workers", type=int, default=4)
+args = parser.parse_args()
+
 # The path of the models used in the phenotypic_profiling_model repo
 model_path = "https://github.com/WayScience/phenotypic_profiling_model/raw/main/2.train_model/models/multi_class_models"
 
@@ -85,19 +100,16 @@ model_path = "https://github.com/WayScience/phenotypic_profiling_model/raw/main/
 data_path = "https://github.com/WayScience/phenotypic_profiling_model/raw/main/0.download_data/data/labeled_data__ic.csv.gz"
 
 # Path to the drive
-drive_path = f"{root_dir}/big_drive"
+drive_path = args.big_drive_path
 
 # The predicted probabilities of the models on each cell from each plate
 output_proba_path = f"{drive_path}/class_balanced_log_reg_probability_sc_data"
 
-# The path of the normalized sc data
-norm_plate_path = sys.argv[1]
+# The path of the normalized sc data (with multiple plates)
+norm_data_path = pathlib.Path(f"{drive_path}/normalized_sc_data")
 
-# The path of the unnormalized sc data
-unnorm_plate_path = sys.argv[2]
-
-# Name of the plate
-plate_name = sys.argv[3]
+# The path of the unnormalized sc data (with multiple plates)
+unnorm_data_path = pathlib.Path(f"{drive_path}/merged_sc_data")
 
 # The path of the model's predicted probabilities
 pathlib.Path(f"{output_proba_path}").mkdir(parents=True, exist_ok=True)
@@ -128,7 +140,6 @@ data = load_joblib_from_url(data_path)
 # Extract CP features from all columns depending on desired dataset
 feature_cols = [col for col in data.columns if ("CP__" in col) and ("AreaShape" in col)]
 feature_cols = [string.replace("CP_", "Nuclei") if "CP" in string else string for string in feature_cols]
-idx_feature_cols = pd.Index(feature_cols)
 
 # Metadata columns
 meta_cols = ["Metadata_Well", "Metadata_Plate", "Metadata_ObjectNumber_cytoplasm", "Metadata_Site"]
@@ -136,65 +147,64 @@ meta_cols = ["Metadata_Well", "Metadata_Plate", "Metadata_ObjectNumber_cytoplasm
 # Location columns to keep in the final output
 loc_cols = ["Nuclei_Location_Center_Y", "Nuclei_Location_Center_X"]
 
-# Load the unnormalized plate data
-df_unnorm = pd.read_parquet(unnorm_plate_path)
-
-# Only retain metadata columns
-df_unnorm = df_unnorm[meta_cols]
-
 
 # ## Save plate predicted probabilities
 
 # In[ ]:
 
 
-# Load the dataframe for the plate
-df = pd.read_parquet(norm_plate_path)
+# Each worker process predicts one plate at a time
+pool = multiprocessing.Pool(processes=args.num_workers)
 
-# Find columns that were in the original dataset used for inferencing, but not in the new dataset
-new_df_cols = idx_feature_cols.difference(df.columns).tolist()
+plate_results = {}
+failed_plates = []
 
-# Set the feature columns present in the new plate data to zero
-df[new_df_cols] = 0
+# Iterate through all Parquet files in the normalized data path
+for norm_plate_path in sorted(norm_data_path.glob("*.parquet")):
 
-# Store the models
-modeldfs = []
+    # Get the plate name from the filename
+    plate_name = norm_plate_path.name.split("_")[0]
 
-for model_type, model in models.items():
-    # Output dataframe (to be stored as an intermediate parquet file)
-    modeldf = pd.DataFrame(
-        model.predict_proba(df[feature_cols].values),
-        columns=model.classes_
+    plate_output_path = pathlib.Path(
+        f"{output_proba_path}/{plate_name}_class_balanced_log_reg_areashape_model_probabilities.parquet"
     )
 
-    # Store the type of model
-    modeldf["Metadata_model_type"] = model_type
-
-    # Store the cytoplasm object number
-    modeldf["Metadata_ObjectNumber_cytoplasm"] = df["Metadata_ObjectNumber_cytoplasm"]
-
-    # Store the name of the plate
-    modeldf["Metadata_Plate"] = df["Metadata_Plate"]
-
-    # Store the name of the well
-    modeldf["Metadata_Well"] = df["Metadata_Well"]
-
-    # Store the name of the site
-    modeldf["Metadata_Site"] = df["Metadata_Site"]
-
-    # Add the nuclei locations (x,y)
-    modeldf = modeldf.merge(df_unnorm, how="inner", on=meta_cols)
-
-    modeldfs.append(modeldf)
-
-
-# ## Save model probabilities
-
-# In[ ]:
+    # Plates with saved probabilities were already predicted
+    if plate_output_path.exists():
+        continue
+
+    # Get the path of the corresponding unnormalized plate
+    unnorm_plate_paths = list(unnorm_data_path.glob(f"*{plate_name}*"))
+
+    if not unnorm_plate_paths:
+        failed_plates.append(plate_name)
+        print(f"No unnormalized data found for {plate_name}")
+        continue
+
+    plate_results[plate_name] = pool.apply_async(
+        predict_plate_probabilities,
+        kwds={
+            "norm_plate_path": norm_plate_path,
+            "unnorm_plate_path": unnorm_plate_paths[0],
+            "models": models,
+            "feature_cols": feature_cols,
+            "meta_cols": meta_cols,
+            "loc_cols": loc_cols,
+            "output_path": plate_output_path,
+        },
+    )
 
+# A failed plate doesn't stop the remaining plates
+for plate_name, plate_result in plate_results.items():
+    try:
+        plate_result.get()
 
-modeldfs = pd.concat(modeldfs)
+    except Exception as plate_error:
+        failed_plates.append(plate_name)
+        print(f"Failed to predict probabilities for {plate_name}: {plate_error}")
 
-# Save predictions in temporary location to free memory
-modeldfs.to_parquet(f"{output_proba_path}/{plate_name}_class_balanced_log_reg_areashape_model_probabilities.parquet", index=True)
+pool.close()
+pool.join()
 
+if failed_plates:
+    raise RuntimeError(f"Failed to predict probabilities for plates {failed_plates}")
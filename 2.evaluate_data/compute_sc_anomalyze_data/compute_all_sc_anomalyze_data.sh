@@ -16,6 +16,12 @@ iso_forest_paths="${git_root}/2.evaluate_data/train_sc_anomalyze_models/isolatio
 big_drive_path="${1:-${git_root}/big_drive}"
 anomaly_data_path="${2:-${big_drive_path}/sc_anomaly_data}"
 
+# "batched" (one directory per plate file) or "partitioned" (hive-partitioned by plate and well)
+anomaly_data_layout="${3:-batched}"
+
+# "fixed" (default) or "incremental" (trees are added until anomaly scores are stable)
+training_mode="${4:-fixed}"
+
 
 # Get the single-cell data path (with multiple plates)
 plate_paths=(
@@ -36,7 +42,7 @@ for plate_dir in "${plate_paths[@]}"; do
 
                 iso_forest_path="$iso_forest_paths/$(basename "$plate_dir")_isolation_forest.joblib"
 
-                /usr/bin/time -v python3 "$py_path/compute_sc_anomaly_data.py" "$file" "$iso_forest_path" "$anomaly_data_path"
+                /usr/bin/time -v python3 "$py_path/compute_sc_anomaly_data.py" "$file" "$iso_forest_path" "$anomaly_data_path" "$anomaly_data_layout"
 
             fi
 
@@ -50,4 +56,4 @@ for plate_dir in "${plate_paths[@]}"; do
 done
 
 /usr/bin/time -v python3 "$py_path/compute_sc_feature_importance_data.py" --big_drive_path "$big_drive_path"
-/usr/bin/time -v python3 "$py_path/compute_aggregate_treatment_anomaly_data.py" --big_drive_path "$big_drive_path"
+/usr/bin/time -v python3 "$py_path/compute_aggregate_treatment_anomaly_data.py" --big_drive_path "$big_drive_path" --training_mode "$training_mode"
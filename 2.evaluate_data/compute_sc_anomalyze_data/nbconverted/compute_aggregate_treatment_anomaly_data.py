@@ -35,6 +35,7 @@ if root_dir is None:
     raise FileNotFoundError("No Git root directory found.")
 
 sys.path.append(str((root_dir / "2.evaluate_data" / "utils").resolve(strict=True)))
+from incremental_isolation_forest import fit_isolation_forest_incrementally
 from isolation_forest_data_feature_importance import IsoforestFeatureImportance
 
 
@@ -49,6 +50,15 @@ parser.add_argument(
     type=pathlib.Path,
     default=root_dir / "big_drive",
 )
+parser.add_argument(
+    "--training_mode",
+    choices=["fixed", "incremental"],
+    default="fixed",
+    help=(
+        "fixed trains every tree, and incremental stops adding trees once the "
+        "anomaly score ranking is stable"
+    ),
+)
 args = parser.parse_args()
 
 big_drive_path = args.big_drive_path.resolve(strict=True)
@@ -133,10 +143,28 @@ agg_platedf = agg_platedf.rename(columns={"Perturbation": "Metadata_Perturbation
 # In[ ]:
 
 
-isofor = IsolationForest(n_estimators=1_000, random_state=0, n_jobs=-1)
+if args.training_mode == "incremental":
+    # Every treatment profile is scored to measure the stability of the ranking
+    isofor, tree_benchmarkdf = fit_isolation_forest_incrementally(
+        agg_platedf[feat_cols],
+        max_estimators=1_000,
+        holdoutdf=agg_platedf[feat_cols],
+        random_state=0,
+        n_jobs=-1,
+    )
+    tree_benchmarkdf.to_csv(
+        agg_treatment_anomaly_data_path
+        / "aggregated_isolation_forest_tree_benchmark.csv",
+        index=False,
+    )
+
+else:
+    isofor = IsolationForest(n_estimators=1_000, random_state=0, n_jobs=-1)
+    isofor.fit(agg_platedf[feat_cols])
+
 agg_platedf = agg_platedf.assign(
     **{
-        "Result_inlier": isofor.fit_predict(agg_platedf[feat_cols]),
+        "Result_inlier": isofor.predict(agg_platedf[feat_cols]),
         "Result_anomaly_score": isofor.decision_function(agg_platedf[feat_cols]),
     }
 )
@@ -148,28 +176,24 @@ agg_platedf = agg_platedf.assign(
 # In[ ]:
 
 
-metadf = agg_platedf.copy().filter(regex="Metadata|Result")
+feat_cols = list(isofor.feature_names_in_)
+meta_cols = agg_platedf.filter(regex="Metadata|Result").columns
 
-result = IsoforestFeatureImportance(
+feature_importances = IsoforestFeatureImportance(
     estimators=isofor.estimators_,
-    morphology_data=agg_platedf[list(isofor.feature_names_in_)],
-)()
-
-
-# ## Combine Anomaly Results and Metadata
-
-# In[ ]:
-
-
-meta_resultdf = metadf[metadf.columns.difference(result.columns)]
-result = result.join(meta_resultdf, how="inner")
+    morphology_data=agg_platedf,
+    feature_names=feat_cols,
+)
 
 
 # ## Save Aggregate Anomaly Data
+# Feature importances are combined with the anomaly results and metadata, and are
+# written in chunks of treatments to bound memory.
 
 # In[ ]:
 
 
-result.to_parquet(
-    agg_treatment_anomaly_data_path / "aggregated_treatment_anomaly_data.parquet"
+feature_importances.write_isoforest_importances(
+    agg_treatment_anomaly_data_path / "aggregated_treatment_anomaly_data.parquet",
+    metadata_columns=meta_cols.difference(feat_cols).tolist(),
 )
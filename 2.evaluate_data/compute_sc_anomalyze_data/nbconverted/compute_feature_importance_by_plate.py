@@ -2,7 +2,8 @@
 # coding: utf-8
 
 # # Compute Plate Feature Importances
-# Created to prevent memory leakage while computing feature importances by calling this script from a bash script
+# Computes feature importances for a single plate from the command line.
+# compute_sc_feature_importance_data computes every plate in a process pool with the same function.
 
 # In[ ]:
 
@@ -11,9 +12,6 @@ import argparse
 import pathlib
 import sys
 
-import joblib
-import pandas as pd
-
 # Get the current working directory
 cwd = pathlib.Path.cwd()
 
@@ -32,7 +30,8 @@ if root_dir is None:
     raise FileNotFoundError("No Git root directory found.")
 
 sys.path.append(str((root_dir / "2.evaluate_data" / "utils").resolve(strict=True)))
-from isolation_forest_data_feature_importance import IsoforestFeatureImportance
+from compiled_isolation_forest import CompiledIsolationForest
+from plate_feature_importance import compute_dataset_plate_feature_importances
 
 
 # # Inputs and Outputs
@@ -46,7 +45,13 @@ parser.add_argument("--plate", type=str, required=True)
 parser.add_argument("--morphology_dataset_path", type=str, required=True)
 parser.add_argument("--model_path", type=str, required=True)
 parser.add_argument("--feature_importances_output_path", type=str, required=True)
-parser.add_argument("--plate_mapping_path", type=str, required=True)
+
+# Number of samples to compute feature importances for in each category (anomalous or inlier)
+# Use 0 to compute feature importances for every cell of the plate in each category
+parser.add_argument("--num_samples_per_category", type=int, default=300)
+
+# Number of cells to compute feature importances for at a time
+parser.add_argument("--chunk_size", type=int, default=10_000)
 
 args = parser.parse_args()
 
@@ -54,8 +59,8 @@ anomaly_dataset = pathlib.Path(args.anomaly_dataset_path)
 morphology_dataset = pathlib.Path(args.morphology_dataset_path)
 model_path = pathlib.Path(args.model_path)
 feature_importances_output_path = pathlib.Path(args.feature_importances_output_path)
-plate_mapping_path = pathlib.Path(args.plate_mapping_path)
-anomalyze_model = joblib.load(model_path)
+# The compiled model is memory-mapped in milliseconds instead of unpickling every tree
+anomalyze_model = CompiledIsolationForest.load_or_compile(model_path)
 
 
 # # Compute Feature Importances
@@ -63,72 +68,13 @@ anomalyze_model = joblib.load(model_path)
 # In[ ]:
 
 
-# Number of samples to compute feature importances for in each category (anomalous or inlier)
-num_control_samples = 300
-num_anomalous_samples = 300
-
-merge_cols = [
-    "Metadata_Plate",
-    "Metadata_Well",
-    "Metadata_Site",
-    "Metadata_ObjectNumber",
-]
-
-plate_mappingdf = pd.read_csv(plate_mapping_path, sep="\t")[
-    ["Assay_Plate_Barcode", "Perturbation"]
-].rename(
-    columns={
-        "Assay_Plate_Barcode": "Metadata_Plate",
-        "Perturbation": "Metadata_treatment_type",
-    }
-)
-
-anomdf = pd.concat(
-    [pd.read_parquet(path) for path in anomaly_dataset.rglob("*.parquet")],
-    ignore_index=True,
+# Only the plate's sampled cells are read from the anomaly dataset
+compute_dataset_plate_feature_importances(
+    anomaly_dataset_path=anomaly_dataset,
+    plate=args.plate,
+    morphology_plate_path=list(morphology_dataset.rglob(f"*{args.plate}*.parquet"))[0],
+    anomalyze_model=anomalyze_model,
+    output_path=feature_importances_output_path / f"{args.plate}.parquet",
+    num_samples=args.num_samples_per_category,
+    chunk_size=args.chunk_size,
 )
-
-feature_importancesdf = []
-
-
-anomdf = anomdf.loc[anomdf["Metadata_Plate"] == args.plate]
-
-for control_type in ["negcon", "anomalous"]:
-
-    # Negative controls shouldn't be anomalous and vice versa
-    if control_type == "negcon":
-        morphologydf = anomdf.loc[
-            (anomdf["Metadata_control_type"] == "negcon")
-            & (anomdf["Metadata_Plate"] == args.plate)
-        ].nlargest(num_control_samples, "Result_anomaly_score")
-
-    else:
-        morphologydf = anomdf.loc[
-            (anomdf["Metadata_control_type"] != "negcon")
-            & (anomdf["Metadata_Plate"] == args.plate)
-        ].nsmallest(num_anomalous_samples, "Result_anomaly_score")
-
-    platedf = pd.read_parquet(
-        list(morphology_dataset.rglob(f"*{args.plate}*.parquet"))[0]
-    )
-
-    platedf = platedf[merge_cols + anomalyze_model.feature_names_in_.tolist()]
-
-    morphologyonlydf = pd.merge(platedf, morphologydf, on=merge_cols, how="inner")
-    meta_resultdf = morphologyonlydf.copy().filter(regex="Metadata|Result")
-    morphologyonlydf = morphologyonlydf[anomalyze_model.feature_names_in_.tolist()]
-
-    result = IsoforestFeatureImportance(
-        estimators=anomalyze_model.estimators_,
-        morphology_data=morphologyonlydf,
-    )()
-
-    meta_resultdf = meta_resultdf[meta_resultdf.columns.difference(result.columns)]
-    result = result.join(meta_resultdf, how="inner")
-
-    feature_importancesdf.append(result)
-
-if feature_importancesdf:
-    pd.concat(feature_importancesdf, axis=0, ignore_index=True).to_parquet(
-        feature_importances_output_path / f"{args.plate}.parquet"
-    )
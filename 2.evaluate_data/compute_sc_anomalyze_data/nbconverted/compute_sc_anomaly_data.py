@@ -10,11 +10,35 @@
 import pathlib
 import sys
 
-import joblib
 import pandas as pd
-import pyarrow as pa
 import pyarrow.parquet as pq
-from sklearn.ensemble import IsolationForest
+
+# Get the current working directory
+cwd = pathlib.Path.cwd()
+
+if (cwd / ".git").is_dir():
+    root_dir = cwd
+
+else:
+    root_dir = None
+    for parent in cwd.parents:
+        if (parent / ".git").is_dir():
+            root_dir = parent
+            break
+
+# Check if a Git root directory was found
+if root_dir is None:
+    raise FileNotFoundError("No Git root directory found.")
+
+sys.path.append(str((root_dir / "2.evaluate_data" / "utils").resolve(strict=True)))
+from anomaly_dataset import (
+    remove_partitioned_anomalies,
+    write_partitioned_anomalies,
+    write_plate_metadata,
+)
+from anomaly_index import AnomalyIndexBuilder
+from anomaly_scoring import score_parquet_anomalies
+from compiled_isolation_forest import CompiledIsolationForest
 
 
 # ## Define inputs and outputs
@@ -26,12 +50,31 @@ sc_data_path = pathlib.Path(sys.argv[1]).resolve(strict=True)
 sc_data_dir_name = sc_data_path.parent.name
 pq_file = pq.ParquetFile(sc_data_path)
 
-iso_forest = joblib.load(pathlib.Path(sys.argv[2]).resolve(strict=True))
-iso_forest.n_jobs = -1
+# The forest is compiled next to the model once, and memory-mapped by every
+# run after, like in the feature importance scripts
+iso_forest = CompiledIsolationForest.load_or_compile(
+    pathlib.Path(sys.argv[2]).resolve(strict=True)
+)
+
+# "batched": one directory of anomaly batch files per plate file
+# "partitioned": one hive-partitioned dataset (Metadata_Plate=.../Metadata_Well=...)
+anomaly_data_layout = sys.argv[4] if len(sys.argv) > 4 else "batched"
+
+if anomaly_data_layout not in ("batched", "partitioned"):
+    raise ValueError(f"Unknown anomaly data layout: {anomaly_data_layout}")
+
+if anomaly_data_layout == "partitioned":
+    anomaly_data_path = pathlib.Path(sys.argv[3]) / sc_data_dir_name
+
+else:
+    anomaly_data_path = pathlib.Path(sys.argv[3]) / sc_data_dir_name / sc_data_path.stem
 
-anomaly_data_path = pathlib.Path(sys.argv[3]) / sc_data_dir_name / sc_data_path.stem
 anomaly_data_path.mkdir(parents=True, exist_ok=True)
 
+# Per-plate score histograms and most anomalous cells, for global top-k and
+# percentile queries across plates
+anomaly_index_path = pathlib.Path(sys.argv[3]) / "anomaly_index" / sc_data_dir_name
+
 
 # In[ ]:
 
@@ -47,15 +90,55 @@ feat_cols = iso_forest.feature_names_in_
 # Isolation forest reference:
 # https://ieeexplore.ieee.org/document/4781136
 # The data is batched here to reduce the memory burden
-for i, batch in enumerate(pq_file.iter_batches(batch_size=220_000)):
-    pdf = batch.to_pandas()
-    pdf = pdf.assign(Result_inlier=iso_forest.predict(pdf[feat_cols]))
-    pdf = pdf.assign(Result_anomaly_score=iso_forest.decision_function(pdf[feat_cols]))
-    keep_cols = [col for col in pdf.columns if "Metadata" in col or "Result" in col]
-    pdf = pdf[keep_cols]
+# Batches are read ahead and written in background threads while the forest
+# scores the current batch, and the trees are traversed once per batch
+anomaly_plates = set()
+anomaly_index = AnomalyIndexBuilder()
+
+# Files of previous runs of this plate file are replaced
+if anomaly_data_layout == "partitioned":
+    remove_partitioned_anomalies(anomaly_data_path, basename=sc_data_path.stem)
+
+
+def write_anomaly_batch(i: int, pdf: pd.DataFrame) -> None:
+    anomaly_index.update(pdf)
+
+    # Each batch is written to the partitions of its wells once it's scored,
+    # where the wells of each batch file are sorted by anomaly score
+    if anomaly_data_layout == "partitioned":
+        write_partitioned_anomalies(
+            pdf,
+            anomaly_data_path,
+            basename=f"{sc_data_path.stem}-{i}",
+            write_metadata=False,
+        )
+        anomaly_plates.update(pdf["Metadata_Plate"].unique())
+        return
 
     pdf.sort_values(by="Result_anomaly_score", ascending=True, inplace=True)
 
     output_path = anomaly_data_path / f"{sc_data_path.stem}_anomaly_batch_{i}.parquet"
     pdf.to_parquet(output_path)
 
+
+score_parquet_anomalies(
+    pq_file,
+    iso_forest,
+    write_batch=write_anomaly_batch,
+    batch_size=220_000,
+)
+
+
+# In[ ]:
+
+
+# The summary of each plate collects the files of all batches, so score range
+# filters can skip row groups without opening every file
+for plate in anomaly_plates:
+    write_plate_metadata(anomaly_data_path / f"Metadata_Plate={plate}")
+
+
+# In[ ]:
+
+
+anomaly_index.write(anomaly_index_path)
@@ -8,10 +8,11 @@
 
 
 import argparse
+import multiprocessing
+import os
 import pathlib
-import subprocess
+import sys
 
-import joblib
 import pandas as pd
 
 
@@ -37,21 +38,32 @@ else:
 if root_dir is None:
     raise FileNotFoundError("No Git root directory found.")
 
+sys.path.append(str((root_dir / "2.evaluate_data" / "utils").resolve(strict=True)))
+from anomaly_dataset import list_anomaly_plates, open_anomaly_dataset
+from compiled_isolation_forest import CompiledIsolationForest
+from plate_feature_importance import compute_dataset_plate_feature_importances
+
+
+# # Inputs
+
+# In[ ]:
+
+
+# Replace with your data storage path here
 parser = argparse.ArgumentParser()
 parser.add_argument(
     "--big_drive_path",
     type=pathlib.Path,
     default=root_dir / "big_drive",
 )
-args = parser.parse_args()
-
 
-# # Inputs
-
-# In[ ]:
+# Number of plates to compute feature importances for concurrently
+parser.add_argument("--num_workers", type=int, default=4)
 
+# Number of samples to compute feature importances for in each category (anomalous or inlier)
+parser.add_argument("--num_samples_per_category", type=int, default=300)
+args = parser.parse_args()
 
-# Replace with your data storage path here
 big_drive_path = args.big_drive_path.resolve(strict=True)
 anomaly_datasets_path = (big_drive_path / "sc_anomaly_data").resolve(strict=True)
 
@@ -83,12 +95,6 @@ feature_importances_path = big_drive_path / "sc_anomaly_feature_importances"
 
 
 model_suffix_name = "_isolation_forest.joblib"
-merge_cols = [
-    "Metadata_Plate",
-    "Metadata_Well",
-    "Metadata_Site",
-    "Metadata_ObjectNumber",
-]
 
 plate_mappingdf.rename(
     columns={
@@ -98,45 +104,81 @@ plate_mappingdf.rename(
     inplace=True,
 )
 
+# Each worker process computes one plate at a time with a share of the CPUs.
+# Workers are replaced after every plate to prevent memory leakage between plates.
+n_jobs = max(1, (os.cpu_count() or 1) // args.num_workers)
+pool = multiprocessing.Pool(processes=args.num_workers, maxtasksperchild=1)
+failed_plates = []
+
 for anomaly_dataset in anomaly_datasets_path.iterdir():
     if "normal" in anomaly_dataset.stem or "qc" not in anomaly_dataset.stem:
         continue
 
     anomaly_model_name = anomaly_dataset.stem + model_suffix_name
     morphology_dataset = big_drive_path / f"{anomaly_dataset.stem}"
-    anomalyze_model = joblib.load(anomalyze_models_path / anomaly_model_name)
 
-    anomaly_paths = list(anomaly_dataset.rglob("*.parquet"))
-
-    anomdf = pd.concat(
-        [pd.read_parquet(path) for path in anomaly_paths], ignore_index=True
+    # The compiled model is pickled by path, so workers memory-map the same files
+    anomalyze_model = CompiledIsolationForest.load_or_compile(
+        anomalyze_models_path / anomaly_model_name
     )
 
-    anomdf = pd.merge(
-        left=anomdf, right=plate_mappingdf, on="Metadata_Plate", how="inner"
-    )
+    # Only the plate column is read here, and each worker only reads
+    # the anomaly data of its own plate.
+    # Some plates are listed more than once in the plate mapping.
+    dataset_plates = list_anomaly_plates(open_anomaly_dataset(anomaly_dataset))
+
+    dataset_platesdf = pd.merge(
+        left=pd.DataFrame({"Metadata_Plate": dataset_plates}),
+        right=plate_mappingdf,
+        on="Metadata_Plate",
+        how="inner",
+    ).drop_duplicates()
 
     dataset_feature_importances_path = feature_importances_path / anomaly_dataset.stem
 
-    for treatment_type_name, treatment_typedf in anomdf.groupby(
-        "Metadata_treatment_type"
-    ):
+    plate_results = {}
+
+    # Morphology parquet files are separated by plate in each dataset
+    for plate, treatment_type_name in dataset_platesdf[
+        ["Metadata_Plate", "Metadata_treatment_type"]
+    ].itertuples(index=False):
         treatment_feature_importances_path = (
             dataset_feature_importances_path / treatment_type_name
         )
         treatment_feature_importances_path.mkdir(parents=True, exist_ok=True)
 
-        # Morphology parquet files are separated by plate in each dataset
-        for plate in treatment_typedf["Metadata_Plate"].unique():
-            subprocess.run(
-                [
-                    "run_feature_importance.sh",
-                    str(anomaly_dataset),
-                    plate,
-                    str(morphology_dataset),
-                    str(anomalyze_models_path / anomaly_model_name),
-                    str(treatment_feature_importances_path),
-                    str(plate_mapping_path),
-                    "nbconverted/compute_feature_importance_by_plate.py",
-                ]
-            )
+        morphology_plate_paths = list(morphology_dataset.rglob(f"*{plate}*.parquet"))
+
+        # A plate without morphology data doesn't stop the remaining plates
+        if not morphology_plate_paths:
+            print(f"Failed to compute feature importances for {plate}: no plate data")
+            failed_plates.append(f"{anomaly_dataset.stem}/{plate}")
+            continue
+
+        plate_results[plate] = pool.apply_async(
+            compute_dataset_plate_feature_importances,
+            kwds={
+                "anomaly_dataset_path": anomaly_dataset,
+                "plate": plate,
+                "morphology_plate_path": morphology_plate_paths[0],
+                "anomalyze_model": anomalyze_model,
+                "output_path": treatment_feature_importances_path / f"{plate}.parquet",
+                "num_samples": args.num_samples_per_category,
+                "n_jobs": n_jobs,
+            },
+        )
+
+    # A failed plate doesn't stop the remaining plates
+    for plate, plate_result in plate_results.items():
+        try:
+            plate_result.get()
+
+        except Exception as plate_error:
+            print(f"Failed to compute feature importances for {plate}: {plate_error}")
+            failed_plates.append(f"{anomaly_dataset.stem}/{plate}")
+
+pool.close()
+pool.join()
+
+if failed_plates:
+    raise RuntimeError(f"Failed to compute feature importances for {failed_plates}")
@@ -10,14 +10,19 @@
 # In[1]:
 
 
-import gzip
-import io
+import os
 import pathlib
+import sys
 
 import pandas as pd
-import requests
+import pyarrow as pa
+import pyarrow.parquet as pq
 from joblib import load
 
+# Import the artifact cache utils
+sys.path.append("utils")
+from artifact_cache import fetch_artifact
+
 
 # ## Find the path of the git directory
 
@@ -49,7 +54,8 @@ if root_dir is None:
 
 def load_joblib_from_url(url):
     """
-    Retirieve joblib or gzip csv file from url
+    Retirieve joblib or gzip csv file from url, which is only downloaded if it
+    isn't in the local artifact cache (see artifact_cache.fetch_artifact)
 
     Parameters
     ----------
@@ -61,15 +67,13 @@ def load_joblib_from_url(url):
     obj : any Python object
     """
 
-    response = requests.get(url)
-    file_object = io.BytesIO(response.content)
+    file_path = fetch_artifact(url)
 
     if ".csv" in url:
-        file_object = gzip.GzipFile(fileobj=file_object)
-        obj = pd.read_csv(file_object)
+        obj = pd.read_csv(file_path, compression="gzip")
 
     elif ".joblib" in url:
-        obj = load(file_object)
+        obj = load(file_path)
 
     return obj
 
@@ -79,7 +83,10 @@ def load_joblib_from_url(url):
 
 # The paths of the models
 base_model_path = "https://github.com/WayScience/phenotypic_profiling_model/raw/main/2.train_model/models/multi_class_models"
-model_paths = [f"{base_model_path}/final__CP.joblib", f"{base_model_path}/shuffled_baseline__CP.joblib"]
+model_paths = [
+    f"{base_model_path}/final__CP.joblib",
+    f"{base_model_path}/shuffled_baseline__CP.joblib",
+]
 
 # The path of the data used for the data used for inferencing in the phenotypic_profiling_model repo
 data_path = "https://github.com/WayScience/phenotypic_profiling_model/raw/main/0.download_data/data/labeled_data.csv.gz"
@@ -103,7 +110,10 @@ pathlib.Path(f"{output_proba_path}").mkdir(parents=True, exist_ok=True)
 
 
 # Store the models as a dictionary
-models = {model_path.split("/")[-1].split("__")[0]: load_joblib_from_url(model_path) for model_path in model_paths}
+models = {
+    model_path.split("/")[-1].split("__")[0]: load_joblib_from_url(model_path)
+    for model_path in model_paths
+}
 
 # Original dataset used to select features for models
 data = load_joblib_from_url(data_path)
@@ -116,67 +126,97 @@ data = load_joblib_from_url(data_path)
 
 # Extract CP features from all columns depending on desired dataset
 feature_cols = [col for col in data.columns if "CP__" in col]
-feature_cols = [string.replace("CP_", "Nuclei") if "CP" in string else string for string in feature_cols]
+feature_cols = [
+    string.replace("CP_", "Nuclei") if "CP" in string else string
+    for string in feature_cols
+]
 feature_cols = pd.Index(feature_cols)
-model_preds = []
 cell_count = 0
 
-# Iterate through the normalized plate paths
-for plate in norm_data_path.iterdir():
+# Maximum number of cells loaded and predicted at a time
+batch_size = 100_000
 
-    # Load the dataframe for the plate
-    df = pd.read_parquet(plate)
+output_proba_file = pathlib.Path(f"{output_proba_path}/model_probabilities.parquet")
 
-    # Retrieve the name of the parquet file
-    parquet_name = plate.name.split('_')[0]
+# Predictions are written to a temporary file as they are made,
+# which replaces the output once every plate is predicted
+tmp_output_proba_file = output_proba_file.with_name(f".{output_proba_file.name}.tmp")
+writer = None
 
-    # Find columns that were in the original dataset used for inferencing, but not in the new dataset
-    new_df_cols = feature_cols.difference(df.columns).tolist()
+try:
+    # Iterate through the normalized plate paths
+    for plate in norm_data_path.iterdir():
 
-    # Set the columns found above to all zero values
-    df[new_df_cols] = 0
+        plate_file = pq.ParquetFile(plate)
 
-    # Get the wells of the plate
-    well = df["Metadata_Well"]
+        # Only load the features used by the models,
+        # and the metadata stored with the predictions
+        plate_feature_cols = feature_cols.intersection(
+            plate_file.schema_arrow.names
+        ).tolist()
 
-    # Get the plate of the dataframe
-    plate_name = df["Metadata_Plate"].iloc[0]
+        # Index of the first cell of the batch in the plate
+        cell_idx = 0
 
-    # Order the column based on order of columns used to train model
-    df = df[feature_cols]
+        for batch in plate_file.iter_batches(
+            batch_size=batch_size,
+            columns=["Metadata_Well", "Metadata_Plate", *plate_feature_cols],
+        ):
+            df = batch.to_pandas()
 
-    # Convert dataframe to matrix
-    df_mat = df.values
+            # Get the wells of the batch
+            well = df["Metadata_Well"].to_numpy()
 
-    # Calculate the number of cells
-    cell_count += df_mat.shape[0]
+            # Get the plate of the dataframe
+            plate_name = df["Metadata_Plate"].iloc[0]
 
-    # Create predictions for each model
-    for model_type, model in models.items():
+            # Order the column based on order of columns used to train model,
+            # where columns that were in the original dataset used for inferencing,
+            # but not in the new dataset, are set to all zero values
+            df = df.reindex(columns=feature_cols, fill_value=0)
 
-        # Find the probabilities
-        preds = model.predict_proba(df_mat)
+            # Convert dataframe to matrix
+            df_mat = df.values
 
-        # Store the predictions using the models classes
-        predsdf = pd.DataFrame(preds, columns=model.classes_)
+            # Index of the cells in the plate
+            cell_index = pd.RangeIndex(cell_idx, cell_idx + df_mat.shape[0])
+            cell_idx += df_mat.shape[0]
 
-        # Store the type of model
-        predsdf["Metadata_model_type"] = model_type
+            # Create predictions for each model
+            for model_type, model in models.items():
 
-        # Store the well data
-        predsdf["Metadata_Well"] = well
+                # Find the probabilities
+                preds = model.predict_proba(df_mat)
 
-        # Store the plate data
-        predsdf["Metadata_plate"] = plate_name
+                # Store the predictions using the models classes
+                predsdf = pd.DataFrame(preds, columns=model.classes_, index=cell_index)
 
-        # Store the prediction dataframes
-        model_preds.append(predsdf)
+                # Store the type of model
+                predsdf["Metadata_model_type"] = model_type
 
-# Concatenate the model predictions
-model_preds = pd.concat(model_preds)
+                # Store the well data
+                predsdf["Metadata_Well"] = well
 
-# Save predictions
-model_preds.to_parquet(f"{output_proba_path}/model_probabilities.parquet", index=True)
+                # Store the plate data
+                predsdf["Metadata_plate"] = plate_name
 
-print(f"The total cell count is {cell_count}")
+                # The index is stored as a column,
+                # as when saving every prediction at once
+                predstable = pa.Table.from_pandas(predsdf, preserve_index=True)
+
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_output_proba_file, predstable.schema)
+
+                # Save the predictions of the batch
+                writer.write_table(predstable)
 
+        # Calculate the number of cells
+        cell_count += cell_idx
+
+finally:
+    if writer is not None:
+        writer.close()
+
+os.replace(tmp_output_proba_file, output_proba_file)
+
+print(f"The total cell count is {cell_count}")
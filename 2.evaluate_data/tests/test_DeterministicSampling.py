@@ -0,0 +1,141 @@
+import pathlib
+import sys
+from typing import Union
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1] / "utils"))
+
+pytest.importorskip("farmhash")
+
+from DeterministicSampling import DeterministicSampling, _allocate_samples  # noqa: E402
+from farmhash import Fingerprint64  # noqa: E402
+
+ID_COLUMNS = [
+    "Metadata_Plate",
+    "Metadata_Well",
+    "Metadata_Site",
+    "Metadata_ObjectNumber",
+]
+SAMPLES_PER_PLATE = 120
+NUM_CELLS = 2_000
+ROW_GROUP_SIZE = 300
+
+
+@pytest.mark.parametrize(
+    "group_sizes, num_samples, expected",
+    [
+        # ties are rounded up in group order
+        ([3, 3, 3], 4, [2, 1, 1]),
+        ([5, 5, 5, 5, 5, 5, 5], 10, [2, 2, 2, 1, 1, 1, 1]),
+        # the shares of small groups are split between the other groups
+        ([1, 10, 10], 8, [1, 4, 3]),
+        ([2, 2], 10, [2, 2]),
+        ([], 3, []),
+    ],
+)
+def test_allocate_equal_samples(
+    group_sizes: list[int], num_samples: int, expected: list[int]
+) -> None:
+    np.testing.assert_array_equal(_allocate_samples(group_sizes, num_samples), expected)
+
+
+def test_allocate_proportional_samples() -> None:
+    allocations = _allocate_samples([10, 20, 30], 7, proportional=True)
+
+    np.testing.assert_array_equal(allocations, [1, 2, 4])
+
+
+@pytest.fixture(scope="module")
+def platedf() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+
+    return pd.DataFrame(
+        {
+            "Metadata_Plate": "BR00117006",
+            "Metadata_Well": rng.choice(["A01", "A02", "B01", "B02"], NUM_CELLS),
+            "Metadata_Site": rng.integers(1, 10, NUM_CELLS),
+            "Metadata_ObjectNumber": np.arange(NUM_CELLS),
+            "Cells_AreaShape_Area": rng.normal(size=NUM_CELLS),
+        }
+    )
+
+
+def sample(
+    platedf: Union[pd.DataFrame, pathlib.Path],
+    sample_strategy: str = "well_sampling",
+    hash_method: str = "farmhash",
+) -> pd.DataFrame:
+    return DeterministicSampling(
+        platedf.copy() if isinstance(platedf, pd.DataFrame) else platedf,
+        SAMPLES_PER_PLATE,
+        "Metadata_Plate",
+        "Metadata_Well",
+        ID_COLUMNS[2:],
+        _hash_method=hash_method,
+    ).sample_plate_deterministically(sample_strategy)
+
+
+def test_farmhash_matches_row_wise_hashing(platedf: pd.DataFrame) -> None:
+    # reference: a python call per row on the joined id column strings
+    divisor = 10_000
+    farmhashes = (
+        platedf[ID_COLUMNS]
+        .astype(str)
+        .agg("".join, axis=1)
+        .map(lambda x: Fingerprint64(x) % divisor)
+    )
+    platedf = platedf.assign(Metadata_farmhash=farmhashes)
+
+    samples_per_group = SAMPLES_PER_PLATE // platedf["Metadata_Well"].nunique()
+    expected = pd.concat(
+        (
+            group_df.loc[
+                group_df["Metadata_farmhash"]
+                < (samples_per_group / len(group_df)) * divisor
+            ]
+            for _, group_df in platedf.groupby(["Metadata_Plate", "Metadata_Well"])
+        ),
+        ignore_index=True,
+    )
+
+    pd.testing.assert_frame_equal(
+        sample(platedf.drop(columns="Metadata_farmhash")), expected
+    )
+
+
+def test_hash_array_sampling(platedf: pd.DataFrame) -> None:
+    sampleddf = sample(platedf, hash_method="hash_array")
+
+    # reproducible, but a different selection than farmhash
+    pd.testing.assert_frame_equal(sample(platedf, hash_method="hash_array"), sampleddf)
+    assert not sampleddf["Metadata_ObjectNumber"].equals(
+        sample(platedf)["Metadata_ObjectNumber"]
+    )
+
+    for hash_method in ["farmhash", "hash_array"]:
+        assert (
+            len(sample(platedf, "exact_well_sampling", hash_method))
+            == SAMPLES_PER_PLATE
+        )
+
+
+@pytest.mark.parametrize(
+    "sample_strategy", ["well_sampling", "exact_well_sampling", "plate_sampling"]
+)
+@pytest.mark.parametrize("hash_method", ["farmhash", "hash_array"])
+def test_parquet_sampling_matches_in_memory(
+    platedf: pd.DataFrame,
+    tmp_path: pathlib.Path,
+    sample_strategy: str,
+    hash_method: str,
+) -> None:
+    plate_path = tmp_path / "plate.parquet"
+    platedf.to_parquet(plate_path, index=False, row_group_size=ROW_GROUP_SIZE)
+
+    pd.testing.assert_frame_equal(
+        sample(plate_path, sample_strategy, hash_method),
+        sample(platedf, sample_strategy, hash_method),
+    )
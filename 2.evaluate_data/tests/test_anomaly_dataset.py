@@ -0,0 +1,192 @@
+import pathlib
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1] / "utils"))
+import anomaly_dataset as ad
+
+PLATES = ["BR00117006", "BR00117007"]
+WELLS = ["A01", "A02", "B01"]
+CELLS_PER_PLATE = 600
+BATCH_SIZE = 250
+TOP_K = 25
+
+# cells at least this anomalous (lowest scores) are selected by the score filter
+SCORE_CUTOFF = -0.2
+
+
+@pytest.fixture(scope="module")
+def anomdf() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+
+    return pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    "Metadata_Plate": plate,
+                    "Metadata_Well": rng.choice(WELLS, CELLS_PER_PLATE),
+                    "Metadata_ObjectNumber": np.arange(CELLS_PER_PLATE),
+                    "Result_inlier": rng.choice([-1, 1], CELLS_PER_PLATE),
+                    "Result_anomaly_score": rng.uniform(-0.5, 0.5, CELLS_PER_PLATE),
+                }
+            )
+            for plate in PLATES
+        ],
+        ignore_index=True,
+    )
+
+
+@pytest.fixture(scope="module")
+def batched_dataset_path(
+    anomdf: pd.DataFrame, tmp_path_factory: pytest.TempPathFactory
+) -> pathlib.Path:
+    """Anomaly batches in one directory per plate file."""
+
+    anomaly_dataset_path = tmp_path_factory.mktemp("batched")
+
+    for plate, platedf in anomdf.groupby("Metadata_Plate"):
+        plate_path = anomaly_dataset_path / f"{plate}_sc_feature_selected"
+        plate_path.mkdir()
+
+        for i, start in enumerate(range(0, len(platedf), BATCH_SIZE)):
+            platedf.iloc[start : start + BATCH_SIZE].to_parquet(
+                plate_path / f"{plate}_anomaly_batch_{i}.parquet", index=False
+            )
+
+    return anomaly_dataset_path
+
+
+@pytest.fixture(scope="module")
+def partitioned_dataset_path(
+    anomdf: pd.DataFrame, tmp_path_factory: pytest.TempPathFactory
+) -> pathlib.Path:
+    anomaly_dataset_path = tmp_path_factory.mktemp("partitioned")
+
+    for plate, platedf in anomdf.groupby("Metadata_Plate"):
+        for i, start in enumerate(range(0, len(platedf), BATCH_SIZE)):
+            ad.write_partitioned_anomalies(
+                platedf.iloc[start : start + BATCH_SIZE],
+                anomaly_dataset_path,
+                basename=f"{plate}-{i}",
+                write_metadata=False,
+            )
+
+        ad.write_plate_metadata(anomaly_dataset_path / f"Metadata_Plate={plate}")
+
+    return anomaly_dataset_path
+
+
+def sort_cells(df: pd.DataFrame) -> pd.DataFrame:
+    return (
+        df.sort_values(["Metadata_Plate", "Metadata_ObjectNumber"])
+        .reset_index(drop=True)
+        .astype({"Metadata_Plate": str, "Metadata_Well": str})
+    )
+
+
+@pytest.mark.parametrize("layout", ["batched", "partitioned"])
+@pytest.mark.parametrize("open_plate", [False, True])
+def test_read_plate_anomalies_matches_pandas_filter(
+    anomdf: pd.DataFrame,
+    layout: str,
+    open_plate: bool,
+    request: pytest.FixtureRequest,
+) -> None:
+    anomaly_dataset_path = request.getfixturevalue(f"{layout}_dataset_path")
+    plate = PLATES[1]
+
+    anomaly_dataset = ad.open_anomaly_dataset(
+        anomaly_dataset_path, plate if open_plate else None
+    )
+
+    if not open_plate:
+        assert ad.list_anomaly_plates(anomaly_dataset) == PLATES
+
+    platedf = ad.read_plate_anomalies(
+        anomaly_dataset,
+        plate,
+        columns=list(anomdf.columns),
+        filter_expr=ds.field("Result_anomaly_score") <= SCORE_CUTOFF,
+    )
+    expected = anomdf.loc[
+        (anomdf["Metadata_Plate"] == plate)
+        & (anomdf["Result_anomaly_score"] <= SCORE_CUTOFF)
+    ]
+
+    pd.testing.assert_frame_equal(sort_cells(platedf), sort_cells(expected))
+
+
+def test_open_plate_only_lists_its_files(batched_dataset_path: pathlib.Path) -> None:
+    anomaly_dataset = ad.open_anomaly_dataset(batched_dataset_path, PLATES[0])
+
+    assert len(anomaly_dataset.files) == -(-CELLS_PER_PLATE // BATCH_SIZE)
+    assert ad.list_anomaly_plates(anomaly_dataset) == PLATES[:1]
+
+
+@pytest.mark.parametrize("largest", [False, True])
+def test_stream_top_k_anomalies(
+    anomdf: pd.DataFrame, batched_dataset_path: pathlib.Path, largest: bool
+) -> None:
+    topdf = ad.stream_top_k_anomalies(
+        ad.open_anomaly_dataset(batched_dataset_path),
+        TOP_K,
+        largest=largest,
+        filter_expr=ad.plate_filter(PLATES[0]),
+        columns=["Metadata_ObjectNumber"],
+    )
+    platedf = anomdf.loc[anomdf["Metadata_Plate"] == PLATES[0]]
+    expected = (
+        platedf.nlargest(TOP_K, "Result_anomaly_score")
+        if largest
+        else platedf.nsmallest(TOP_K, "Result_anomaly_score")
+    )
+
+    pd.testing.assert_frame_equal(
+        topdf,
+        expected[["Metadata_ObjectNumber", "Result_anomaly_score"]].reset_index(
+            drop=True
+        ),
+    )
+
+
+def test_partitioned_layout(
+    anomdf: pd.DataFrame, partitioned_dataset_path: pathlib.Path, tmp_path: pathlib.Path
+) -> None:
+    # one directory per plate and well, with cells sorted by score in each file
+    for plate in PLATES:
+        plate_path = partitioned_dataset_path / f"Metadata_Plate={plate}"
+
+        assert (plate_path / "_metadata").is_file()
+        assert sorted(path.name for path in plate_path.glob("Metadata_Well=*")) == [
+            f"Metadata_Well={well}" for well in WELLS
+        ]
+
+    for path in partitioned_dataset_path.rglob("*.parquet"):
+        scores = pd.read_parquet(path)["Result_anomaly_score"]
+        assert scores.is_monotonic_increasing
+
+    # the files of a previous run (and the plate summary) are removed before
+    # the plate is written again
+    platedf = anomdf.loc[anomdf["Metadata_Plate"] == PLATES[0]]
+    ad.write_partitioned_anomalies(platedf, tmp_path, basename="plate-0")
+    ad.write_partitioned_anomalies(platedf.iloc[:BATCH_SIZE], tmp_path, "plate-1")
+
+    ad.remove_partitioned_anomalies(tmp_path, basename="plate")
+    assert not (tmp_path / f"Metadata_Plate={PLATES[0]}" / "_metadata").exists()
+
+    ad.write_partitioned_anomalies(platedf, tmp_path, basename="plate-0")
+
+    pd.testing.assert_frame_equal(
+        sort_cells(
+            ad.read_plate_anomalies(
+                ad.open_anomaly_dataset(tmp_path, PLATES[0]),
+                PLATES[0],
+                columns=list(anomdf.columns),
+            )
+        ),
+        sort_cells(platedf),
+    )
@@ -0,0 +1,132 @@
+import pathlib
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1] / "utils"))
+import anomaly_index as ai
+
+TOP_K = 100
+PLATE_SIZES = {"plate_a": 5_000, "plate_b": 3_000}
+BATCH_SIZE = 700
+
+
+def anomaly_data(rng: np.random.Generator) -> pd.DataFrame:
+    """Anomaly results of every plate, which are shuffled across plates."""
+
+    anomdf = pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    "Metadata_Plate": plate,
+                    "Metadata_Cell": np.arange(num_cells),
+                    "Result_anomaly_score": rng.uniform(-0.5, 0.5, num_cells),
+                }
+            )
+            for plate, num_cells in PLATE_SIZES.items()
+        ],
+        ignore_index=True,
+    )
+
+    return anomdf.sample(frac=1, random_state=0).reset_index(drop=True)
+
+
+@pytest.fixture(scope="module")
+def indexed_anomalies(
+    tmp_path_factory: pytest.TempPathFactory,
+) -> tuple[pathlib.Path, pd.DataFrame]:
+    anomdf = anomaly_data(np.random.default_rng(0))
+    anomaly_index_path = tmp_path_factory.mktemp("anomaly_index")
+
+    builder = ai.AnomalyIndexBuilder(top_k=TOP_K)
+
+    for start in range(0, len(anomdf), BATCH_SIZE):
+        builder.update(anomdf.iloc[start : start + BATCH_SIZE])
+
+    builder.write(anomaly_index_path)
+
+    return anomaly_index_path, anomdf
+
+
+@pytest.mark.parametrize("k", [1, 50, 120])
+def test_global_top_k_matches_full_sort(
+    indexed_anomalies: tuple[pathlib.Path, pd.DataFrame], k: int
+) -> None:
+    anomaly_index_path, anomdf = indexed_anomalies
+
+    topdf = ai.global_top_k_anomalies(anomaly_index_path, k)
+    expected = anomdf.nsmallest(k, "Result_anomaly_score").reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(topdf[expected.columns], expected)
+
+
+def test_global_top_k_of_selected_plates(
+    indexed_anomalies: tuple[pathlib.Path, pd.DataFrame],
+) -> None:
+    anomaly_index_path, anomdf = indexed_anomalies
+
+    topdf = ai.global_top_k_anomalies(
+        anomaly_index_path, TOP_K, plates=["plate_b"], columns=["Metadata_Cell"]
+    )
+    expected = (
+        anomdf.loc[anomdf["Metadata_Plate"] == "plate_b"]
+        .nsmallest(TOP_K, "Result_anomaly_score")
+        .reset_index(drop=True)
+    )
+
+    assert topdf.columns.tolist() == ["Metadata_Cell", "Result_anomaly_score"]
+    pd.testing.assert_frame_equal(topdf, expected[topdf.columns])
+
+
+@pytest.mark.parametrize("k", [2 * TOP_K, 2 * TOP_K + 50])
+def test_global_top_k_exceeding_the_index_raises(
+    indexed_anomalies: tuple[pathlib.Path, pd.DataFrame], k: int
+) -> None:
+    # both plates have more cells than are indexed, whether or not k cells are
+    # available from the index
+    with pytest.raises(ValueError, match="rebuild the index"):
+        ai.global_top_k_anomalies(indexed_anomalies[0], k)
+
+
+def test_global_top_k_of_fully_indexed_plates(tmp_path: pathlib.Path) -> None:
+    anomdf = anomaly_data(np.random.default_rng(1))
+
+    builder = ai.AnomalyIndexBuilder(top_k=max(PLATE_SIZES.values()))
+    builder.update(anomdf)
+    builder.write(tmp_path)
+
+    # every cell is indexed, so fewer than k cells is the complete answer
+    topdf = ai.global_top_k_anomalies(tmp_path, len(anomdf) + 1)
+
+    assert len(topdf) == len(anomdf)
+    assert topdf["Result_anomaly_score"].is_monotonic_increasing
+
+
+def test_anomaly_score_quantiles(
+    indexed_anomalies: tuple[pathlib.Path, pd.DataFrame],
+) -> None:
+    anomaly_index_path, anomdf = indexed_anomalies
+    q = [0.0, 0.01, 0.25, 0.5, 0.99, 1.0]
+
+    bin_width = ai.SCORE_HISTOGRAM_EDGES[1] - ai.SCORE_HISTOGRAM_EDGES[0]
+
+    np.testing.assert_allclose(
+        ai.anomaly_score_quantiles(anomaly_index_path, q),
+        np.quantile(anomdf["Result_anomaly_score"], q),
+        atol=bin_width,
+    )
+
+    plate_scores = anomdf.loc[
+        anomdf["Metadata_Plate"] == "plate_a", "Result_anomaly_score"
+    ]
+
+    np.testing.assert_allclose(
+        ai.anomaly_score_quantiles(anomaly_index_path, q, plates=["plate_a"]),
+        np.quantile(plate_scores, q),
+        atol=bin_width,
+    )
+
+    with pytest.raises(ValueError, match="within"):
+        ai.anomaly_score_quantiles(anomaly_index_path, 1.5)
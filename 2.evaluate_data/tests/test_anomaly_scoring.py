@@ -0,0 +1,113 @@
+import pathlib
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from sklearn.ensemble import IsolationForest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1] / "utils"))
+import anomaly_scoring as ascore
+
+NUM_CELLS = 1_000
+NUM_FEATURES = 6
+BATCH_SIZE = 128
+
+
+@pytest.fixture(scope="module")
+def plate_path(tmp_path_factory: pytest.TempPathFactory) -> pathlib.Path:
+    rng = np.random.default_rng(0)
+
+    platedf = pd.DataFrame(
+        rng.normal(size=(NUM_CELLS, NUM_FEATURES)),
+        columns=[f"Cells_feature_{i}" for i in range(NUM_FEATURES)],
+    ).assign(
+        Metadata_Well=rng.choice(["A01", "B02"], NUM_CELLS),
+        Metadata_ObjectNumber=np.arange(NUM_CELLS),
+        Image_Count_Cells=NUM_CELLS,
+    )
+
+    plate_path = tmp_path_factory.mktemp("plate") / "plate.parquet"
+    platedf.to_parquet(plate_path, index=False, row_group_size=BATCH_SIZE // 2)
+
+    return plate_path
+
+
+@pytest.fixture(scope="module")
+def iso_forest(plate_path: pathlib.Path) -> IsolationForest:
+    featdf = pd.read_parquet(plate_path).filter(like="Cells_")
+
+    return IsolationForest(n_estimators=20, random_state=0).fit(featdf)
+
+
+def test_iter_prefetched_batches(plate_path: pathlib.Path) -> None:
+    pq_file = pq.ParquetFile(plate_path)
+
+    batches = list(
+        ascore.iter_prefetched_batches(
+            pq_file, BATCH_SIZE, columns=["Metadata_ObjectNumber"], prefetch_batches=1
+        )
+    )
+
+    assert [batch.num_rows for batch in batches[:-1]] == [BATCH_SIZE] * (
+        len(batches) - 1
+    )
+    np.testing.assert_array_equal(
+        np.concatenate([batch.column(0).to_numpy() for batch in batches]),
+        np.arange(NUM_CELLS),
+    )
+
+    # the reader thread stops when the consumer stops early
+    prefetched_batches = ascore.iter_prefetched_batches(pq_file, BATCH_SIZE)
+    next(prefetched_batches)
+    prefetched_batches.close()
+
+
+def test_score_parquet_anomalies_matches_sklearn(
+    plate_path: pathlib.Path, iso_forest: IsolationForest
+) -> None:
+    written_batches = []
+
+    num_batches = ascore.score_parquet_anomalies(
+        pq.ParquetFile(plate_path),
+        iso_forest,
+        lambda i, anomdf: written_batches.append((i, anomdf)),
+        batch_size=BATCH_SIZE,
+    )
+
+    assert num_batches == -(-NUM_CELLS // BATCH_SIZE)
+    assert [i for i, _ in written_batches] == list(range(num_batches))
+
+    anomdf = pd.concat([anomdf for _, anomdf in written_batches], ignore_index=True)
+    platedf = pd.read_parquet(plate_path)
+    featdf = platedf[iso_forest.feature_names_in_]
+
+    # only Metadata and Result columns are written
+    assert anomdf.columns.tolist() == [
+        "Metadata_Well",
+        "Metadata_ObjectNumber",
+        "Result_inlier",
+        "Result_anomaly_score",
+    ]
+    pd.testing.assert_frame_equal(
+        anomdf[["Metadata_Well", "Metadata_ObjectNumber"]],
+        platedf[["Metadata_Well", "Metadata_ObjectNumber"]],
+    )
+    np.testing.assert_array_equal(anomdf["Result_inlier"], iso_forest.predict(featdf))
+    np.testing.assert_allclose(
+        anomdf["Result_anomaly_score"], iso_forest.decision_function(featdf)
+    )
+
+
+def test_score_parquet_anomalies_raises_write_errors(
+    plate_path: pathlib.Path, iso_forest: IsolationForest
+) -> None:
+    def write_batch(i: int, anomdf: pd.DataFrame) -> None:
+        if i == 1:
+            raise OSError("Disk full")
+
+    with pytest.raises(OSError, match="Disk full"):
+        ascore.score_parquet_anomalies(
+            pq.ParquetFile(plate_path), iso_forest, write_batch, batch_size=BATCH_SIZE
+        )
@@ -0,0 +1,171 @@
+import hashlib
+import http.server
+import pathlib
+import sys
+import threading
+from collections.abc import Iterator
+from http import HTTPStatus
+
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1] / "utils"))
+import artifact_cache as ac
+
+ARTIFACT_BYTES = 1_000
+
+
+class ArtifactServer(http.server.ThreadingHTTPServer):
+    """Serves artifacts by path, with their sha256 as ETag."""
+
+    def __init__(self: "ArtifactServer") -> None:
+        super().__init__(("127.0.0.1", 0), ArtifactHandler)
+        self.artifacts: dict[str, bytes] = {}
+        self.requests: list[tuple[str, int]] = []
+
+    def url(self: "ArtifactServer", name: str) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/{name}"
+
+
+class ArtifactHandler(http.server.BaseHTTPRequestHandler):
+    server: ArtifactServer
+
+    def do_GET(self: "ArtifactHandler") -> None:
+        content = self.server.artifacts.get(self.path.lstrip("/"))
+
+        if content is None:
+            status = HTTPStatus.NOT_FOUND
+            etag = None
+        else:
+            etag = f'"{hashlib.sha256(content).hexdigest()}"'
+            status = (
+                HTTPStatus.NOT_MODIFIED
+                if self.headers.get("If-None-Match") == etag
+                else HTTPStatus.OK
+            )
+
+        self.server.requests.append((self.path, status))
+        self.send_response(status)
+
+        if status == HTTPStatus.OK:
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        else:
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    def log_message(self: "ArtifactHandler", *args: object) -> None:
+        pass
+
+
+@pytest.fixture()
+def server() -> Iterator[ArtifactServer]:
+    server = ArtifactServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_cache_hit_without_request(
+    server: ArtifactServer, tmp_path: pathlib.Path
+) -> None:
+    server.artifacts["model.joblib"] = b"model"
+    url = server.url("model.joblib")
+
+    path = ac.fetch_artifact(url, cache_path=tmp_path)
+    cached_path = ac.fetch_artifact(url, cache_path=tmp_path)
+
+    assert path.read_bytes() == b"model"
+    assert cached_path == path
+    assert server.requests == [("/model.joblib", HTTPStatus.OK)]
+
+
+def test_revalidation(server: ArtifactServer, tmp_path: pathlib.Path) -> None:
+    server.artifacts["model.joblib"] = b"model"
+    url = server.url("model.joblib")
+
+    path = ac.fetch_artifact(url, cache_path=tmp_path, max_age_s=0)
+
+    # unchanged contents aren't downloaded again
+    assert ac.fetch_artifact(url, cache_path=tmp_path, max_age_s=0) == path
+
+    server.artifacts["model.joblib"] = b"retrained model"
+    new_path = ac.fetch_artifact(url, cache_path=tmp_path, max_age_s=0)
+
+    assert new_path.read_bytes() == b"retrained model"
+    assert [status for _, status in server.requests] == [
+        HTTPStatus.OK,
+        HTTPStatus.NOT_MODIFIED,
+        HTTPStatus.OK,
+    ]
+
+    # the cached content is used when the url can't be reached
+    del server.artifacts["model.joblib"]
+
+    with pytest.warns(UserWarning, match="can't be reached"):
+        assert ac.fetch_artifact(url, cache_path=tmp_path, max_age_s=0) == new_path
+
+
+def test_offline(server: ArtifactServer, tmp_path: pathlib.Path) -> None:
+    server.artifacts["model.joblib"] = b"model"
+    url = server.url("model.joblib")
+
+    with pytest.raises(FileNotFoundError, match="isn't cached"):
+        ac.fetch_artifact(url, cache_path=tmp_path, offline=True)
+
+    path = ac.fetch_artifact(url, cache_path=tmp_path)
+
+    offline_path = ac.fetch_artifact(
+        url, cache_path=tmp_path, offline=True, max_age_s=0
+    )
+
+    assert offline_path == path
+    assert len(server.requests) == 1
+
+
+def test_offline_from_environment(
+    server: ArtifactServer, tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    server.artifacts["model.joblib"] = b"model"
+    url = server.url("model.joblib")
+
+    monkeypatch.setenv(ac.ARTIFACT_CACHE_ENV, str(tmp_path))
+    path = ac.fetch_artifact(url)
+
+    monkeypatch.setenv(ac.ARTIFACT_CACHE_OFFLINE_ENV, "1")
+
+    assert ac.fetch_artifact(url, max_age_s=0) == path
+    assert len(server.requests) == 1
+
+
+def test_lru_eviction(server: ArtifactServer, tmp_path: pathlib.Path) -> None:
+    for name in ["a", "b", "c"]:
+        server.artifacts[name] = name.encode() * ARTIFACT_BYTES
+
+    def fetch(name: str) -> pathlib.Path:
+        return ac.fetch_artifact(
+            server.url(name), cache_path=tmp_path, max_cache_bytes=2 * ARTIFACT_BYTES
+        )
+
+    path_a = fetch("a")
+    path_b = fetch("b")
+
+    # a is used more recently than b, so b is evicted for c
+    fetch("a")
+    path_c = fetch("c")
+
+    assert path_a.is_file()
+    assert not path_b.exists()
+    assert path_c.is_file()
+    assert sorted(path.name for path in (tmp_path / "blobs").iterdir()) == sorted(
+        [path_a.name, path_c.name]
+    )
+
+    # the evicted artifact is downloaded again
+    assert fetch("b").read_bytes() == b"b" * ARTIFACT_BYTES
+    assert not path_a.exists()
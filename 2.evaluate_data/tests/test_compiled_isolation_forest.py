@@ -0,0 +1,100 @@
+import pathlib
+import pickle
+import sys
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import IsolationForest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1] / "utils"))
+from compiled_isolation_forest import CompiledIsolationForest
+from isolation_forest_data_feature_importance import IsoforestFeatureImportance
+
+# fraction of the values which are missing (NaN)
+MISSING_FRACTION = 0.2
+
+
+@pytest.fixture(scope="module")
+def fitted_isoforest() -> tuple[IsolationForest, pd.DataFrame]:
+    rng = np.random.default_rng(0)
+    columns = [f"Cells_feature_{idx}" for idx in range(8)]
+
+    isoforest = IsolationForest(
+        n_estimators=30, max_samples=128, max_features=0.6, random_state=0
+    ).fit(pd.DataFrame(rng.normal(size=(500, 8)), columns=columns))
+
+    # missing values are routed to the side sklearn learned for them
+    X = pd.DataFrame(rng.normal(scale=2, size=(400, 8)), columns=columns)
+    X = X.mask(rng.random(X.shape) < MISSING_FRACTION)
+
+    return isoforest, X
+
+
+@pytest.mark.parametrize("saved", [False, True])
+def test_compiled_forest_matches_sklearn(
+    fitted_isoforest: tuple[IsolationForest, pd.DataFrame],
+    tmp_path: pathlib.Path,
+    saved: bool,
+) -> None:
+    isoforest, X = fitted_isoforest
+    compiled_forest = CompiledIsolationForest.from_isolation_forest(isoforest)
+
+    if saved:
+        compiled_forest = CompiledIsolationForest.load(
+            compiled_forest.save(tmp_path / "isoforest.compiled")
+        )
+
+    np.testing.assert_allclose(
+        compiled_forest.score_samples(X), isoforest.score_samples(X)
+    )
+    np.testing.assert_allclose(
+        compiled_forest.decision_function(X, n_jobs=2), isoforest.decision_function(X)
+    )
+    np.testing.assert_array_equal(compiled_forest.predict(X), isoforest.predict(X))
+
+
+def test_load_or_compile(
+    fitted_isoforest: tuple[IsolationForest, pd.DataFrame], tmp_path: pathlib.Path
+) -> None:
+    isoforest, X = fitted_isoforest
+    model_path = tmp_path / "isoforest.joblib"
+    joblib.dump(isoforest, model_path)
+
+    compiled_forest = CompiledIsolationForest.load_or_compile(model_path)
+    compiled_path = CompiledIsolationForest.compiled_path(model_path)
+
+    # forests saved without some of the arrays are compiled again
+    (compiled_path / "missing_go_to_left.npy").unlink()
+    recompiled_forest = CompiledIsolationForest.load_or_compile(model_path)
+
+    np.testing.assert_array_equal(
+        recompiled_forest.predict(X), compiled_forest.predict(X)
+    )
+
+    # saved forests are re-opened from disk when unpickled
+    unpickled_forest = pickle.loads(pickle.dumps(recompiled_forest))
+    np.testing.assert_allclose(
+        unpickled_forest.score_samples(X), isoforest.score_samples(X)
+    )
+
+
+def test_compiled_forest_importances(
+    fitted_isoforest: tuple[IsolationForest, pd.DataFrame],
+) -> None:
+    isoforest, X = fitted_isoforest
+    compiled_forest = CompiledIsolationForest.from_isolation_forest(isoforest)
+
+    importancesdfs = [
+        IsoforestFeatureImportance(
+            estimators=forest.estimators_,
+            morphology_data=X,
+            estimators_features=forest.estimators_features_,
+            backend="numpy",
+            n_jobs=1,
+        ).compute_isoforest_importances()
+        for forest in (isoforest, compiled_forest)
+    ]
+
+    pd.testing.assert_frame_equal(*importancesdfs)
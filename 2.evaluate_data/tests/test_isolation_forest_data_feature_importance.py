@@ -0,0 +1,224 @@
+import pathlib
+import sys
+from typing import Callable, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from sklearn.ensemble import IsolationForest
+from sklearn.tree import DecisionTreeRegressor
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1] / "utils"))
+import isolation_forest_data_feature_importance as iffi
+
+# fraction of the values which are missing (NaN)
+MISSING_FRACTION = 0.1
+
+# number of samples per importance chunk
+CHUNK_SIZE = 64
+
+# number of the most important features kept per sample
+TOP_K_FEATURES = 3
+
+
+@pytest.fixture(scope="module")
+def fitted_isoforest() -> tuple[IsolationForest, np.ndarray]:
+    rng = np.random.default_rng(0)
+
+    # float32 values, which sklearn compares to the thresholds as is
+    X = rng.normal(size=(300, 8)).astype(np.float32).astype(float)
+    isoforest = IsolationForest(n_estimators=20, max_features=0.6, random_state=0).fit(
+        X
+    )
+
+    # missing values are routed to the side sklearn learned for them
+    X[rng.random(X.shape) < MISSING_FRACTION] = np.nan
+
+    return isoforest, X
+
+
+def tree_gains(
+    kernel: Callable,
+    estimator: DecisionTreeRegressor,
+    feat_subset: np.ndarray,
+    X: np.ndarray,
+) -> np.ndarray:
+    """Gains of every sample and feature in one tree, computed by `kernel`."""
+
+    tree = estimator.tree_
+    total_tree_gain = np.zeros_like(X, dtype=float)
+
+    kernel(
+        X,
+        feat_subset,
+        tree.children_left,
+        tree.children_right,
+        tree.feature,
+        tree.threshold,
+        iffi._tree_missing_go_to_left(tree),
+        iffi._tree_node_lengths(tree),
+        total_tree_gain,
+    )
+
+    return total_tree_gain
+
+
+@pytest.mark.parametrize("backend", ["numpy", "numba"])
+def test_tree_gain_kernels_match_python(
+    fitted_isoforest: tuple[IsolationForest, np.ndarray], backend: str
+) -> None:
+    if iffi._TREE_GAIN_KERNELS[backend] is None:
+        pytest.skip(f"{backend} isn't installed")
+
+    isoforest, X = fitted_isoforest
+
+    for estimator, estimator_features in zip(
+        isoforest.estimators_, isoforest.estimators_features_
+    ):
+        feat_subset = np.asarray(estimator_features, dtype=int)
+
+        np.testing.assert_allclose(
+            tree_gains(iffi._TREE_GAIN_KERNELS[backend], estimator, feat_subset, X),
+            tree_gains(iffi._python_tree_gains, estimator, feat_subset, X),
+        )
+
+
+def test_python_tree_gains_follow_sklearn_paths(
+    fitted_isoforest: tuple[IsolationForest, np.ndarray],
+) -> None:
+    isoforest, X = fitted_isoforest
+
+    for estimator, estimator_features in zip(
+        isoforest.estimators_, isoforest.estimators_features_
+    ):
+        feat_subset = np.asarray(estimator_features, dtype=int)
+        node_lengths = iffi._tree_node_lengths(estimator.tree_)
+
+        # the gains along a path sum to c(n) of the root minus the path length
+        X_subset = X[:, feat_subset]
+        leaves = estimator.apply(X_subset)
+        depths = np.asarray(estimator.decision_path(X_subset).sum(axis=1)).ravel() - 1
+
+        np.testing.assert_allclose(
+            tree_gains(iffi._python_tree_gains, estimator, feat_subset, X).sum(axis=1),
+            node_lengths[0] - depths - node_lengths[leaves],
+        )
+
+
+def test_numba_threads_are_restored(
+    fitted_isoforest: tuple[IsolationForest, np.ndarray],
+) -> None:
+    numba = pytest.importorskip("numba")
+
+    isoforest, X = fitted_isoforest
+    num_threads = numba.get_num_threads()
+
+    importances = iffi.IsoforestFeatureImportance(
+        estimators=isoforest.estimators_,
+        morphology_data=pd.DataFrame(X),
+        estimators_features=isoforest.estimators_features_,
+        backend="numba",
+        n_jobs=1,
+    )
+
+    for _ in importances.iter_isoforest_importances(chunk_size=100):
+        assert numba.get_num_threads() == num_threads
+
+
+@pytest.fixture(scope="module")
+def morphology_data(
+    fitted_isoforest: tuple[IsolationForest, np.ndarray],
+) -> pd.DataFrame:
+    _, X = fitted_isoforest
+
+    return pd.DataFrame(X, columns=[f"Cells_feature_{i}" for i in range(X.shape[1])])
+
+
+def feature_importance(
+    isoforest: IsolationForest, morphology_data: Union[pd.DataFrame, pq.ParquetFile]
+) -> iffi.IsoforestFeatureImportance:
+    return iffi.IsoforestFeatureImportance(
+        estimators=isoforest.estimators_,
+        morphology_data=morphology_data,
+        estimators_features=isoforest.estimators_features_,
+        feature_names=[f"Cells_feature_{i}" for i in range(isoforest.n_features_in_)],
+        backend="numpy",
+        n_jobs=1,
+    )
+
+
+def test_chunked_importances_match_unchunked(
+    fitted_isoforest: tuple[IsolationForest, np.ndarray],
+    morphology_data: pd.DataFrame,
+    tmp_path: pathlib.Path,
+) -> None:
+    isoforest, _ = fitted_isoforest
+    importancesdf = feature_importance(isoforest, morphology_data)()
+
+    chunkdfs = list(
+        feature_importance(isoforest, morphology_data).iter_isoforest_importances(
+            chunk_size=CHUNK_SIZE
+        )
+    )
+
+    assert len(chunkdfs) == -(-len(morphology_data) // CHUNK_SIZE)
+    pd.testing.assert_frame_equal(pd.concat(chunkdfs), importancesdf)
+
+    # parquet files are read batch by batch, with metadata passed through
+    plate_path = tmp_path / "plate.parquet"
+    morphology_data.assign(Metadata_Well="A01").to_parquet(plate_path, index=False)
+
+    output_path = tmp_path / "importances.parquet"
+    feature_importance(
+        isoforest, pq.ParquetFile(plate_path)
+    ).write_isoforest_importances(
+        output_path, chunk_size=CHUNK_SIZE, metadata_columns=["Metadata_Well"]
+    )
+
+    pd.testing.assert_frame_equal(
+        pd.read_parquet(output_path),
+        importancesdf.assign(Metadata_Well="A01"),
+        check_index_type=False,
+    )
+
+
+def test_sparse_and_top_k_importances_match_dense(
+    fitted_isoforest: tuple[IsolationForest, np.ndarray],
+    morphology_data: pd.DataFrame,
+) -> None:
+    isoforest, _ = fitted_isoforest
+    importances = feature_importance(isoforest, morphology_data)
+    importancesdf = importances()
+
+    sparse_importances = importances.compute_sparse_isoforest_importances(
+        chunk_size=CHUNK_SIZE
+    )
+
+    assert sparse_importances.dtype == np.float32
+    np.testing.assert_allclose(
+        sparse_importances.toarray(), importancesdf.to_numpy(), rtol=1e-5, atol=1e-5
+    )
+
+    topdf = importances.compute_top_k_isoforest_importances(
+        k=TOP_K_FEATURES, chunk_size=CHUNK_SIZE
+    )
+
+    assert topdf.groupby(level=0).size().max() <= TOP_K_FEATURES
+
+    for sample, sampledf in topdf.groupby(level=0):
+        dense_importances = importancesdf.loc[sample]
+        expected = np.sort(dense_importances[dense_importances != 0])[::-1]
+
+        np.testing.assert_array_equal(
+            sampledf["importance_rank"], np.arange(1, len(sampledf) + 1)
+        )
+        np.testing.assert_allclose(
+            sampledf["importance"], expected[:TOP_K_FEATURES], rtol=1e-5, atol=1e-5
+        )
+        np.testing.assert_allclose(
+            sampledf["importance"],
+            dense_importances[sampledf["feature"]],
+            rtol=1e-5,
+            atol=1e-5,
+        )
@@ -0,0 +1,142 @@
+import pathlib
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LogisticRegression
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1] / "utils"))
+from plate_probabilities import predict_plate_probabilities
+
+NUM_CELLS = 400
+FEATURE_COLS = [f"Nuclei_AreaShape_feature_{i}" for i in range(4)]
+META_COLS = [
+    "Metadata_Well",
+    "Metadata_Plate",
+    "Metadata_ObjectNumber_cytoplasm",
+    "Metadata_Site",
+]
+LOC_COLS = ["Nuclei_Location_Center_Y", "Nuclei_Location_Center_X"]
+
+# cells of the normalized data without unnormalized data
+NUM_UNMATCHED_CELLS = 15
+
+
+@pytest.fixture(scope="module")
+def plate_paths(
+    tmp_path_factory: pytest.TempPathFactory,
+) -> tuple[pathlib.Path, pathlib.Path]:
+    rng = np.random.default_rng(0)
+    plate_dir = tmp_path_factory.mktemp("plate")
+
+    metadf = pd.DataFrame(
+        {
+            "Metadata_Well": rng.choice(["A01", "B02"], NUM_CELLS),
+            "Metadata_Plate": "BR00117006",
+            "Metadata_ObjectNumber_cytoplasm": np.arange(NUM_CELLS),
+            "Metadata_Site": rng.integers(1, 4, NUM_CELLS),
+        }
+    )
+
+    # the last model feature isn't in the plate data
+    normdf = metadf.assign(
+        **{col: rng.normal(size=NUM_CELLS) for col in FEATURE_COLS[:-1]}
+    )
+
+    # unnormalized cells are stored in a different order, without some cells
+    unnormdf = (
+        metadf.assign(**{col: rng.uniform(0, 1_000, NUM_CELLS) for col in LOC_COLS})
+        .iloc[NUM_UNMATCHED_CELLS:]
+        .sample(frac=1, random_state=0)
+    )
+
+    norm_plate_path = plate_dir / "norm.parquet"
+    unnorm_plate_path = plate_dir / "unnorm.parquet"
+
+    normdf.to_parquet(norm_plate_path, index=False)
+    unnormdf.to_parquet(unnorm_plate_path, index=False)
+
+    return norm_plate_path, unnorm_plate_path
+
+
+@pytest.fixture(scope="module")
+def models() -> dict[str, LogisticRegression]:
+    rng = np.random.default_rng(1)
+    X = rng.normal(size=(200, len(FEATURE_COLS)))
+    y = rng.choice(["Apoptosis", "Interphase", "Mitosis"], 200)
+
+    return {
+        "final": LogisticRegression().fit(X, y),
+        "shuffled": LogisticRegression().fit(X, rng.permutation(y)),
+    }
+
+
+def test_probabilities_match_merged_predictions(
+    plate_paths: tuple[pathlib.Path, pathlib.Path],
+    models: dict[str, LogisticRegression],
+    tmp_path: pathlib.Path,
+) -> None:
+    norm_plate_path, unnorm_plate_path = plate_paths
+
+    output_path = predict_plate_probabilities(
+        norm_plate_path,
+        unnorm_plate_path,
+        models,
+        FEATURE_COLS,
+        META_COLS,
+        LOC_COLS,
+        tmp_path / "probabilities.parquet",
+    )
+
+    # reference: predict every cell, then merge each model's predictions with
+    # the unnormalized metadata and locations
+    df = pd.read_parquet(norm_plate_path)
+    df[FEATURE_COLS[-1]] = 0
+    df_unnorm = pd.read_parquet(unnorm_plate_path)
+
+    modeldfs = []
+    for model_type, model in models.items():
+        modeldf = pd.DataFrame(
+            model.predict_proba(df[FEATURE_COLS].values), columns=model.classes_
+        )
+        modeldf["Metadata_model_type"] = model_type
+        for meta_col in [
+            "Metadata_ObjectNumber_cytoplasm",
+            "Metadata_Plate",
+            "Metadata_Well",
+            "Metadata_Site",
+        ]:
+            modeldf[meta_col] = df[meta_col]
+        modeldfs.append(modeldf.merge(df_unnorm, how="inner", on=META_COLS))
+
+    expected = pd.concat(modeldfs)
+
+    assert len(expected) == len(models) * (NUM_CELLS - NUM_UNMATCHED_CELLS)
+    pd.testing.assert_frame_equal(pd.read_parquet(output_path), expected)
+    assert not list(tmp_path.glob(".*.tmp"))
+
+
+def test_duplicate_cells_raise(
+    plate_paths: tuple[pathlib.Path, pathlib.Path],
+    models: dict[str, LogisticRegression],
+    tmp_path: pathlib.Path,
+) -> None:
+    norm_plate_path, unnorm_plate_path = plate_paths
+
+    unnormdf = pd.read_parquet(unnorm_plate_path)
+    duplicate_plate_path = tmp_path / "unnorm.parquet"
+    pd.concat([unnormdf, unnormdf.iloc[:1]]).to_parquet(
+        duplicate_plate_path, index=False
+    )
+
+    with pytest.raises(ValueError, match="uniquely identified"):
+        predict_plate_probabilities(
+            norm_plate_path,
+            duplicate_plate_path,
+            models,
+            FEATURE_COLS,
+            META_COLS,
+            LOC_COLS,
+            tmp_path / "probabilities.parquet",
+        )
@@ -0,0 +1,90 @@
+import pathlib
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1] / "utils"))
+import sampled_cell_store as scs
+
+DATASET_NAME = "feature_selected_sc_qc_data"
+
+
+def sampled_cells(plate: str, num_cells: int, **columns: object) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "Metadata_Plate": plate,
+            "Metadata_ObjectNumber": range(num_cells),
+            "Cells_AreaShape_Area": [float(i) for i in range(num_cells)],
+            **columns,
+        }
+    )
+
+
+def test_upsert_replaces_plates(tmp_path: pathlib.Path) -> None:
+    scs.upsert_sampled_plate(
+        sampled_cells("plate_b", 3), tmp_path, DATASET_NAME, "plate_b"
+    )
+    scs.upsert_sampled_plate(
+        sampled_cells("plate_a", 2), tmp_path, DATASET_NAME, "plate_a"
+    )
+
+    # re-sampling a plate replaces its previous sample
+    plate_path = scs.upsert_sampled_plate(
+        sampled_cells("plate_b", 4), tmp_path, DATASET_NAME, "plate_b"
+    )
+
+    assert plate_path == scs.sampled_plate_path(tmp_path, DATASET_NAME, "plate_b")
+    assert sorted(path.name for path in (tmp_path / DATASET_NAME).iterdir()) == [
+        "plate_a.parquet",
+        "plate_b.parquet",
+    ]
+
+    sampleddf = scs.open_sampled_dataset(tmp_path, DATASET_NAME).to_table().to_pandas()
+
+    pd.testing.assert_frame_equal(
+        sampleddf,
+        pd.concat(
+            [sampled_cells("plate_a", 2), sampled_cells("plate_b", 4)],
+            ignore_index=True,
+        ),
+    )
+
+
+def test_open_sampled_dataset_unifies_plate_columns(tmp_path: pathlib.Path) -> None:
+    scs.upsert_sampled_plate(
+        sampled_cells("plate_a", 2, Metadata_pert_iname="DMSO"),
+        tmp_path,
+        DATASET_NAME,
+        "plate_a",
+    )
+    scs.upsert_sampled_plate(
+        sampled_cells("plate_b", 2, Metadata_gene="TP53"),
+        tmp_path,
+        DATASET_NAME,
+        "plate_b",
+    )
+
+    sampled_table = scs.open_sampled_dataset(tmp_path, DATASET_NAME).to_table(
+        columns=["Metadata_pert_iname", "Metadata_gene"]
+    )
+
+    assert sampled_table.column("Metadata_pert_iname").to_pylist() == [
+        "DMSO",
+        "DMSO",
+        None,
+        None,
+    ]
+    assert sampled_table.column("Metadata_gene").to_pylist() == [
+        None,
+        None,
+        "TP53",
+        "TP53",
+    ]
+
+
+def test_open_missing_dataset(tmp_path: pathlib.Path) -> None:
+    (tmp_path / DATASET_NAME).mkdir()
+
+    with pytest.raises(FileNotFoundError, match="No sampled plates"):
+        scs.open_sampled_dataset(tmp_path, DATASET_NAME)
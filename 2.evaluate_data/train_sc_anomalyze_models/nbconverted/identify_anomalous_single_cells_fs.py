@@ -9,15 +9,17 @@
 # In[ ]:
 
 
-import json
 import pathlib
 import sys
 
 import joblib
-import pandas as pd
-import pyarrow.parquet as pq
 from sklearn.ensemble import IsolationForest
 
+sys.path.append(str(pathlib.Path.cwd().parent / "utils"))
+from column_profiles import dataset_feature_columns, write_feature_columns
+from incremental_isolation_forest import fit_isolation_forest_incrementally
+from sampled_cell_store import open_sampled_dataset
+
 
 # ## Define paths
 
@@ -30,16 +32,26 @@ plate_data_path = pathlib.Path(sys.argv[1])
 plate_data_name = plate_data_path.name
 sampled_plate_jump_data_path = sys.argv[2]
 
-sampled_platedf = pd.read_parquet(
-    f"{sampled_plate_jump_data_path}/{plate_data_name}.parquet"
+# Union of the sampled cells of every plate, which is only read once the
+# feature columns are known
+sampled_dataset = open_sampled_dataset(sampled_plate_jump_data_path, plate_data_name)
+
+# Feature columns without missing values in every sampled plate
+feat_cols = dataset_feature_columns(
+    pathlib.Path(sys.argv[3]) / "column_profiles" / plate_data_name
+)
+
+# Record of the feature columns the model is trained with
+write_feature_columns(
+    feat_cols, pathlib.Path(sys.argv[3]) / plate_data_name / "feature_columns.json"
 )
 
-feature_columns_path = (
-    pathlib.Path(sys.argv[3]) / plate_data_name / "feature_columns.json"
-).resolve(strict=True)
+# "fixed" trains every tree, and "incremental" stops adding trees once the
+# anomaly score ranking is stable
+training_mode = sys.argv[5] if len(sys.argv) > 5 else "fixed"
 
-with feature_columns_path.open("r") as feat_cols_obj:
-    feat_cols = json.load(feat_cols_obj)
+if training_mode not in ("fixed", "incremental"):
+    raise ValueError(f"Unknown training mode: {training_mode}")
 
 
 # ### Outputs
@@ -54,22 +66,34 @@ isoforest_path = pathlib.Path(
     isoforest_path / f"{plate_data_name}_isolation_forest.joblib"
 )
 
+# Fit and scoring times of each number of trees (incremental training only)
+tree_benchmark_path = isoforest_path.with_name(
+    f"{plate_data_name}_isolation_forest_tree_benchmark.csv"
+)
+
 
 # ## Train Anomalyze Models
 
 # In[ ]:
 
 
-meta_cols = [col for col in sampled_platedf.columns if "Metadata" in col]
-featdf = sampled_platedf[feat_cols]
+meta_cols = [col for col in sampled_dataset.schema.names if "Metadata" in col]
+featdf = sampled_dataset.to_table(columns=feat_cols).to_pandas()
 
 # If 800 trees are trained with 256 samples per tree, then
 # 800 * 256 gives approximately the expected number of samples per isolation forest.
 # For some of the plate data, this number of samples can barely fit in memory.
 # We also want to maximize the number of trees to learn many patterns for identifying anomalies.
 # 256 is empirically the largest number of samples per tree that allowed outliers to be isolated better.
-isofor = IsolationForest(n_estimators=800, random_state=0, n_jobs=-1)
-isofor.fit(featdf)
+if training_mode == "incremental":
+    isofor, tree_benchmarkdf = fit_isolation_forest_incrementally(
+        featdf, max_estimators=800, random_state=0, n_jobs=-1
+    )
+    tree_benchmarkdf.to_csv(tree_benchmark_path, index=False)
+
+else:
+    isofor = IsolationForest(n_estimators=800, random_state=0, n_jobs=-1)
+    isofor.fit(featdf)
 
 joblib.dump(isofor, isoforest_path)
 
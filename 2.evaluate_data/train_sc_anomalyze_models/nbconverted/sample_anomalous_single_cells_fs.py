@@ -2,21 +2,21 @@
 # coding: utf-8
 
 # # Sample data from each well
-# Deterministically sample data from each plate dataset and get the intersection of all features not containing nans.
+# Deterministically sample data from each plate dataset and save the missing values of each column.
+# identify_anomalous_single_cells_fs trains on the intersection of all features without missing values.
 
 # ### Import Libraries
 
 # In[ ]:
 
 
-import json
 import pathlib
 import sys
 
-import pandas as pd
-
 sys.path.append(str(pathlib.Path.cwd().parent / "utils"))
+from column_profiles import profile_parquet_columns, write_column_profile
 from DeterministicSampling import DeterministicSampling
+from sampled_cell_store import upsert_sampled_plate
 
 
 # ## Define paths
@@ -30,13 +30,12 @@ from DeterministicSampling import DeterministicSampling
 sc_data_path = pathlib.Path(sys.argv[1]).resolve(strict=True)
 sc_data_dir_name = sc_data_path.parent.name
 plate_path = pathlib.Path(sc_data_path).resolve(strict=True)
-platedf = pd.read_parquet(plate_path)
 
 sampled_plate_jump_path = pathlib.Path(sys.argv[2])
 
-anomaly_data_path = pathlib.Path(sys.argv[3]) / sc_data_dir_name
-anomaly_data_path.mkdir(parents=True, exist_ok=True)
-feat_col_path = anomaly_data_path / "feature_columns.json"
+# Missing value counts of each plate's columns, which are intersected across
+# plates for the feature columns when training
+column_profiles_path = pathlib.Path(sys.argv[3]) / "column_profiles" / sc_data_dir_name
 
 
 # ### Outputs
@@ -44,28 +43,23 @@ feat_col_path = anomaly_data_path / "feature_columns.json"
 # In[2]:
 
 
-plate_data_path = sampled_plate_jump_path / f"{plate_path.parent.name}.parquet"
+# Sampled cells are stored in one file per plate under a directory per dataset
+sampled_dataset_name = plate_path.parent.name
+sampled_plate_name = plate_path.stem
 
 
-# ## Save feature columns that don't contain NaNs
+# ## Save the missing values of each column
 
 # In[ ]:
 
 
-feat_cols = []
-non_na_cols = platedf.columns[platedf.notna().all()].tolist()
-non_na_cols = [col for col in non_na_cols if not "Metadata" in col]
-
-if feat_col_path.exists():
-    with feat_col_path.open("r") as feat_col_obj:
-        feat_cols = json.load(feat_col_obj)
-        feat_cols = list(set(non_na_cols) & set(feat_cols))
-
-else:
-    feat_cols = non_na_cols
-
-with feat_col_path.open("w") as feat_col_obj:
-    json.dump(feat_cols, feat_col_obj)
+# Null counts are read from the parquet row group statistics, while NaN counts
+# read the floating point feature columns one at a time
+write_column_profile(
+    profile_parquet_columns(plate_path),
+    column_profiles_path,
+    plate_name=plate_path.stem,
+)
 
 
 # ## Sample single-cell data by Hash
@@ -73,8 +67,9 @@ with feat_col_path.open("w") as feat_col_obj:
 # In[3]:
 
 
+# Only the sampled rows of the plate are loaded
 ds = DeterministicSampling(
-    _platedf=platedf,
+    _platedf=plate_path,
     # Number of samples per plate needed to train the JUMP isolation forests
     # See identify_anomalous_single_cells_fs.py for more details
     # Only 4_000 are needed, however each sampling will likely not be exactly 4_000 samples
@@ -89,15 +84,16 @@ ds = DeterministicSampling(
 sampled_platedf = ds.sample_plate_deterministically(_sample_strategy="well_sampling")
 
 
-# ## Concatenate and Save Sampled Plate data
+# ## Save Sampled Plate data
 
 # In[4]:
 
 
-if plate_data_path.exists():
-    sampled_platedf = pd.concat(
-        [sampled_platedf, pd.read_parquet(plate_data_path)], axis=0
-    )
-
-sampled_platedf.to_parquet(plate_data_path)
+# Re-sampling a plate replaces its previous sample
+upsert_sampled_plate(
+    sampled_platedf,
+    sampled_plate_jump_path,
+    dataset_name=sampled_dataset_name,
+    plate_name=sampled_plate_name,
+)
 
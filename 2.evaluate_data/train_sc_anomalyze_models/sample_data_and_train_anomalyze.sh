@@ -5,6 +5,10 @@
 conda init bash
 conda activate jump_sc
 
+# "fixed" (default) trains every tree, and "incremental" stops adding trees once the
+# anomaly scores are stable, while also benchmarking each number of trees
+training_mode="${1:-fixed}"
+
 sampled_plate_jump_data=$(mktemp -d)
 
 cleanup() {
@@ -45,7 +49,7 @@ for plate_dir in "${plate_paths[@]}"; do
 
         echo -e "\nTraining on sampled data from $plate_dir"
 
-        /usr/bin/time -v python3 "$py_path/identify_anomalous_single_cells_fs.py" "$plate_dir" "$sampled_plate_jump_data" "$feature_column_path" "$isoforest_path"
+        /usr/bin/time -v python3 "$py_path/identify_anomalous_single_cells_fs.py" "$plate_dir" "$sampled_plate_jump_data" "$feature_column_path" "$isoforest_path" "$training_mode"
 
     else
         echo "Error: '$plate_dir' is not a directory."
@@ -1,30 +1,116 @@
+import pathlib
 import warnings
+from typing import Union
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from farmhash import Fingerprint64
 
 
+def _allocate_samples(
+    group_sizes: np.ndarray, num_samples: int, proportional: bool = False
+) -> np.ndarray:
+    """
+    Number of samples to select from each group, which sum to exactly
+    num_samples (or every row, if the groups have fewer rows).
+    Groups get equal shares by default, where the shares of groups with too few
+    rows are shared by the other groups, or shares proportional to their sizes.
+    Fractional shares are rounded with the largest remainder method, where ties
+    go to the first groups.
+    """
+
+    group_sizes = np.asarray(group_sizes, dtype=np.int64)
+    num_samples = min(num_samples, int(group_sizes.sum()))
+
+    if not len(group_sizes) or num_samples <= 0:
+        return np.zeros(len(group_sizes), dtype=np.int64)
+
+    if proportional:
+        shares = num_samples * group_sizes / group_sizes.sum()
+
+    else:
+        # Fill the smallest groups first, and split the rest equally, where the
+        # rest is divided once so the groups get identical (tied) shares
+        shares = group_sizes.astype(float)
+        remaining_samples = num_samples
+        size_order = np.argsort(group_sizes, kind="stable")
+
+        for num_filled, group_idx in enumerate(size_order):
+            num_unfilled = len(group_sizes) - num_filled
+
+            if group_sizes[group_idx] * num_unfilled > remaining_samples:
+                shares[size_order[num_filled:]] = remaining_samples / num_unfilled
+                break
+
+            remaining_samples -= group_sizes[group_idx]
+
+    allocations = np.minimum(np.floor(shares).astype(np.int64), group_sizes)
+    remainders = np.where(allocations < group_sizes, shares - allocations, -1)
+
+    num_rounded_up = num_samples - allocations.sum()
+    allocations[np.argsort(-remainders, kind="stable")[:num_rounded_up]] += 1
+
+    return allocations
+
+
 class DeterministicSampling:
 
     def __init__(
         self,
-        _platedf: pd.DataFrame,
+        _platedf: Union[pd.DataFrame, str, pathlib.Path],
         _samples_per_plate: int,
         _plate_column: str,
         _well_column: str,
         _cell_id_columns: list[str],
+        _hash_method: str = "farmhash",
     ):
+        if _hash_method not in ("farmhash", "hash_array"):
+            raise ValueError(f"Unknown hash method: {_hash_method}")
+
+        self._plate_path = None
+
+        # Only the id columns are read from parquet files until the sample is known
+        if not isinstance(_platedf, pd.DataFrame):
+            self._plate_path = pathlib.Path(_platedf)
+            _platedf = pq.read_table(
+                self._plate_path,
+                columns=[_plate_column, _well_column] + _cell_id_columns,
+            ).to_pandas()
+
         self._platedf = _platedf
         self._samples_per_plate = _samples_per_plate
         self._plate_column = _plate_column
         self._well_column = _well_column
         self._cell_id_columns = _cell_id_columns
+        self._hash_method = _hash_method
         self._divisor = 10_000
 
     """
     _plate_column, _well_column and _cell_id_columns store column names, and must be present in _platedf.
     _cell_id_columns will be used with _plate_column and _well_column to uniquely identify each cell.
     For example, _cell_id_columns in some projects could be ["Metadata_Site", "Metadata_ObjectNumber"]
+
+    _platedf can also be the path of a plate parquet file. Only the id columns are
+    read to select the sample, and only the sampled rows are then read from the
+    row groups containing them, so memory scales with the sample, not the plate.
+    The platedf property then only contains the id columns.
+
+    _sample_strategy in sample_plate_deterministically selects how cells are sampled:
+    "well_sampling" keeps cells below a hash cutoff in each well, which yields about
+    _samples_per_plate cells.
+    "exact_well_sampling" ranks the cells of each well by hash and keeps exactly
+    _samples_per_plate cells, allocated equally to the wells or proportionally to
+    their sizes (_allocation="proportional").
+    Other strategies keep cells below one hash cutoff for the whole plate.
+
+    _hash_method selects how the cells are hashed:
+    "farmhash" fingerprints the concatenated string of each cell's id columns, which
+    reproduces the selections of previous samplings.
+    "hash_array" combines per-column 64-bit hashes of the id column values
+    (pd.util.hash_pandas_object) without building strings, which is faster,
+    but selects different cells than "farmhash".
     """
 
     @property
@@ -37,24 +123,134 @@ class DeterministicSampling:
         hash_cols = [self._plate_column, self._well_column] + self._cell_id_columns
         self._group_cols = hash_cols[0:2]
 
-        combined_strs = self._platedf[hash_cols].astype(str).agg("".join, axis=1)
+        if self._hash_method == "hash_array":
+            hashes = pd.util.hash_pandas_object(
+                self._platedf[hash_cols], index=False
+            ).to_numpy()
 
-        # Vectorized hash mapping
-        self._platedf["Metadata_farmhash"] = combined_strs.map(
-            lambda x: Fingerprint64(x) % self._divisor
+        else:
+            # Same strings as joining each row's id columns, but concatenated
+            # column-wise instead of with a python call per row
+            combined_strs = self._platedf[hash_cols[0]].astype(str)
+            for hash_col in hash_cols[1:]:
+                combined_strs = combined_strs + self._platedf[hash_col].astype(str)
+
+            hashes = np.fromiter(
+                (Fingerprint64(combined_str) for combined_str in combined_strs),
+                dtype=np.uint64,
+                count=len(combined_strs),
+            )
+
+        # The full hashes rank cells for exact sampling
+        self._hashes = hashes
+        self._platedf["Metadata_farmhash"] = (hashes % np.uint64(self._divisor)).astype(
+            np.int64
         )
 
-    def sample_plate_deterministically(
-        self, _sample_strategy: str = "well_sampling"
+    def __read_sampled_rows(self, sampled_keydf: pd.DataFrame) -> pd.DataFrame:
+        # Read the sampled rows (positions in the file) row group by row group
+
+        pq_file = pq.ParquetFile(self._plate_path)
+        positions = sampled_keydf.index.to_numpy()
+
+        read_order = np.argsort(positions, kind="stable")
+        sorted_positions = positions[read_order]
+
+        row_group_offsets = np.cumsum(
+            [0]
+            + [
+                pq_file.metadata.row_group(i).num_rows
+                for i in range(pq_file.num_row_groups)
+            ]
+        )
+
+        sampled_tables = []
+
+        for i in range(pq_file.num_row_groups):
+            start, stop = np.searchsorted(
+                sorted_positions, row_group_offsets[i : i + 2], side="left"
+            )
+
+            if start == stop:
+                continue
+
+            sampled_tables.append(
+                pq_file.read_row_group(i).take(
+                    sorted_positions[start:stop] - row_group_offsets[i]
+                )
+            )
+
+        if sampled_tables:
+            sampled_table = pa.concat_tables(sampled_tables)
+        else:
+            sampled_table = pq_file.schema_arrow.empty_table()
+
+        # Restore the sampled order
+        sampled_table = sampled_table.take(np.argsort(read_order, kind="stable"))
+
+        sampleddf = sampled_table.to_pandas()
+        sampleddf.index = sampled_keydf.index
+        sampleddf["Metadata_farmhash"] = sampled_keydf["Metadata_farmhash"]
+
+        return sampleddf
+
+    def __sample_exact(self, _allocation: str) -> pd.DataFrame:
+        # Select exactly the allocated number of lowest-hash cells in each well
+
+        group_idxs = self._platedf.groupby(self._group_cols).ngroup().to_numpy()
+        positions = np.flatnonzero(group_idxs >= 0)
+        group_idxs = group_idxs[positions]
+
+        group_sizes = np.bincount(group_idxs)
+        allocations = _allocate_samples(
+            group_sizes,
+            self._samples_per_plate,
+            proportional=_allocation == "proportional",
+        )
 
+        # Rank cells by hash within each well in one pass, where ties are
+        # broken by position to stay deterministic
+        rank_order = np.lexsort((positions, self._hashes[positions], group_idxs))
+        group_starts = np.cumsum(group_sizes) - group_sizes
+        ranks = np.arange(len(rank_order)) - group_starts[group_idxs[rank_order]]
+
+        sampled_rows = rank_order[ranks < allocations[group_idxs[rank_order]]]
+
+        # Wells in group order and cells in plate order, like well_sampling
+        sampled_rows = sampled_rows[
+            np.lexsort((positions[sampled_rows], group_idxs[sampled_rows]))
+        ]
+
+        return self._platedf.iloc[positions[sampled_rows]]
+
+    def sample_plate_deterministically(
+        self, _sample_strategy: str = "well_sampling", _allocation: str = "equal"
     ) -> pd.DataFrame:
+        if _allocation not in ("equal", "proportional"):
+            raise ValueError(f"Unknown allocation: {_allocation}")
+
         self.__hash_data()
 
+        if _sample_strategy == "exact_well_sampling":
+            sampleddf = self.__sample_exact(_allocation)
+
+            if self._plate_path is not None:
+                sampleddf = self.__read_sampled_rows(sampleddf)
+
+            return sampleddf.reset_index(drop=True)
+
         if _sample_strategy != "well_sampling":
             mod_cutoff = (
                 self._samples_per_plate / self._platedf.shape[0]
             ) * self._divisor
-            return self._platedf.loc[self._platedf["Metadata_farmhash"] < mod_cutoff]
+            sampleddf = self._platedf.loc[
+                self._platedf["Metadata_farmhash"] < mod_cutoff
+            ]
+
+            if self._plate_path is not None:
+                sampleddf = self.__read_sampled_rows(sampleddf)
+
+            return sampleddf
 
         grouped = self._platedf.groupby(self._group_cols)
 
@@ -62,7 +258,7 @@ class DeterministicSampling:
         samples_per_group = max(1, self._samples_per_plate // num_groups)
 
         # Fixed sampling per group using hash
-        return pd.concat(
+        sampleddf = pd.concat(
             (
                 group_df.loc[
                     group_df["Metadata_farmhash"]
@@ -70,5 +266,9 @@ class DeterministicSampling:
                 ]
                 for _, group_df in grouped
             ),
-            ignore_index=True,
         )
+
+        if self._plate_path is not None:
+            sampleddf = self.__read_sampled_rows(sampleddf)
+
+        return sampleddf.reset_index(drop=True)
@@ -0,0 +1,328 @@
+import os
+import pathlib
+from typing import Optional, Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Hive partition keys of the partitioned anomaly layout
+ANOMALY_PARTITION_COLS = ["Metadata_Plate", "Metadata_Well"]
+
+
+def open_anomaly_dataset(
+    anomaly_dataset_path: Union[str, pathlib.Path], plate: Optional[str] = None
+) -> ds.Dataset:
+    """
+    Open the anomaly results of a dataset as a pyarrow dataset, without reading
+    any data.
+    Hive-partitioned layouts (e.g. Metadata_Plate=.../) are detected, so plate
+    filters skip whole directories; otherwise filters are pushed down to the
+    row group statistics of each parquet file.
+
+    Parameters
+    ----------
+    anomaly_dataset_path : str | pathlib.Path
+        Directory with the anomaly parquet files of one dataset.
+    plate : str | None
+        Optional plate to restrict the dataset to, when the anomaly results
+        are stored in one directory per plate file (named after the plate).
+
+    Returns
+    -------
+    ds.Dataset
+        Lazily scanned anomaly results.
+    """
+
+    anomaly_dataset_path = pathlib.Path(anomaly_dataset_path)
+    dataset_dirs = [path for path in anomaly_dataset_path.iterdir() if path.is_dir()]
+
+    if any("=" in path.name for path in dataset_dirs):
+        plate_path = anomaly_dataset_path / f"Metadata_Plate={plate}"
+
+        if plate is None or not plate_path.is_dir():
+            return ds.dataset(
+                anomaly_dataset_path, format="parquet", partitioning="hive"
+            )
+
+        # Plates are opened on their own, because plates of different treatment
+        # types have different metadata columns
+        if (plate_path / "_metadata").is_file():
+            return ds.parquet_dataset(
+                plate_path / "_metadata",
+                partitioning="hive",
+                partition_base_dir=str(anomaly_dataset_path),
+            )
+
+        return ds.dataset(
+            [str(path) for path in sorted(plate_path.rglob("*.parquet"))],
+            format="parquet",
+            partitioning="hive",
+            partition_base_dir=str(anomaly_dataset_path),
+        )
+
+    plate_dirs = [
+        path
+        for path in dataset_dirs
+        if plate is not None and path.name.startswith(plate)
+    ]
+
+    # Only list the plate's own files, if the plate has its own directory
+    if plate_dirs:
+        return ds.dataset(
+            [
+                str(path)
+                for plate_dir in plate_dirs
+                for path in sorted(plate_dir.rglob("*.parquet"))
+            ],
+            format="parquet",
+        )
+
+    return ds.dataset(
+        [str(path) for path in sorted(anomaly_dataset_path.rglob("*.parquet"))],
+        format="parquet",
+    )
+
+
+def plate_filter(plate: str) -> ds.Expression:
+    """Filter expression which keeps the cells of one plate."""
+
+    return ds.field("Metadata_Plate") == plate
+
+
+def list_anomaly_plates(anomaly_dataset: ds.Dataset) -> list[str]:
+    """Plates in the anomaly dataset, reading only the plate column."""
+
+    return sorted(
+        anomaly_dataset.to_table(columns=["Metadata_Plate"])
+        .column("Metadata_Plate")
+        .unique()
+        .to_pylist()
+    )
+
+
+def read_plate_anomalies(
+    anomaly_dataset: ds.Dataset,
+    plate: str,
+    columns: Optional[list[str]] = None,
+    filter_expr: Optional[ds.Expression] = None,
+) -> pd.DataFrame:
+    """
+    Read the anomaly results of one plate, with the plate filter and column
+    projection pushed down to the scan.
+
+    Parameters
+    ----------
+    anomaly_dataset : ds.Dataset
+        Anomaly results from `open_anomaly_dataset`.
+    plate : str
+        Plate to read.
+    columns : list[str] | None
+        Columns to read. All columns are read by default.
+    filter_expr : ds.Expression | None
+        Optional additional filter.
+
+    Returns
+    -------
+    pd.DataFrame
+        Anomaly results of the plate.
+    """
+
+    plate_filter_expr = plate_filter(plate)
+
+    if filter_expr is not None:
+        plate_filter_expr &= filter_expr
+
+    return anomaly_dataset.to_table(
+        columns=columns, filter=plate_filter_expr
+    ).to_pandas()
+
+
+def stream_top_k_anomalies(
+    anomaly_dataset: ds.Dataset,
+    k: int,
+    largest: bool = True,
+    filter_expr: Optional[ds.Expression] = None,
+    columns: Optional[list[str]] = None,
+    score_column: str = "Result_anomaly_score",
+) -> pd.DataFrame:
+    """
+    Select the k cells with the largest (or smallest) anomaly scores, while
+    scanning the anomaly dataset one record batch at a time.
+    Only the running top-k cells are kept in memory.
+
+    Parameters
+    ----------
+    anomaly_dataset : ds.Dataset
+        Anomaly results from `open_anomaly_dataset`.
+    k : int
+        Number of cells to select.
+    largest : bool
+        Select the largest scores if True, and the smallest scores otherwise.
+    filter_expr : ds.Expression | None
+        Filter pushed down to the scan, e.g. `plate_filter(plate)`.
+    columns : list[str] | None
+        Columns to read. All columns are read by default.
+    score_column : str
+        Column to rank the cells by.
+
+    Returns
+    -------
+    pd.DataFrame
+        The selected cells, ordered from the most to the least extreme score.
+    """
+
+    if columns is not None and score_column not in columns:
+        columns = [*columns, score_column]
+
+    topdf = None
+
+    for batch in anomaly_dataset.to_batches(columns=columns, filter=filter_expr):
+        if not batch.num_rows:
+            continue
+
+        batchdf = batch.to_pandas()
+
+        if topdf is not None:
+            batchdf = pd.concat([topdf, batchdf], ignore_index=True)
+
+        topdf = (
+            batchdf.nlargest(k, score_column)
+            if largest
+            else batchdf.nsmallest(k, score_column)
+        )
+
+    if topdf is None:
+        return (
+            anomaly_dataset.schema.empty_table()
+            .select(columns or anomaly_dataset.schema.names)
+            .to_pandas()
+        )
+
+    return topdf.reset_index(drop=True)
+
+
+def write_plate_metadata(plate_path: Union[str, pathlib.Path]) -> pathlib.Path:
+    """
+    Write a `_metadata` summary file of a plate partition, which collects the
+    footers (schema and row group statistics) of all of the plate's files, so
+    readers can prune row groups without opening every file.
+
+    Parameters
+    ----------
+    plate_path : str | pathlib.Path
+        Plate partition directory (Metadata_Plate=...).
+
+    Returns
+    -------
+    pathlib.Path
+        Path of the `_metadata` file.
+    """
+
+    plate_path = pathlib.Path(plate_path)
+    metadata_collector = []
+    schema = None
+
+    for path in sorted(plate_path.rglob("*.parquet")):
+        file_metadata = pq.read_metadata(path)
+        file_metadata.set_file_path(path.relative_to(plate_path).as_posix())
+        metadata_collector.append(file_metadata)
+
+        if schema is None:
+            schema = pq.read_schema(path)
+
+    metadata_path = plate_path / "_metadata"
+    tmp_metadata_path = plate_path / "_metadata.tmp"
+
+    # Replaced atomically, so readers never see a partially written summary
+    pq.write_metadata(schema, tmp_metadata_path, metadata_collector=metadata_collector)
+    os.replace(tmp_metadata_path, metadata_path)
+
+    return metadata_path
+
+
+def remove_partitioned_anomalies(
+    anomaly_dataset_path: Union[str, pathlib.Path], basename: str
+) -> None:
+    """
+    Remove the files with the `basename` prefix from a partitioned anomaly
+    dataset, along with the `_metadata` summary files of their plates, so the
+    files of a previous run aren't mixed with the files of a new run.
+
+    Parameters
+    ----------
+    anomaly_dataset_path : str | pathlib.Path
+        Root directory of the partitioned anomaly dataset.
+    basename : str
+        Prefix of the file names to remove.
+    """
+
+    for path in pathlib.Path(anomaly_dataset_path).glob(
+        f"Metadata_Plate=*/Metadata_Well=*/{basename}-*.parquet"
+    ):
+        path.unlink()
+        (path.parent.parent / "_metadata").unlink(missing_ok=True)
+
+
+def write_partitioned_anomalies(
+    anomdf: pd.DataFrame,
+    anomaly_dataset_path: Union[str, pathlib.Path],
+    basename: str,
+    max_rows_per_group: int = 10_000,
+    write_metadata: bool = True,
+) -> None:
+    """
+    Write anomaly results as a hive-partitioned dataset
+    (Metadata_Plate=.../Metadata_Well=.../), where the rows of each well are
+    sorted by anomaly score, so row group statistics on Result_anomaly_score
+    can be used to prune by score range.
+    Existing files with the same names are replaced, while other files of the
+    partitions are kept, so the results of a plate can be written in batches
+    (with a different basename per batch).
+
+    Parameters
+    ----------
+    anomdf : pd.DataFrame
+        Anomaly results (Metadata and Result columns).
+    anomaly_dataset_path : str | pathlib.Path
+        Root directory of the partitioned anomaly dataset.
+    basename : str
+        Prefix of the written file names.
+    max_rows_per_group : int
+        Maximum number of rows per row group.
+    write_metadata : bool
+        Whether to write the `_metadata` summary file of each written plate,
+        which can instead be written once after the last batch with
+        `write_plate_metadata`.
+    """
+
+    anomaly_dataset_path = pathlib.Path(anomaly_dataset_path)
+
+    anomaly_table = pa.Table.from_pandas(
+        anomdf.sort_values(ANOMALY_PARTITION_COLS + ["Result_anomaly_score"]),
+        preserve_index=False,
+    )
+
+    ds.write_dataset(
+        anomaly_table,
+        anomaly_dataset_path,
+        format="parquet",
+        partitioning=ds.partitioning(
+            pa.schema(
+                [anomaly_table.schema.field(col) for col in ANOMALY_PARTITION_COLS]
+            ),
+            flavor="hive",
+        ),
+        basename_template=f"{basename}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+        max_rows_per_group=max_rows_per_group,
+        min_rows_per_group=min(max_rows_per_group, 1_000),
+        file_options=ds.ParquetFileFormat().make_write_options(write_statistics=True),
+    )
+
+    if not write_metadata:
+        return
+
+    for plate in anomdf["Metadata_Plate"].unique():
+        write_plate_metadata(anomaly_dataset_path / f"Metadata_Plate={plate}")
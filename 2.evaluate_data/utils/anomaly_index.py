@@ -0,0 +1,325 @@
+import heapq
+import itertools
+import os
+import pathlib
+from typing import Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+# Number of the most anomalous cells kept for each plate
+ANOMALY_INDEX_TOP_K = 10_000
+
+# Histogram bins shared by every plate, so histograms can be summed across plates.
+# Anomaly scores (decision_function) are within [-1, 1]
+SCORE_HISTOGRAM_EDGES = np.linspace(-1.0, 1.0, 2_001)
+
+TOP_K_SUFFIX = "_top_k.parquet"
+SCORE_HISTOGRAM_SUFFIX = "_score_histogram.parquet"
+
+
+def _write_parquet_atomic(df: pd.DataFrame, path: pathlib.Path) -> None:
+    """Write a parquet file, so readers never see a partially written file."""
+
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+class AnomalyIndexBuilder:
+    """
+    Collects the anomaly score histogram and the most anomalous cells of each
+    plate batch-by-batch, which are written as a small per-plate index.
+    Global top-k and percentile queries then only read the index
+    (`global_top_k_anomalies` and `anomaly_score_quantiles`).
+    """
+
+    def __init__(self: "AnomalyIndexBuilder", top_k: int = ANOMALY_INDEX_TOP_K) -> None:
+        """
+        Parameters
+        ----------
+        top_k : int
+            Number of the most anomalous cells to keep for each plate.
+        """
+
+        self.top_k = top_k
+        self._topdfs: dict[str, pd.DataFrame] = {}
+        self._histograms: dict[str, np.ndarray] = {}
+
+    def update(self: "AnomalyIndexBuilder", anomdf: pd.DataFrame) -> None:
+        """
+        Add a batch of anomaly results (Metadata and Result columns).
+        Only the running top-k cells of each plate are kept in memory.
+        """
+
+        for plate, platedf in anomdf.groupby("Metadata_Plate", sort=False):
+            # Scores outside of the histogram range are counted in the edge bins
+            counts, _ = np.histogram(
+                np.clip(
+                    platedf["Result_anomaly_score"].to_numpy(),
+                    SCORE_HISTOGRAM_EDGES[0],
+                    SCORE_HISTOGRAM_EDGES[-1],
+                ),
+                bins=SCORE_HISTOGRAM_EDGES,
+            )
+            self._histograms[plate] = self._histograms.get(plate, 0) + counts
+
+            candidatedf = platedf
+
+            if plate in self._topdfs:
+                candidatedf = pd.concat(
+                    [self._topdfs[plate], platedf], ignore_index=True
+                )
+
+            self._topdfs[plate] = candidatedf.nsmallest(
+                self.top_k, "Result_anomaly_score"
+            )
+
+    def write(
+        self: "AnomalyIndexBuilder", anomaly_index_path: Union[str, pathlib.Path]
+    ) -> list[pathlib.Path]:
+        """
+        Write the top-k cells (sorted from the most anomalous) and the nonzero
+        score histogram bins of each plate.
+
+        Parameters
+        ----------
+        anomaly_index_path : str | pathlib.Path
+            Directory of the anomaly index of one dataset.
+
+        Returns
+        -------
+        list[pathlib.Path]
+            Paths of the written index files.
+        """
+
+        anomaly_index_path = pathlib.Path(anomaly_index_path)
+        anomaly_index_path.mkdir(parents=True, exist_ok=True)
+
+        index_paths = []
+
+        for plate, topdf in self._topdfs.items():
+            counts = self._histograms[plate]
+            bins = np.flatnonzero(counts)
+
+            histogramdf = pd.DataFrame(
+                {
+                    "Metadata_Plate": plate,
+                    "bin_start": SCORE_HISTOGRAM_EDGES[bins],
+                    "bin_end": SCORE_HISTOGRAM_EDGES[bins + 1],
+                    "count": counts[bins],
+                }
+            )
+
+            top_k_path = anomaly_index_path / f"{plate}{TOP_K_SUFFIX}"
+            histogram_path = anomaly_index_path / f"{plate}{SCORE_HISTOGRAM_SUFFIX}"
+
+            _write_parquet_atomic(topdf.reset_index(drop=True), top_k_path)
+            _write_parquet_atomic(histogramdf, histogram_path)
+
+            index_paths += [top_k_path, histogram_path]
+
+        return index_paths
+
+
+def _plate_index_paths(
+    anomaly_index_path: Union[str, pathlib.Path],
+    suffix: str,
+    plates: Optional[Sequence[str]] = None,
+) -> list[pathlib.Path]:
+    """Index files of the plates, where plates without an index are skipped."""
+
+    anomaly_index_path = pathlib.Path(anomaly_index_path)
+
+    if plates is None:
+        return sorted(anomaly_index_path.glob(f"*{suffix}"))
+
+    return [
+        anomaly_index_path / f"{plate}{suffix}"
+        for plate in dict.fromkeys(plates)
+        if (anomaly_index_path / f"{plate}{suffix}").is_file()
+    ]
+
+
+def read_score_histograms(
+    anomaly_index_path: Union[str, pathlib.Path],
+    plates: Optional[Sequence[str]] = None,
+) -> pd.DataFrame:
+    """
+    Read the anomaly score histograms of plates.
+
+    Parameters
+    ----------
+    anomaly_index_path : str | pathlib.Path
+        Directory of the anomaly index of one dataset.
+    plates : Sequence[str] | None
+        Plates to read. All indexed plates are read by default.
+
+    Returns
+    -------
+    pd.DataFrame
+        Nonzero histogram bins (Metadata_Plate, bin_start, bin_end, count).
+    """
+
+    histogram_paths = _plate_index_paths(
+        anomaly_index_path, SCORE_HISTOGRAM_SUFFIX, plates
+    )
+
+    if not histogram_paths:
+        raise FileNotFoundError(f"No score histograms in {anomaly_index_path}")
+
+    return pd.concat(
+        [pd.read_parquet(path) for path in histogram_paths], ignore_index=True
+    )
+
+
+def anomaly_score_quantiles(
+    anomaly_index_path: Union[str, pathlib.Path],
+    q: Union[float, Sequence[float]],
+    plates: Optional[Sequence[str]] = None,
+) -> np.ndarray:
+    """
+    Approximate anomaly score quantiles across plates from the merged score
+    histograms, which are exact up to the histogram bin width (0.001).
+
+    Parameters
+    ----------
+    anomaly_index_path : str | pathlib.Path
+        Directory of the anomaly index of one dataset.
+    q : float | Sequence[float]
+        Quantiles within [0, 1], e.g. 0.01 for the score below which the 1%
+        most anomalous cells are.
+    plates : Sequence[str] | None
+        Plates to include. All indexed plates are included by default.
+
+    Returns
+    -------
+    np.ndarray
+        Anomaly score of each quantile.
+    """
+
+    histogramdf = (
+        read_score_histograms(anomaly_index_path, plates)
+        .groupby(["bin_start", "bin_end"], as_index=False)["count"]
+        .sum()
+        .sort_values("bin_start")
+    )
+
+    q = np.atleast_1d(np.asarray(q, dtype=float))
+
+    if np.any((q < 0) | (q > 1)):
+        raise ValueError("Quantiles must be within [0, 1]")
+
+    counts = histogramdf["count"].to_numpy()
+    cum_counts = np.cumsum(counts)
+    targets = q * cum_counts[-1]
+
+    # Interpolate linearly within the bin containing each quantile
+    bins = np.minimum(
+        np.searchsorted(cum_counts, targets, side="left"), len(cum_counts) - 1
+    )
+    prev_counts = cum_counts[bins] - counts[bins]
+    bin_fractions = np.clip((targets - prev_counts) / counts[bins], 0, 1)
+
+    bin_starts = histogramdf["bin_start"].to_numpy()[bins]
+    bin_ends = histogramdf["bin_end"].to_numpy()[bins]
+
+    return bin_starts + bin_fractions * (bin_ends - bin_starts)
+
+
+def global_top_k_anomalies(
+    anomaly_index_path: Union[str, pathlib.Path],
+    k: int,
+    plates: Optional[Sequence[str]] = None,
+    columns: Optional[list[str]] = None,
+) -> pd.DataFrame:
+    """
+    Select the k most anomalous cells (lowest anomaly scores) across plates,
+    by merging the sorted per-plate top-k files with a heap.
+
+    Parameters
+    ----------
+    anomaly_index_path : str | pathlib.Path
+        Directory of the anomaly index of one dataset.
+    k : int
+        Number of cells to select.
+    plates : Sequence[str] | None
+        Plates to select from, e.g. every compound plate.
+        All indexed plates are included by default.
+    columns : list[str] | None
+        Columns to read. All columns are read by default.
+
+    Returns
+    -------
+    pd.DataFrame
+        The selected cells, ordered from the most anomalous.
+        Columns missing from some plates (e.g. treatment columns of different
+        perturbation types) are null for those plates.
+
+    Raises
+    ------
+    ValueError
+        If a plate may have more of the k cells than its index stores.
+    """
+
+    top_k_paths = _plate_index_paths(anomaly_index_path, TOP_K_SUFFIX, plates)
+
+    if not top_k_paths:
+        raise FileNotFoundError(f"No top-k anomaly files in {anomaly_index_path}")
+
+    if columns is not None and "Result_anomaly_score" not in columns:
+        columns = [*columns, "Result_anomaly_score"]
+
+    topdfs = [pd.read_parquet(path, columns=columns) for path in top_k_paths]
+
+    selected = list(
+        itertools.islice(
+            heapq.merge(
+                *[
+                    zip(
+                        topdf["Result_anomaly_score"].to_numpy(),
+                        itertools.repeat(plate_idx),
+                        range(len(topdf)),
+                    )
+                    for plate_idx, topdf in enumerate(topdfs)
+                ]
+            ),
+            k,
+        )
+    )
+
+    # A plate whose top-k cells were all selected may have more cells which
+    # belong in the global top-k, but aren't in the index: any of them when
+    # fewer than k cells were selected, or those scoring below the k-th cell
+    histogramdf = read_score_histograms(
+        anomaly_index_path,
+        [path.name[: -len(TOP_K_SUFFIX)] for path in top_k_paths],
+    )
+    plate_counts = histogramdf.groupby("Metadata_Plate")["count"].sum()
+    num_selected = np.bincount(
+        [plate_idx for _, plate_idx, _ in selected], minlength=len(topdfs)
+    )
+
+    for plate_idx, (path, topdf) in enumerate(zip(top_k_paths, topdfs)):
+        plate = path.name[: -len(TOP_K_SUFFIX)]
+
+        if (
+            num_selected[plate_idx] == len(topdf)
+            and plate_counts[plate] > len(topdf)
+            and (
+                len(selected) < k
+                or topdf["Result_anomaly_score"].iloc[-1] < selected[-1][0]
+            )
+        ):
+            raise ValueError(
+                f"k={k} exceeds the {len(topdf)} indexed cells of plate "
+                f"{plate}; rebuild the index with a larger top_k"
+            )
+
+    offsets = np.cumsum([0] + [len(topdf) for topdf in topdfs[:-1]])
+
+    return (
+        pd.concat(topdfs, ignore_index=True)
+        .iloc[[offsets[plate_idx] + row for _, plate_idx, row in selected]]
+        .reset_index(drop=True)
+    )
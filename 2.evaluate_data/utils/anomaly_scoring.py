@@ -0,0 +1,227 @@
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterator, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from compiled_isolation_forest import CompiledIsolationForest
+from sklearn.ensemble import IsolationForest
+
+# Marks the end of the prefetched batches
+_END_OF_BATCHES = object()
+
+
+def score_anomalies(
+    iso_forest: Union[IsolationForest, CompiledIsolationForest], featdf: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    Compute the inlier predictions and anomaly scores of cells, while
+    traversing the trees only once.
+    Equivalent to `iso_forest.predict` and `iso_forest.decision_function`,
+    which each compute `score_samples` separately.
+
+    Parameters
+    ----------
+    iso_forest : IsolationForest | CompiledIsolationForest
+        Trained isolation forest, or its compiled (memory-mapped) form.
+    featdf : pd.DataFrame
+        Morphology features of the cells (the forest's features).
+
+    Returns
+    -------
+    pd.DataFrame
+        Result_inlier (1 for inliers, -1 for anomalies) and Result_anomaly_score
+        (lower is more anomalous), with the index of `featdf`.
+    """
+
+    anomaly_scores = iso_forest.score_samples(featdf) - iso_forest.offset_
+
+    inliers = np.ones_like(anomaly_scores, dtype=int)
+    inliers[anomaly_scores < 0] = -1
+
+    return pd.DataFrame(
+        {"Result_inlier": inliers, "Result_anomaly_score": anomaly_scores},
+        index=featdf.index,
+    )
+
+
+def _put_until_stopped(
+    batch_queue: queue.Queue, item: object, stop_reading: threading.Event
+) -> bool:
+    """
+    Put an item in the queue, giving up once the consumer stops iterating
+    so the reader thread can exit.
+    """
+
+    while not stop_reading.is_set():
+        try:
+            batch_queue.put(item, timeout=0.1)
+            return True
+
+        except queue.Full:
+            continue
+
+    return False
+
+
+def _read_batches(
+    pq_file: pq.ParquetFile,
+    batch_size: int,
+    columns: Optional[list[str]],
+    batch_queue: queue.Queue,
+    stop_reading: threading.Event,
+) -> None:
+    """
+    Read the batches of a parquet file into the queue, followed by the end of
+    the batches, or the error which stopped the reading.
+    """
+
+    try:
+        for batch in pq_file.iter_batches(batch_size=batch_size, columns=columns):
+            if not _put_until_stopped(batch_queue, batch, stop_reading):
+                return
+
+        _put_until_stopped(batch_queue, _END_OF_BATCHES, stop_reading)
+
+    except BaseException as e:
+        _put_until_stopped(batch_queue, e, stop_reading)
+
+
+def iter_prefetched_batches(
+    pq_file: pq.ParquetFile,
+    batch_size: int,
+    columns: Optional[list[str]] = None,
+    prefetch_batches: int = 2,
+) -> Iterator[pa.RecordBatch]:
+    """
+    Iterate over the record batches of a parquet file, while a reader thread
+    reads up to `prefetch_batches` batches ahead.
+
+    Parameters
+    ----------
+    pq_file : pq.ParquetFile
+        Parquet file to read.
+    batch_size : int
+        Maximum number of rows per batch.
+    columns : list[str] | None
+        Columns to read. All columns are read by default.
+    prefetch_batches : int
+        Maximum number of batches read ahead of the consumer.
+
+    Yields
+    ------
+    pa.RecordBatch
+        Batches in file order.
+    """
+
+    batch_queue = queue.Queue(maxsize=max(1, prefetch_batches))
+    stop_reading = threading.Event()
+
+    reader = threading.Thread(
+        target=_read_batches,
+        args=(pq_file, batch_size, columns, batch_queue, stop_reading),
+        daemon=True,
+    )
+    reader.start()
+
+    try:
+        while True:
+            item = batch_queue.get()
+
+            if item is _END_OF_BATCHES:
+                return
+
+            if isinstance(item, BaseException):
+                raise item
+
+            yield item
+
+    finally:
+        stop_reading.set()
+        reader.join()
+
+
+def score_parquet_anomalies(
+    pq_file: pq.ParquetFile,
+    iso_forest: Union[IsolationForest, CompiledIsolationForest],
+    write_batch: Callable[[int, pd.DataFrame], None],
+    batch_size: int = 220_000,
+    prefetch_batches: int = 2,
+    max_pending_writes: int = 2,
+) -> int:
+    """
+    Compute the anomaly data of a parquet file batch-by-batch, where reading,
+    scoring and writing overlap: a reader thread prefetches the next batches
+    and a writer thread writes the scored batches, while the current batch is
+    scored.
+    Only the Metadata columns and the forest's features are read.
+
+    Parameters
+    ----------
+    pq_file : pq.ParquetFile
+        Single-cell morphology data.
+    iso_forest : IsolationForest | CompiledIsolationForest
+        Trained isolation forest, or its compiled (memory-mapped) form.
+    write_batch : Callable[[int, pd.DataFrame], None]
+        Called on the writer thread, in batch order, with the batch number and
+        the batch's Metadata and Result columns.
+    batch_size : int
+        Maximum number of cells scored at a time.
+    prefetch_batches : int
+        Maximum number of batches read ahead of scoring.
+    max_pending_writes : int
+        Maximum number of scored batches waiting to be written, which bounds
+        memory when writing is slower than scoring.
+
+    Returns
+    -------
+    int
+        Number of scored batches.
+    """
+
+    feat_cols = iso_forest.feature_names_in_.tolist()
+    read_cols = [
+        col
+        for col in pq_file.schema_arrow.names
+        if "Metadata" in col or col in feat_cols
+    ]
+
+    pending_writes: deque[Future] = deque()
+    num_batches = 0
+
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        try:
+            for i, batch in enumerate(
+                iter_prefetched_batches(
+                    pq_file,
+                    batch_size=batch_size,
+                    columns=read_cols,
+                    prefetch_batches=prefetch_batches,
+                )
+            ):
+                pdf = batch.to_pandas()
+                meta_cols = [col for col in pdf.columns if "Metadata" in col]
+                pdf = pd.concat(
+                    [pdf[meta_cols], score_anomalies(iso_forest, pdf[feat_cols])],
+                    axis=1,
+                )
+
+                # Surfaces write errors early and bounds the queued batches
+                while len(pending_writes) >= max(1, max_pending_writes):
+                    pending_writes.popleft().result()
+
+                pending_writes.append(writer.submit(write_batch, i, pdf))
+                num_batches += 1
+
+            while pending_writes:
+                pending_writes.popleft().result()
+
+        finally:
+            for pending_write in pending_writes:
+                pending_write.cancel()
+
+    return num_batches
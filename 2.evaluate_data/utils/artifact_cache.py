@@ -0,0 +1,253 @@
+import hashlib
+import json
+import os
+import pathlib
+import time
+import warnings
+from http import HTTPStatus
+from typing import Optional, Union
+
+import requests
+
+# Environment variables of the cache directory and of offline mode ("1"), e.g.
+# to run from a pre-seeded cache copied to nodes without internet access
+ARTIFACT_CACHE_ENV = "JUMP_ARTIFACT_CACHE"
+ARTIFACT_CACHE_OFFLINE_ENV = "JUMP_ARTIFACT_CACHE_OFFLINE"
+
+# Cached artifacts are used without checking the url for updates for this long
+ARTIFACT_MAX_AGE_S = 24 * 60 * 60
+
+# Seconds to wait for the server
+ARTIFACT_REQUEST_TIMEOUT_S = 60
+
+# Least recently used artifacts are evicted above this total size
+ARTIFACT_CACHE_MAX_BYTES = 5 * 2**30
+
+
+def _write_json_atomic(obj: dict, path: pathlib.Path) -> None:
+    """Write json, so concurrent readers never see a partially written file."""
+
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+
+    with tmp_path.open("w") as json_obj:
+        json.dump(obj, json_obj)
+
+    os.replace(tmp_path, path)
+
+
+def _read_entry(entry_path: pathlib.Path) -> Optional[dict]:
+    """Cache entry of a url, or None if the url or its content isn't cached."""
+
+    try:
+        with entry_path.open() as entry_obj:
+            entry = json.load(entry_obj)
+
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+    blob_path = entry_path.parent.parent / "blobs" / entry["sha256"]
+
+    return entry if blob_path.is_file() else None
+
+
+def _evict_artifacts(cache_path: pathlib.Path, max_cache_bytes: int, keep: str) -> None:
+    """Remove the least recently used artifacts until the cache fits."""
+
+    entries = []
+    for entry_path in (cache_path / "entries").glob("*.json"):
+        entry = _read_entry(entry_path)
+        if entry is not None:
+            entries.append((entry_path, entry))
+
+    blob_paths = list((cache_path / "blobs").glob("[0-9a-f]*"))
+    cache_bytes = sum(blob_path.stat().st_size for blob_path in blob_paths)
+
+    # The last use of a blob is its most recently used url
+    last_used = {blob_path.name: 0.0 for blob_path in blob_paths}
+    for _, entry in entries:
+        last_used[entry["sha256"]] = max(
+            last_used.get(entry["sha256"], 0.0), entry["last_used"]
+        )
+
+    for sha256 in sorted(last_used, key=last_used.get):
+        if cache_bytes <= max_cache_bytes:
+            break
+
+        if sha256 == keep:
+            continue
+
+        for entry_path, entry in entries:
+            if entry["sha256"] == sha256:
+                entry_path.unlink(missing_ok=True)
+
+        # Another process may have evicted the blob already
+        blob_path = cache_path / "blobs" / sha256
+        try:
+            cache_bytes -= blob_path.stat().st_size
+            blob_path.unlink()
+
+        except FileNotFoundError:
+            continue
+
+
+def _revalidate_entry(
+    url: str,
+    entry: Optional[dict],
+    entry_path: pathlib.Path,
+    now: float,
+) -> Optional[requests.Response]:
+    """
+    Request a url, conditionally on the ETag of its cache entry (if any).
+
+    Returns
+    -------
+    requests.Response | None
+        Streamed response with the url's new content, or None if the cached
+        content is unchanged (304 Not Modified, which updates the entry) or
+        the url can't be reached.
+    """
+
+    headers = {}
+    if entry is not None and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+
+    try:
+        response = requests.get(
+            url, headers=headers, stream=True, timeout=ARTIFACT_REQUEST_TIMEOUT_S
+        )
+        response.raise_for_status()
+
+    except requests.RequestException as e:
+        if entry is None:
+            raise
+
+        warnings.warn(f"Using the cached content of {url}, which can't be reached: {e}")
+
+        return None
+
+    if response.status_code == HTTPStatus.NOT_MODIFIED:
+        response.close()
+
+        entry.update(validated=now, last_used=now)
+        _write_json_atomic(entry, entry_path)
+
+        return None
+
+    return response
+
+
+def _download_blob(
+    response: requests.Response, cache_path: pathlib.Path, entry_path: pathlib.Path
+) -> pathlib.Path:
+    """Store the content of a response as a blob named by its sha256."""
+
+    (cache_path / "blobs").mkdir(parents=True, exist_ok=True)
+
+    # Hashed while downloading, and only named by its hash once complete
+    tmp_blob_path = cache_path / "blobs" / f".{entry_path.stem}.{os.getpid()}.tmp"
+    content_hash = hashlib.sha256()
+
+    try:
+        with response, tmp_blob_path.open("wb") as blob_obj:
+            for chunk in response.iter_content(chunk_size=2**20):
+                content_hash.update(chunk)
+                blob_obj.write(chunk)
+
+        blob_path = cache_path / "blobs" / content_hash.hexdigest()
+        os.replace(tmp_blob_path, blob_path)
+
+    finally:
+        tmp_blob_path.unlink(missing_ok=True)
+
+    return blob_path
+
+
+def fetch_artifact(
+    url: str,
+    cache_path: Optional[Union[str, pathlib.Path]] = None,
+    offline: Optional[bool] = None,
+    max_age_s: float = ARTIFACT_MAX_AGE_S,
+    max_cache_bytes: int = ARTIFACT_CACHE_MAX_BYTES,
+) -> pathlib.Path:
+    """
+    Local path of the content of a url, which is only downloaded if it isn't
+    cached or has changed.
+    Contents are stored once per sha256 (blobs/<sha256>), and each url has an
+    entry (entries/<sha256 of the url>.json) with its content's sha256 and ETag.
+    Entries older than `max_age_s` are revalidated with the ETag, so unchanged
+    contents aren't downloaded again, and the cached content is used if the url
+    can't be reached.
+
+    Parameters
+    ----------
+    url : str
+        Url of the artifact.
+    cache_path : str | pathlib.Path | None
+        Cache directory, which defaults to the JUMP_ARTIFACT_CACHE environment
+        variable or ~/.cache/jump_sc_artifacts.
+    offline : bool | None
+        Only use cached artifacts, without any request.
+        Defaults to whether JUMP_ARTIFACT_CACHE_OFFLINE is "1".
+    max_age_s : float
+        Seconds after which an entry is revalidated.
+    max_cache_bytes : int
+        Total size of the cached contents, above which the least recently used
+        contents are evicted.
+
+    Returns
+    -------
+    pathlib.Path
+        Path of the cached content, which must not be modified.
+    """
+
+    if cache_path is None:
+        cache_path = os.environ.get(
+            ARTIFACT_CACHE_ENV, pathlib.Path.home() / ".cache" / "jump_sc_artifacts"
+        )
+
+    if offline is None:
+        offline = os.environ.get(ARTIFACT_CACHE_OFFLINE_ENV) == "1"
+
+    cache_path = pathlib.Path(cache_path)
+    entry_path = (
+        cache_path / "entries" / f"{hashlib.sha256(url.encode()).hexdigest()}.json"
+    )
+    entry = _read_entry(entry_path)
+
+    if offline:
+        if entry is None:
+            raise FileNotFoundError(f"{url} isn't cached in {cache_path}")
+
+        return cache_path / "blobs" / entry["sha256"]
+
+    now = time.time()
+
+    if entry is not None and now - entry["validated"] < max_age_s:
+        entry["last_used"] = now
+        _write_json_atomic(entry, entry_path)
+
+        return cache_path / "blobs" / entry["sha256"]
+
+    response = _revalidate_entry(url, entry, entry_path, now)
+
+    if response is None:
+        return cache_path / "blobs" / entry["sha256"]
+
+    blob_path = _download_blob(response, cache_path, entry_path)
+
+    entry_path.parent.mkdir(parents=True, exist_ok=True)
+    _write_json_atomic(
+        {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "sha256": blob_path.name,
+            "size": blob_path.stat().st_size,
+            "validated": now,
+            "last_used": now,
+        },
+        entry_path,
+    )
+
+    _evict_artifacts(cache_path, max_cache_bytes, keep=blob_path.name)
+
+    return blob_path
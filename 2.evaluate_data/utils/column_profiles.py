@@ -0,0 +1,196 @@
+import json
+import os
+import pathlib
+from typing import Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+
+def profile_parquet_columns(
+    plate_path: Union[str, pathlib.Path], count_nans: bool = True
+) -> pd.DataFrame:
+    """
+    Count the missing values (nulls and NaNs, like `pd.DataFrame.notna`) of
+    each column of a parquet file.
+    Nulls are counted from the row group statistics in its footer, where columns
+    of row groups without null count statistics are read one at a time.
+    NaN values aren't in the statistics, so floating point columns are read one
+    at a time to count them, unless `count_nans` is False.
+    Counting NaNs is the default, so the selected feature columns match those
+    without missing values in pandas, although profiling then reads every
+    floating point column rather than only the footer.
+
+    Parameters
+    ----------
+    plate_path : str | pathlib.Path
+        Parquet file to profile.
+    count_nans : bool
+        Whether to also count the NaN values of floating point columns, which
+        reads those columns one at a time. Without NaN counts only the footer
+        is read, which is enough for files where missing values are stored as
+        nulls.
+
+    Returns
+    -------
+    pd.DataFrame
+        Profile of each column (column, num_rows, null_count), in file order.
+    """
+
+    pq_file = pq.ParquetFile(plate_path)
+    metadata = pq_file.metadata
+    schema = pq_file.schema_arrow
+
+    # Pandas index columns aren't data columns
+    pandas_metadata = schema.pandas_metadata or {}
+    index_cols = [
+        col for col in pandas_metadata.get("index_columns", []) if isinstance(col, str)
+    ]
+    profile_cols = [col for col in schema.names if col not in index_cols]
+
+    null_counts = dict.fromkeys(profile_cols, 0)
+    unprofiled_cols = set()
+
+    for i in range(metadata.num_row_groups):
+        row_group = metadata.row_group(i)
+
+        for j in range(row_group.num_columns):
+            column = row_group.column(j)
+            col = column.path_in_schema
+
+            if col not in null_counts:
+                continue
+
+            if column.statistics is None or not column.statistics.has_null_count:
+                unprofiled_cols.add(col)
+            else:
+                null_counts[col] += column.statistics.null_count
+
+    for col in unprofiled_cols:
+        null_counts[col] = pq_file.read(columns=[col]).column(col).null_count
+
+    profiledf = pd.DataFrame(
+        {
+            "column": profile_cols,
+            "num_rows": metadata.num_rows,
+            "null_count": [null_counts[col] for col in profile_cols],
+        }
+    )
+
+    if count_nans:
+        float_cols = [
+            col for col in profile_cols if pa.types.is_floating(schema.field(col).type)
+        ]
+        nan_counts = dict.fromkeys(profile_cols, 0)
+
+        for col in float_cols:
+            nan_counts[col] = (
+                pc.sum(pc.is_nan(pq_file.read(columns=[col]).column(col))).as_py() or 0
+            )
+
+        profiledf["nan_count"] = [nan_counts[col] for col in profile_cols]
+
+    return profiledf
+
+
+def write_column_profile(
+    profiledf: pd.DataFrame,
+    column_profiles_path: Union[str, pathlib.Path],
+    plate_name: str,
+) -> pathlib.Path:
+    """
+    Write the column profile of one plate, where each plate has its own file,
+    so plates can be profiled concurrently.
+
+    Parameters
+    ----------
+    profiledf : pd.DataFrame
+        Column profile from `profile_parquet_columns`.
+    column_profiles_path : str | pathlib.Path
+        Directory of the column profiles of one dataset.
+    plate_name : str
+        Name of the profiled plate file.
+
+    Returns
+    -------
+    pathlib.Path
+        Path of the plate's column profile.
+    """
+
+    column_profiles_path = pathlib.Path(column_profiles_path)
+    column_profiles_path.mkdir(parents=True, exist_ok=True)
+
+    profile_path = column_profiles_path / f"{plate_name}.parquet"
+
+    # Replaced atomically, so readers never see a partially written profile
+    tmp_profile_path = profile_path.with_name(f".{profile_path.name}.tmp")
+    profiledf.to_parquet(tmp_profile_path, index=False)
+    os.replace(tmp_profile_path, profile_path)
+
+    return profile_path
+
+
+def dataset_feature_columns(
+    column_profiles_path: Union[str, pathlib.Path],
+) -> list[str]:
+    """
+    Feature columns (not Metadata) without missing values in every profiled
+    plate of a dataset, ordered as in the first plate's profile.
+
+    Parameters
+    ----------
+    column_profiles_path : str | pathlib.Path
+        Directory of the column profiles of one dataset.
+
+    Returns
+    -------
+    list[str]
+        Feature columns shared by every plate.
+    """
+
+    profile_paths = sorted(pathlib.Path(column_profiles_path).glob("*.parquet"))
+
+    if not profile_paths:
+        raise FileNotFoundError(f"No column profiles in {column_profiles_path}")
+
+    feat_cols = None
+
+    for profile_path in profile_paths:
+        profiledf = pd.read_parquet(profile_path)
+
+        complete = profiledf["null_count"] == 0
+        if "nan_count" in profiledf.columns:
+            complete &= profiledf["nan_count"] == 0
+
+        plate_feat_cols = profiledf.loc[complete, "column"]
+        plate_feat_cols = plate_feat_cols[~plate_feat_cols.str.contains("Metadata")]
+
+        if feat_cols is None:
+            feat_cols = plate_feat_cols.tolist()
+        else:
+            plate_feat_cols = set(plate_feat_cols)
+            feat_cols = [col for col in feat_cols if col in plate_feat_cols]
+
+    return feat_cols
+
+
+def write_feature_columns(
+    feat_cols: list[str], feature_columns_path: Union[str, pathlib.Path]
+) -> pathlib.Path:
+    """Write feature columns to json, replacing any previous file atomically."""
+
+    feature_columns_path = pathlib.Path(feature_columns_path)
+    feature_columns_path.parent.mkdir(parents=True, exist_ok=True)
+
+    tmp_feature_columns_path = feature_columns_path.with_name(
+        f".{feature_columns_path.name}.tmp"
+    )
+
+    with tmp_feature_columns_path.open("w") as feat_col_obj:
+        json.dump(feat_cols, feat_col_obj)
+
+    os.replace(tmp_feature_columns_path, feature_columns_path)
+
+    return feature_columns_path
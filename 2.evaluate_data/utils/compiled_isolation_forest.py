@@ -0,0 +1,436 @@
+# Flat, memory-mappable representation of a fitted isolation forest.
+# Learn more about the scoring used in this module
+# by reading the isolation forest paper:
+# https://doi.org/10.1109/ICDM.2008.17
+
+import functools
+import os
+import pathlib
+import shutil
+import tempfile
+from typing import Optional, Union
+
+import joblib
+import numpy as np
+import pandas as pd
+from isolation_forest_data_feature_importance import (
+    _tree_missing_go_to_left,
+    isoforest_expected_length,
+)
+from joblib import Parallel, delayed, effective_n_jobs
+from sklearn.ensemble import IsolationForest
+from sklearn.tree import _tree
+
+_COMPILED_SUFFIX = ".compiled"
+
+# Node arrays of each tree, in the order of the trees' nodes
+_TREE_ARRAY_NAMES = (
+    "children_left",
+    "children_right",
+    "feature",
+    "threshold",
+    "missing_go_to_left",
+    "n_node_samples",
+    "node_lengths",
+    "node_path_lengths",
+)
+
+
+class CompiledIsolationTree:
+    """
+    Node arrays of a single compiled isolation tree.
+    The same node attributes as sklearn's `tree_` are exposed through `tree_`,
+    so compiled trees can be used in place of IsolationForest.estimators_.
+    """
+
+    def __init__(
+        self: "CompiledIsolationTree",
+        node_arrays: dict[str, np.ndarray],
+        forest_path: Optional[pathlib.Path] = None,
+        tree_idx: Optional[int] = None,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        node_arrays : dict[str, np.ndarray]
+            Node arrays of the tree, keyed by the names in `_TREE_ARRAY_NAMES`.
+        forest_path : pathlib.Path | None
+            Directory of the saved forest the tree belongs to, if any.
+        tree_idx : int | None
+            Index of the tree in the saved forest.
+        """
+
+        self._node_arrays = node_arrays
+
+        self.children_left = node_arrays["children_left"]
+        self.children_right = node_arrays["children_right"]
+        self.feature = node_arrays["feature"]
+        self.threshold = node_arrays["threshold"]
+        self.n_node_samples = node_arrays["n_node_samples"]
+
+        # Whether samples with a missing (NaN) split feature go left, as learned
+        # by sklearn
+        self.missing_go_to_left = node_arrays["missing_go_to_left"]
+
+        # Precomputed expected path length c(n) of each node
+        self.node_lengths = node_arrays["node_lengths"]
+
+        # Depth of each node plus c(n), which is the path length of leaf nodes
+        self.node_path_lengths = node_arrays["node_path_lengths"]
+
+        self._forest_path = forest_path
+        self._tree_idx = tree_idx
+
+    @property
+    def tree_(self: "CompiledIsolationTree") -> "CompiledIsolationTree":
+        return self
+
+    def __reduce__(self: "CompiledIsolationTree") -> tuple:
+        # Trees of a saved forest are re-opened from disk instead of pickled
+        if self._forest_path is None:
+            return CompiledIsolationTree, (self._node_arrays,)
+
+        return _load_saved_tree, (str(self._forest_path), self._tree_idx)
+
+    def apply(
+        self: "CompiledIsolationTree", X_data: np.ndarray, feat_subset: np.ndarray
+    ) -> np.ndarray:
+        """
+        Find the leaf node each sample ends up in.
+
+        Parameters
+        ----------
+        X_data : np.ndarray
+            Feature matrix aligned to the forest's feature order.
+        feat_subset : np.ndarray
+            Global feature indices used by this tree.
+
+        Returns
+        -------
+        np.ndarray
+            Leaf node index of each sample.
+        """
+
+        num_samples = X_data.shape[0]
+        sample_nodes = np.zeros(num_samples, dtype=np.intp)
+
+        # Samples which have not reached a leaf node yet
+        sample_idxs = np.arange(num_samples)
+
+        while sample_idxs.size:
+            nodes = sample_nodes[sample_idxs]
+            is_split_node = self.feature[nodes] != _tree.TREE_UNDEFINED
+            sample_idxs = sample_idxs[is_split_node]
+            nodes = nodes[is_split_node]
+
+            # Missing values take the side sklearn learned for them
+            feat_values = X_data[sample_idxs, feat_subset[self.feature[nodes]]]
+            goes_left = np.where(
+                np.isnan(feat_values),
+                self.missing_go_to_left[nodes].astype(bool),
+                feat_values <= self.threshold[nodes],
+            )
+            sample_nodes[sample_idxs] = np.where(
+                goes_left, self.children_left[nodes], self.children_right[nodes]
+            )
+
+        return sample_nodes
+
+
+class CompiledIsolationForest:
+    """
+    Fitted isolation forest stored as flat, concatenated node arrays.
+    Saved forests are a directory of .npy files which are loaded with
+    `np.load(mmap_mode="r")`, so they open in milliseconds and share
+    their memory between processes through the page cache.
+    Scores match IsolationForest.score_samples, decision_function and predict.
+    """
+
+    # Arrays saved to (and loaded from) the compiled forest directory
+    _array_names = (
+        "tree_node_offsets",
+        *_TREE_ARRAY_NAMES,
+        "tree_feature_offsets",
+        "estimators_features",
+        "feature_names",
+        "max_samples",
+        "offset",
+    )
+
+    def __init__(
+        self: "CompiledIsolationForest",
+        arrays: dict[str, np.ndarray],
+        path: Optional[pathlib.Path] = None,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        arrays : dict[str, np.ndarray]
+            Flat forest arrays, keyed by the names in `_array_names`.
+        path : pathlib.Path | None
+            Directory the arrays were loaded from, if any.
+        """
+
+        self._arrays = arrays
+        self._path = path
+
+        node_offsets = arrays["tree_node_offsets"]
+        feature_offsets = arrays["tree_feature_offsets"]
+
+        self.estimators_ = [
+            CompiledIsolationTree(
+                {
+                    name: arrays[name][node_offsets[idx] : node_offsets[idx + 1]]
+                    for name in _TREE_ARRAY_NAMES
+                },
+                forest_path=path,
+                tree_idx=idx,
+            )
+            for idx in range(len(node_offsets) - 1)
+        ]
+
+        self.estimators_features_ = [
+            arrays["estimators_features"][
+                feature_offsets[idx] : feature_offsets[idx + 1]
+            ]
+            for idx in range(len(feature_offsets) - 1)
+        ]
+
+        self.feature_names_in_ = np.asarray(arrays["feature_names"], dtype=object)
+        self.max_samples_ = int(arrays["max_samples"])
+        self.offset_ = float(arrays["offset"])
+
+    def __reduce__(self: "CompiledIsolationForest") -> tuple:
+        # Saved forests are re-opened from disk instead of pickled
+        if self._path is None:
+            return CompiledIsolationForest, (self._arrays,)
+
+        return _load_saved_forest, (str(self._path),)
+
+    @classmethod
+    def from_isolation_forest(
+        cls: type["CompiledIsolationForest"], iso_forest: IsolationForest
+    ) -> "CompiledIsolationForest":
+        """Flatten the trees of a fitted IsolationForest."""
+
+        trees = [estimator.tree_ for estimator in iso_forest.estimators_]
+        estimators_features = [
+            np.asarray(fs, dtype=np.intp) for fs in iso_forest.estimators_features_
+        ]
+        node_counts = [tree.node_count for tree in trees]
+        node_depths = [_compute_node_depths(tree) for tree in trees]
+
+        node_lengths = [
+            isoforest_expected_length(tree.n_node_samples) for tree in trees
+        ]
+
+        arrays = {
+            "tree_node_offsets": np.concatenate([[0], np.cumsum(node_counts)]),
+            "children_left": np.concatenate([tree.children_left for tree in trees]),
+            "children_right": np.concatenate([tree.children_right for tree in trees]),
+            "feature": np.concatenate([tree.feature for tree in trees]),
+            "threshold": np.concatenate([tree.threshold for tree in trees]),
+            "missing_go_to_left": np.concatenate(
+                [_tree_missing_go_to_left(tree) for tree in trees]
+            ),
+            "n_node_samples": np.concatenate([tree.n_node_samples for tree in trees]),
+            "node_lengths": np.concatenate(node_lengths),
+            "node_path_lengths": np.concatenate(
+                [depths + lengths for depths, lengths in zip(node_depths, node_lengths)]
+            ),
+            "tree_feature_offsets": np.concatenate(
+                [[0], np.cumsum([len(fs) for fs in estimators_features])]
+            ),
+            "estimators_features": np.concatenate(estimators_features),
+            "feature_names": np.asarray(iso_forest.feature_names_in_, dtype=str),
+            "max_samples": np.asarray(iso_forest.max_samples_),
+            "offset": np.asarray(iso_forest.offset_),
+        }
+
+        return cls(arrays)
+
+    @classmethod
+    def compiled_path(
+        cls: type["CompiledIsolationForest"], model_path: Union[str, pathlib.Path]
+    ) -> pathlib.Path:
+        """Compiled forest directory stored next to a joblib model file."""
+
+        model_path = pathlib.Path(model_path)
+
+        return model_path.with_name(model_path.stem + _COMPILED_SUFFIX)
+
+    def save(
+        self: "CompiledIsolationForest", path: Union[str, pathlib.Path]
+    ) -> pathlib.Path:
+        """
+        Save the forest arrays as .npy files in the `path` directory.
+        The directory is written to a temporary location and renamed into place,
+        so concurrent readers never see a partially written forest.
+        """
+
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = pathlib.Path(tempfile.mkdtemp(dir=path.parent, prefix=path.name))
+
+        for name in self._array_names:
+            np.save(tmp_path / f"{name}.npy", self._arrays[name], allow_pickle=False)
+
+        try:
+            os.rename(tmp_path, path)
+
+        # Another process already saved the same forest
+        except OSError:
+            shutil.rmtree(tmp_path)
+
+        return path
+
+    @classmethod
+    def load(
+        cls: type["CompiledIsolationForest"], path: Union[str, pathlib.Path]
+    ) -> "CompiledIsolationForest":
+        """Memory-map a saved forest."""
+
+        path = pathlib.Path(path)
+
+        return cls(
+            {
+                name: np.load(path / f"{name}.npy", mmap_mode="r", allow_pickle=False)
+                for name in cls._array_names
+            },
+            path=path,
+        )
+
+    @classmethod
+    def load_or_compile(
+        cls: type["CompiledIsolationForest"], model_path: Union[str, pathlib.Path]
+    ) -> "CompiledIsolationForest":
+        """
+        Load the compiled forest stored next to a joblib IsolationForest model,
+        compiling and saving it first if it is missing, older than the model or
+        saved without some of the arrays (e.g. by an older version).
+        """
+
+        model_path = pathlib.Path(model_path)
+        compiled_path = cls.compiled_path(model_path)
+
+        if (
+            compiled_path.is_dir()
+            and compiled_path.stat().st_mtime >= model_path.stat().st_mtime
+            and all(
+                (compiled_path / f"{name}.npy").is_file() for name in cls._array_names
+            )
+        ):
+            return cls.load(compiled_path)
+
+        if compiled_path.is_dir():
+            shutil.rmtree(compiled_path, ignore_errors=True)
+
+        cls.from_isolation_forest(joblib.load(model_path)).save(compiled_path)
+
+        return cls.load(compiled_path)
+
+    def _check_features(
+        self: "CompiledIsolationForest", X_data: Union[pd.DataFrame, np.ndarray]
+    ) -> np.ndarray:
+        """Order features like the model, using float32 like sklearn does."""
+
+        if isinstance(X_data, pd.DataFrame):
+            X_data = X_data[self.feature_names_in_.tolist()]
+
+        return np.asarray(X_data, dtype=np.float32)
+
+    def _sum_path_lengths(
+        self: "CompiledIsolationForest", X_data: np.ndarray, tree_idxs: np.ndarray
+    ) -> np.ndarray:
+        """Sum the path length of each sample over several trees."""
+
+        path_lengths = np.zeros(X_data.shape[0], dtype=float)
+
+        for idx in tree_idxs:
+            estimator = self.estimators_[idx]
+            leaves = estimator.apply(X_data, self.estimators_features_[idx])
+            path_lengths += estimator.node_path_lengths[leaves]
+
+        return path_lengths
+
+    def score_samples(
+        self: "CompiledIsolationForest",
+        X_data: Union[pd.DataFrame, np.ndarray],
+        n_jobs: int = -1,
+    ) -> np.ndarray:
+        """
+        Opposite of the anomaly score of each sample, as in
+        IsolationForest.score_samples (lower is more anomalous).
+        Trees are split between `n_jobs` threads.
+        """
+
+        X_data = self._check_features(X_data)
+        num_workers = max(1, min(effective_n_jobs(n_jobs), len(self.estimators_)))
+
+        worker_path_lengths = Parallel(n_jobs=num_workers, prefer="threads")(
+            delayed(self._sum_path_lengths)(X_data, tree_idxs)
+            for tree_idxs in np.array_split(
+                np.arange(len(self.estimators_)), num_workers
+            )
+        )
+
+        path_lengths = worker_path_lengths[0]
+        for tree_path_lengths in worker_path_lengths[1:]:
+            path_lengths += tree_path_lengths
+
+        scores = 2 ** (
+            -path_lengths
+            / (
+                len(self.estimators_)
+                * isoforest_expected_length(np.asarray([self.max_samples_]))[0]
+            )
+        )
+
+        return -scores
+
+    def decision_function(
+        self: "CompiledIsolationForest",
+        X_data: Union[pd.DataFrame, np.ndarray],
+        n_jobs: int = -1,
+    ) -> np.ndarray:
+        """Anomaly score of each sample, where negative scores are outliers."""
+
+        return self.score_samples(X_data, n_jobs=n_jobs) - self.offset_
+
+    def predict(
+        self: "CompiledIsolationForest",
+        X_data: Union[pd.DataFrame, np.ndarray],
+        n_jobs: int = -1,
+    ) -> np.ndarray:
+        """Predict -1 for outliers and 1 for inliers."""
+
+        return np.where(self.decision_function(X_data, n_jobs=n_jobs) < 0, -1, 1)
+
+
+def _compute_node_depths(tree: _tree.Tree) -> np.ndarray:
+    """Depth of each node of a sklearn tree, where the root has depth 0."""
+
+    node_depths = np.zeros(tree.node_count, dtype=float)
+
+    # Children always have larger node indices than their parents
+    for node in range(tree.node_count):
+        if tree.children_left[node] != _tree.TREE_LEAF:
+            node_depths[tree.children_left[node]] = node_depths[node] + 1
+            node_depths[tree.children_right[node]] = node_depths[node] + 1
+
+    return node_depths
+
+
+@functools.lru_cache(maxsize=None)
+def _load_cached_forest(path: str, mtime_ns: int) -> CompiledIsolationForest:
+    """Load each saved forest once per process (and again once it is re-saved)."""
+
+    return CompiledIsolationForest.load(path)
+
+
+def _load_saved_forest(path: str) -> CompiledIsolationForest:
+    return _load_cached_forest(path, pathlib.Path(path).stat().st_mtime_ns)
+
+
+def _load_saved_tree(forest_path: str, tree_idx: int) -> CompiledIsolationTree:
+    return _load_saved_forest(forest_path).estimators_[tree_idx]
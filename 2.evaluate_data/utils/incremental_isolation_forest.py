@@ -0,0 +1,120 @@
+import time
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from scipy.stats import spearmanr
+from sklearn.ensemble import IsolationForest
+
+
+def fit_isolation_forest_incrementally(
+    featdf: pd.DataFrame,
+    max_estimators: int,
+    step_estimators: int = 50,
+    min_estimators: int = 100,
+    min_rank_correlation: float = 0.999,
+    patience: int = 2,
+    holdoutdf: Optional[pd.DataFrame] = None,
+    holdout_size: int = 10_000,
+    random_state: int = 0,
+    n_jobs: int = -1,
+) -> tuple[IsolationForest, pd.DataFrame]:
+    """
+    Train an isolation forest by adding `step_estimators` trees at a time
+    (warm start), until the ranking of the holdout cells' anomaly scores stops
+    changing or `max_estimators` trees are trained.
+    Trees are seeded as when training all trees at once, so the forest equals
+    the first trees of a forest trained with `max_estimators` trees, and is
+    that forest if it never converges.
+
+    Parameters
+    ----------
+    featdf : pd.DataFrame
+        Morphology features of the training cells.
+    max_estimators : int
+        Maximum number of trees.
+    step_estimators : int
+        Number of trees added at a time.
+    min_estimators : int
+        Minimum number of trees before stopping.
+    min_rank_correlation : float
+        Spearman correlation between the holdout scores of consecutive steps,
+        above which a step is stable.
+    patience : int
+        Number of consecutive stable steps needed to stop.
+    holdoutdf : pd.DataFrame | None
+        Cells scored after each step. Defaults to a fixed sample of
+        `holdout_size` training cells, since only the stability of their
+        ranking is measured.
+    holdout_size : int
+        Number of sampled training cells, when `holdoutdf` isn't given.
+    random_state : int
+        Seed of the forest and of the holdout sample.
+    n_jobs : int
+        Number of jobs used to train and score trees.
+
+    Returns
+    -------
+    tuple[IsolationForest, pd.DataFrame]
+        The trained forest, and the benchmark of each step (n_estimators,
+        fit_time_s, cumulative_fit_time_s, score_time_s,
+        score_time_per_cell_us, rank_correlation, converged).
+    """
+
+    if holdoutdf is None:
+        rng = np.random.default_rng(random_state)
+        holdout_rows = rng.choice(
+            len(featdf), size=min(holdout_size, len(featdf)), replace=False
+        )
+        holdoutdf = featdf.iloc[np.sort(holdout_rows)]
+
+    isofor = IsolationForest(
+        n_estimators=0, warm_start=True, random_state=random_state, n_jobs=n_jobs
+    )
+
+    benchmark = []
+    prev_scores = None
+    num_stable = 0
+    cumulative_fit_time = 0.0
+
+    # The last step is smaller when max_estimators isn't a multiple of the step
+    for step_end in range(
+        step_estimators, max_estimators + step_estimators, step_estimators
+    ):
+        n_estimators = min(step_end, max_estimators)
+        isofor.set_params(n_estimators=n_estimators)
+
+        start = time.perf_counter()
+        isofor.fit(featdf)
+        fit_time = time.perf_counter() - start
+        cumulative_fit_time += fit_time
+
+        start = time.perf_counter()
+        scores = isofor.score_samples(holdoutdf)
+        score_time = time.perf_counter() - start
+
+        rank_correlation = np.nan
+        if prev_scores is not None:
+            rank_correlation = spearmanr(prev_scores, scores).correlation
+
+        num_stable = num_stable + 1 if rank_correlation >= min_rank_correlation else 0
+        converged = n_estimators >= min_estimators and num_stable >= patience
+
+        benchmark.append(
+            {
+                "n_estimators": n_estimators,
+                "fit_time_s": fit_time,
+                "cumulative_fit_time_s": cumulative_fit_time,
+                "score_time_s": score_time,
+                "score_time_per_cell_us": 1e6 * score_time / len(holdoutdf),
+                "rank_correlation": rank_correlation,
+                "converged": converged,
+            }
+        )
+
+        if converged:
+            break
+
+        prev_scores = scores
+
+    return isofor, pd.DataFrame(benchmark)
@@ -2,13 +2,56 @@
 # by reading the isolation forest paper:
 # https://doi.org/10.1109/ICDM.2008.17
 
-from typing import Iterable, Optional, Union
+import contextlib
+import os
+import pathlib
+from typing import Iterable, Iterator, Optional, Union
 
 import numpy as np
 import pandas as pd
-from joblib import Parallel, delayed
+import pyarrow as pa
+import pyarrow.parquet as pq
+from joblib import Parallel, delayed, effective_n_jobs
+from scipy import sparse
 from sklearn.tree import DecisionTreeRegressor, _tree
 
+try:
+    import numba
+except ImportError:
+    numba = None
+
+ISOFOREST_BACKENDS = ("numba", "numpy", "python")
+
+# The fastest available backend is used by default.
+# Set ISOFOREST_DISABLE_NUMBA=1 to opt out of the numba backend.
+DEFAULT_ISOFOREST_BACKEND = (
+    "numba"
+    if numba is not None and not os.environ.get("ISOFOREST_DISABLE_NUMBA")
+    else "numpy"
+)
+
+_TREE_UNDEFINED = _tree.TREE_UNDEFINED
+
+
+@contextlib.contextmanager
+def _numba_num_threads(num_threads: Optional[int]) -> Iterator[None]:
+    """
+    Run numba kernels with `num_threads` threads (the current number when None),
+    restoring the previous number of threads afterwards.
+    """
+
+    if num_threads is None:
+        yield
+        return
+
+    previous_num_threads = numba.get_num_threads()
+    numba.set_num_threads(num_threads)
+
+    try:
+        yield
+    finally:
+        numba.set_num_threads(previous_num_threads)
+
 
 def isoforest_expected_length(node_sample_counts: np.ndarray) -> np.ndarray:
     """
@@ -45,6 +88,260 @@ def isoforest_expected_length(node_sample_counts: np.ndarray) -> np.ndarray:
     return out
 
 
+def _tree_node_lengths(tree: _tree.Tree) -> np.ndarray:
+    """
+    Expected path length c(n) of each node of a tree, which compiled trees
+    (see compiled_isolation_forest.py) store precomputed.
+    """
+
+    node_lengths = getattr(tree, "node_lengths", None)
+
+    if node_lengths is None:
+        node_lengths = isoforest_expected_length(tree.n_node_samples)
+
+    return node_lengths
+
+
+def _tree_missing_go_to_left(tree: _tree.Tree) -> np.ndarray:
+    """
+    Whether samples with a missing (NaN) split feature go to the left child of
+    each node, like sklearn's `tree_.missing_go_to_left`.
+    Trees without missing value support (sklearn < 1.3) send them right, since
+    NaN comparisons are false.
+    """
+
+    missing_go_to_left = getattr(tree, "missing_go_to_left", None)
+
+    if missing_go_to_left is None:
+        missing_go_to_left = np.zeros(tree.node_count, dtype=np.uint8)
+
+    return missing_go_to_left
+
+
+def _python_tree_gains(
+    X_data: np.ndarray,
+    feat_subset: np.ndarray,
+    left_children: np.ndarray,
+    right_children: np.ndarray,
+    tree_feats: np.ndarray,
+    feat_thresholds: np.ndarray,
+    missing_go_to_left: np.ndarray,
+    node_lengths: np.ndarray,
+    total_tree_gain: np.ndarray,
+) -> None:
+    """
+    Reference tree-gain kernel, which walks each sample down the tree one at a time.
+    Gains are added to `total_tree_gain` in place.
+    """
+
+    for sample_idx in range(X_data.shape[0]):
+        sample_node = 0
+        while tree_feats[sample_node] != _TREE_UNDEFINED:
+            tree_feat_idx = tree_feats[sample_node]
+            rel_feat_idx = feat_subset[tree_feat_idx]
+
+            feat_value = X_data[sample_idx, rel_feat_idx]
+
+            # Missing values take the side sklearn learned for them
+            if np.isnan(feat_value):
+                goes_left = missing_go_to_left[sample_node]
+            else:
+                goes_left = feat_value <= feat_thresholds[sample_node]
+
+            if goes_left:
+                child = left_children[sample_node]
+            else:
+                child = right_children[sample_node]
+
+            # Subtracting 1, because the expected path length is one less
+            # once the next step was taken (to the child node).
+            # The child node will sometimes be a leaf node as some samples may
+            # not be isolated.
+            sample_tree_gain = node_lengths[sample_node] - 1.0 - node_lengths[child]
+            total_tree_gain[sample_idx, rel_feat_idx] += sample_tree_gain
+            sample_node = child
+
+
+def _iter_tree_levels(
+    X_data: np.ndarray,
+    feat_subset: np.ndarray,
+    left_children: np.ndarray,
+    right_children: np.ndarray,
+    tree_feats: np.ndarray,
+    feat_thresholds: np.ndarray,
+    missing_go_to_left: np.ndarray,
+    node_lengths: np.ndarray,
+) -> Iterator[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Route all samples through the tree together, one depth level at a time,
+    using index arrays instead of a per-sample Python loop.
+
+    Yields
+    ------
+    tuple[np.ndarray, np.ndarray, np.ndarray]
+        The (sample index, global feature index, split gain) of every sample
+        which takes a split at this depth level.
+        Each sample occurs at most once per level.
+    """
+
+    num_samples = X_data.shape[0]
+
+    # Samples which have not reached a leaf node yet, and their current node
+    sample_idxs = np.arange(num_samples)
+    sample_nodes = np.zeros(num_samples, dtype=np.intp)
+
+    while sample_idxs.size:
+        is_split_node = tree_feats[sample_nodes] != _TREE_UNDEFINED
+        sample_idxs = sample_idxs[is_split_node]
+        sample_nodes = sample_nodes[is_split_node]
+
+        rel_feat_idxs = feat_subset[tree_feats[sample_nodes]]
+        feat_values = X_data[sample_idxs, rel_feat_idxs]
+        goes_left = np.where(
+            np.isnan(feat_values),
+            missing_go_to_left[sample_nodes].astype(bool),
+            feat_values <= feat_thresholds[sample_nodes],
+        )
+        children = np.where(
+            goes_left, left_children[sample_nodes], right_children[sample_nodes]
+        )
+
+        # Same gain as the reference kernel: the expected path length is one
+        # less once the sample steps down to the child node.
+        yield (
+            sample_idxs,
+            rel_feat_idxs,
+            node_lengths[sample_nodes] - 1.0 - node_lengths[children],
+        )
+        sample_nodes = children
+
+
+def _numpy_tree_gains(
+    X_data: np.ndarray,
+    feat_subset: np.ndarray,
+    left_children: np.ndarray,
+    right_children: np.ndarray,
+    tree_feats: np.ndarray,
+    feat_thresholds: np.ndarray,
+    missing_go_to_left: np.ndarray,
+    node_lengths: np.ndarray,
+    total_tree_gain: np.ndarray,
+) -> None:
+    """
+    Vectorized tree-gain kernel.
+    Gains are added to `total_tree_gain` in place.
+    """
+
+    for sample_idxs, rel_feat_idxs, sample_tree_gains in _iter_tree_levels(
+        X_data,
+        feat_subset,
+        left_children,
+        right_children,
+        tree_feats,
+        feat_thresholds,
+        missing_go_to_left,
+        node_lengths,
+    ):
+        np.add.at(total_tree_gain, (sample_idxs, rel_feat_idxs), sample_tree_gains)
+
+
+def _numpy_tree_gain_triplets(
+    X_data: np.ndarray,
+    feat_subset: np.ndarray,
+    left_children: np.ndarray,
+    right_children: np.ndarray,
+    tree_feats: np.ndarray,
+    feat_thresholds: np.ndarray,
+    missing_go_to_left: np.ndarray,
+    node_lengths: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Vectorized tree-gain kernel, which returns the gains as COO triplets
+    (sample index, global feature index, float32 gain) instead of adding
+    them to a dense (n_samples, n_features) array.
+    A sample only has one triplet per split on its path.
+    """
+
+    levels = list(
+        _iter_tree_levels(
+            X_data,
+            feat_subset,
+            left_children,
+            right_children,
+            tree_feats,
+            feat_thresholds,
+            missing_go_to_left,
+            node_lengths,
+        )
+    )
+
+    if not levels:
+        return (
+            np.empty(0, dtype=np.intp),
+            np.empty(0, dtype=np.intp),
+            np.empty(0, dtype=np.float32),
+        )
+
+    sample_idxs, rel_feat_idxs, sample_tree_gains = zip(*levels)
+
+    return (
+        np.concatenate(sample_idxs),
+        np.concatenate(rel_feat_idxs),
+        np.concatenate(sample_tree_gains).astype(np.float32),
+    )
+
+
+if numba is not None:
+
+    @numba.njit(parallel=True, cache=True)
+    def _numba_tree_gains(
+        X_data: np.ndarray,
+        feat_subset: np.ndarray,
+        left_children: np.ndarray,
+        right_children: np.ndarray,
+        tree_feats: np.ndarray,
+        feat_thresholds: np.ndarray,
+        missing_go_to_left: np.ndarray,
+        node_lengths: np.ndarray,
+        total_tree_gain: np.ndarray,
+    ) -> None:
+        """
+        Compiled tree-gain kernel, which walks the samples down the tree in parallel.
+        Each sample only writes to its own row of `total_tree_gain`.
+        """
+
+        for sample_idx in numba.prange(X_data.shape[0]):
+            sample_node = 0
+            while tree_feats[sample_node] != _TREE_UNDEFINED:
+                rel_feat_idx = feat_subset[tree_feats[sample_node]]
+
+                feat_value = X_data[sample_idx, rel_feat_idx]
+
+                if np.isnan(feat_value):
+                    goes_left = missing_go_to_left[sample_node] != 0
+                else:
+                    goes_left = feat_value <= feat_thresholds[sample_node]
+
+                if goes_left:
+                    child = left_children[sample_node]
+                else:
+                    child = right_children[sample_node]
+
+                total_tree_gain[sample_idx, rel_feat_idx] += (
+                    node_lengths[sample_node] - 1.0 - node_lengths[child]
+                )
+                sample_node = child
+
+else:
+    _numba_tree_gains = None
+
+_TREE_GAIN_KERNELS = {
+    "numba": _numba_tree_gains,
+    "numpy": _numpy_tree_gains,
+    "python": _python_tree_gains,
+}
+
+
 class IsoforestFeatureImportance:
     """
     Per-sample Isolation Forest feature contributions using split gain.
@@ -57,25 +354,61 @@ class IsoforestFeatureImportance:
     def __init__(
         self,
         estimators: list[DecisionTreeRegressor],
-        morphology_data: pd.DataFrame,
+        morphology_data: Union[pd.DataFrame, pq.ParquetFile],
         estimators_features: Optional[Iterable[np.ndarray]] = None,
+        feature_names: Optional[list[str]] = None,
+        backend: Optional[str] = None,
+        n_jobs: int = -1,
     ):
         """
         Parameters
         ----------
         estimators : list[DecisionTreeRegressor]
             Fitted isolation trees (e.g., from IsolationForest.estimators_).
-        morphology_data : pd.DataFrame
-            Feature matrix to explain; columns must match the model features.
+        morphology_data : pd.DataFrame | pq.ParquetFile
+            Feature matrix to explain, either in memory or as a parquet file
+            which is read in batches.
         estimators_features : Iterable[np.ndarray] | None
             Optional per-tree feature index subsets (IsolationForest.estimators_features_).
+        feature_names : list[str] | None
+            Model features in the model's feature order.
+            All columns of `morphology_data` are used by default.
+        backend : str | None
+            Tree traversal backend, one of "numba", "numpy" or "python".
+            "python" is the (slow) reference implementation.
+            Defaults to `DEFAULT_ISOFOREST_BACKEND`.
+        n_jobs : int
+            Number of workers (or numba threads) to compute importances with.
+            -1 uses all CPUs.
         """
 
+        backend = backend or DEFAULT_ISOFOREST_BACKEND
+
+        if backend not in ISOFOREST_BACKENDS:
+            raise ValueError(
+                f"backend must be one of {ISOFOREST_BACKENDS}, got {backend!r}"
+            )
+
+        if _TREE_GAIN_KERNELS[backend] is None:
+            raise ImportError("numba is required for the numba backend")
+
+        self._backend = backend
+        self._n_jobs = n_jobs
+
         self._estimators = estimators
         self._estimators_features = estimators_features
         self._morphology_data = morphology_data
         self._isoforest_importances = None
 
+        if feature_names is None:
+            feature_names = (
+                list(morphology_data.columns)
+                if isinstance(morphology_data, pd.DataFrame)
+                else morphology_data.schema_arrow.names
+            )
+
+        self._feature_names = list(feature_names)
+
     @property
     def isoforest_importances(self) -> pd.DataFrame:
         if self._isoforest_importances is None:
@@ -88,9 +421,11 @@ class IsoforestFeatureImportance:
         estimator: DecisionTreeRegressor,
         X_data: np.ndarray,
         feat_subset: np.ndarray,
+        total_tree_gain: Optional[np.ndarray] = None,
     ) -> np.ndarray:
         """
-        Compute per-sample, per-feature gains for a single tree.
+        Compute per-sample, per-feature gains for a single tree with the
+        configured backend.
 
         Parameters
         ----------
@@ -100,80 +435,374 @@ class IsoforestFeatureImportance:
             Feature matrix (float) aligned to the model's feature order.
         feat_subset : np.ndarray
             Global feature indices used by this tree (from estimators_features_).
+        total_tree_gain : np.ndarray | None
+            Optional running accumulator of shape (n_samples, n_features),
+            which this tree's gains are added to in place.
 
         Returns
         -------
         np.ndarray
             Array of shape (n_samples, n_features) with split-gain contributions
-            for this tree.
+            for this tree (added to `total_tree_gain` when given).
         """
 
         tree = estimator.tree_
-        num_samples, _ = X_data.shape
 
-        left_children = tree.children_left
-        right_children = tree.children_right
-        tree_feats = tree.feature
-        feat_thresholds = tree.threshold
+        if total_tree_gain is None:
+            total_tree_gain = np.zeros_like(X_data, dtype=float)
+
+        _TREE_GAIN_KERNELS[self._backend](
+            X_data,
+            feat_subset,
+            tree.children_left,
+            tree.children_right,
+            tree.feature,
+            tree.threshold,
+            _tree_missing_go_to_left(tree),
+            _tree_node_lengths(tree),
+            total_tree_gain,
+        )
+
+        return total_tree_gain
+
+    def _feature_subsets(self, num_features: int) -> list[np.ndarray]:
+        """Global feature indices used by each tree."""
+
+        if self._estimators_features is not None:
+            return [np.asarray(fs, dtype=int) for fs in self._estimators_features]
+
+        return [np.arange(num_features, dtype=int)] * len(self._estimators)
+
+    def _split_trees(self, parallel: Parallel) -> list[np.ndarray]:
+        """Split the tree indices evenly between the workers of `parallel`."""
+
+        num_workers = max(
+            1, min(effective_n_jobs(parallel.n_jobs), len(self._estimators))
+        )
+
+        return np.array_split(np.arange(len(self._estimators)), num_workers)
+
+    def _accumulate_tree_gains(
+        self,
+        estimators: list[DecisionTreeRegressor],
+        X_data: np.ndarray,
+        feat_subsets: list[np.ndarray],
+    ) -> np.ndarray:
+        """
+        Sum the per-sample, per-feature gains of several trees into a single
+        accumulator, so a worker only holds one (n_samples, n_features) array.
+        """
 
-        node_lengths = isoforest_expected_length(tree.n_node_samples)
         total_tree_gain = np.zeros_like(X_data, dtype=float)
 
-        for sample_idx in range(num_samples):
-            sample_node = 0
-            while tree_feats[sample_node] != _tree.TREE_UNDEFINED:
-                tree_feat_idx = tree_feats[sample_node]
-                rel_feat_idx = feat_subset[tree_feat_idx]
+        for estimator, feat_subset in zip(estimators, feat_subsets):
+            self._compute_tree_gains(estimator, X_data, feat_subset, total_tree_gain)
 
-                if X_data[sample_idx, rel_feat_idx] <= feat_thresholds[sample_node]:
-                    child = left_children[sample_node]
-                else:
-                    child = right_children[sample_node]
+        return total_tree_gain
 
-                # Subtracting 1, because the expected path length is one less
-                # once the next step was taken (to the child node).
-                # The child node will sometimes be a leaf node as some samples may
-                # not be isolated.
-                sample_tree_gain = node_lengths[sample_node] - 1.0 - node_lengths[child]
-                total_tree_gain[sample_idx, rel_feat_idx] += sample_tree_gain
-                sample_node = child
+    def _compute_average_tree_gains(
+        self, X_data: np.ndarray, parallel: Parallel
+    ) -> np.ndarray:
+        """
+        Compute per-sample, per-feature gains averaged over all trees, where
+        the trees are split evenly between the workers of `parallel`.
+        """
+
+        feat_subsets = self._feature_subsets(X_data.shape[1])
+
+        worker_tree_gains = parallel(
+            delayed(self._accumulate_tree_gains)(
+                [self._estimators[idx] for idx in tree_idxs],
+                X_data,
+                [feat_subsets[idx] for idx in tree_idxs],
+            )
+            for tree_idxs in self._split_trees(parallel)
+        )
+
+        average_tree_gains = worker_tree_gains[0]
+        for total_tree_gain in worker_tree_gains[1:]:
+            average_tree_gains += total_tree_gain
+
+        average_tree_gains /= len(self._estimators)
+
+        return average_tree_gains
+
+    def _accumulate_sparse_tree_gains(
+        self,
+        estimators: list[DecisionTreeRegressor],
+        X_data: np.ndarray,
+        feat_subsets: list[np.ndarray],
+    ) -> sparse.csr_matrix:
+        """
+        Sum the per-sample, per-feature gains of several trees into a single
+        float32 sparse accumulator, which only stores the features on each
+        sample's paths.
+        """
+
+        total_tree_gain = sparse.csr_matrix(X_data.shape, dtype=np.float32)
+
+        for estimator, feat_subset in zip(estimators, feat_subsets):
+            tree = estimator.tree_
+            sample_idxs, rel_feat_idxs, sample_tree_gains = _numpy_tree_gain_triplets(
+                X_data,
+                feat_subset,
+                tree.children_left,
+                tree.children_right,
+                tree.feature,
+                tree.threshold,
+                _tree_missing_go_to_left(tree),
+                _tree_node_lengths(tree),
+            )
+
+            # Duplicate (sample, feature) triplets are summed by the conversion
+            total_tree_gain += sparse.coo_matrix(
+                (sample_tree_gains, (sample_idxs, rel_feat_idxs)),
+                shape=X_data.shape,
+            ).tocsr()
 
         return total_tree_gain
 
-    def compute_isoforest_importances(self) -> pd.DataFrame:
+    def compute_sparse_isoforest_importances(
+        self, chunk_size: Optional[int] = None
+    ) -> sparse.csr_matrix:
         """
-        Compute per-sample, per-feature split-gain contributions averaged over trees.
+        Compute per-sample, per-feature split-gain contributions averaged over
+        trees as a float32 sparse matrix.
+        Samples only touch the few features on their paths in each tree, so this
+        needs far less memory than the dense importances for wide feature sets.
+        Always uses the vectorized numpy traversal.
+
+        Parameters
+        ----------
+        chunk_size : int | None
+            Number of samples per chunk. All samples are used at once when None.
+
+        Returns
+        -------
+        sparse.csr_matrix
+            Matrix of shape (n_samples, n_features), with rows in the order of
+            `morphology_data` and columns in the order of the feature names.
+        """
+
+        feature_chunks = []
+
+        with Parallel(n_jobs=self._n_jobs) as parallel:
+            for chunkdf in self._iter_morphology_chunks(
+                chunk_size, self._feature_names
+            ):
+                X = chunkdf.to_numpy(dtype=float, copy=False)
+                feat_subsets = self._feature_subsets(X.shape[1])
+
+                worker_tree_gains = parallel(
+                    delayed(self._accumulate_sparse_tree_gains)(
+                        [self._estimators[idx] for idx in tree_idxs],
+                        X,
+                        [feat_subsets[idx] for idx in tree_idxs],
+                    )
+                    for tree_idxs in self._split_trees(parallel)
+                )
+
+                average_tree_gains = worker_tree_gains[0]
+                for total_tree_gain in worker_tree_gains[1:]:
+                    average_tree_gains += total_tree_gain
+
+                average_tree_gains /= np.float32(len(self._estimators))
+
+                feature_chunks.append(average_tree_gains)
+
+        return sparse.vstack(feature_chunks, format="csr")
+
+    def compute_top_k_isoforest_importances(
+        self, k: int = 10, chunk_size: Optional[int] = None
+    ) -> pd.DataFrame:
+        """
+        Find the k features with the highest averaged split-gain contributions
+        of each sample, without materializing the dense importances.
+        Only features on a sample's paths are considered.
+
+        Parameters
+        ----------
+        k : int
+            Maximum number of features to keep per sample.
+        chunk_size : int | None
+            Number of samples per chunk. All samples are used at once when None.
 
         Returns
         -------
         pd.DataFrame
-            DataFrame of averaged contributions with sample index matching
-            `morphology_data` and columns matching feature names.
+            Long-format DataFrame with one row per (sample, feature), with
+            sample index matching `morphology_data` and columns "feature",
+            "importance" and "importance_rank" (starting at 1).
         """
 
-        feature_names = list(self._morphology_data.columns)
-        X = self._morphology_data[feature_names].to_numpy(dtype=float, copy=False)
+        importances = self.compute_sparse_isoforest_importances(
+            chunk_size=chunk_size
+        ).tocoo()
 
-        feat_subsets: list[np.ndarray] = (
-            [np.asarray(fs, dtype=int) for fs in self._estimators_features]
-            if self._estimators_features is not None
-            else [np.arange(X.shape[1], dtype=int)] * len(self._estimators)
-        )
+        # Sort by sample, then by decreasing importance within each sample
+        order = np.lexsort((-importances.data, importances.row))
+        sample_idxs = importances.row[order]
+        feat_idxs = importances.col[order]
+        importance_values = importances.data[order]
 
-        average_tree_gains = np.zeros_like(X, dtype=float)
+        sample_starts = np.searchsorted(sample_idxs, sample_idxs, side="left")
+        importance_ranks = np.arange(sample_idxs.size) - sample_starts + 1
+        is_top_k = importance_ranks <= k
 
-        all_tree_gains = Parallel(n_jobs=-1)(
-            delayed(self._compute_tree_gains)(estimator, X, subset)
-            for estimator, subset in zip(self._estimators, feat_subsets)
+        sample_index = (
+            self._morphology_data.index
+            if isinstance(self._morphology_data, pd.DataFrame)
+            else pd.RangeIndex(self._morphology_data.metadata.num_rows)
         )
 
-        for total_tree_gain in all_tree_gains:
-            average_tree_gains += total_tree_gain
+        return pd.DataFrame(
+            {
+                "feature": np.asarray(self._feature_names)[feat_idxs[is_top_k]],
+                "importance": importance_values[is_top_k],
+                "importance_rank": importance_ranks[is_top_k],
+            },
+            index=sample_index[sample_idxs[is_top_k]],
+        )
 
-        average_tree_gains /= len(self._estimators)
+    def _iter_morphology_chunks(
+        self, chunk_size: Optional[int], columns: list[str]
+    ) -> Iterator[pd.DataFrame]:
+        """Yield row chunks of `morphology_data` with only `columns`."""
+
+        if isinstance(self._morphology_data, pd.DataFrame):
+            num_rows = self._morphology_data.shape[0]
+            chunk_size = chunk_size or max(1, num_rows)
+
+            # An empty frame still yields one (empty) chunk
+            for start in range(0, max(1, num_rows), chunk_size):
+                yield self._morphology_data.iloc[start : start + chunk_size][columns]
+
+            return
+
+        start = 0
+        for batch in self._morphology_data.iter_batches(
+            batch_size=chunk_size or max(1, self._morphology_data.metadata.num_rows),
+            columns=columns,
+        ):
+            chunkdf = batch.to_pandas()
+            chunkdf.index = pd.RangeIndex(start, start + chunkdf.shape[0])
+            start += chunkdf.shape[0]
+
+            yield chunkdf
+
+    def iter_isoforest_importances(
+        self,
+        chunk_size: Optional[int] = 10_000,
+        metadata_columns: Optional[list[str]] = None,
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Compute per-sample, per-feature split-gain contributions averaged over
+        trees, one chunk of `morphology_data` rows at a time.
+        Peak memory is bounded by the chunk size instead of the number of samples.
+
+        Parameters
+        ----------
+        chunk_size : int | None
+            Number of samples per chunk. All samples are used at once when None.
+        metadata_columns : list[str] | None
+            Columns of `morphology_data` to pass through alongside the
+            importances of each chunk.
+
+        Yields
+        ------
+        pd.DataFrame
+            Averaged contributions of one chunk, with sample index matching
+            `morphology_data` and columns matching feature names, followed by
+            any metadata columns.
+        """
+
+        metadata_columns = [
+            col for col in metadata_columns or [] if col not in self._feature_names
+        ]
+
+        n_jobs = self._n_jobs
+        numba_num_threads = None
+
+        # The numba kernel already runs in parallel over samples
+        if self._backend == "numba":
+            if n_jobs > 0:
+                numba_num_threads = min(n_jobs, numba.config.NUMBA_NUM_THREADS)
+
+            n_jobs = 1
+
+        with Parallel(n_jobs=n_jobs) as parallel:
+            for chunkdf in self._iter_morphology_chunks(
+                chunk_size, self._feature_names + metadata_columns
+            ):
+                X = chunkdf[self._feature_names].to_numpy(dtype=float, copy=False)
+
+                # the numba threads are only changed while computing the chunk
+                with _numba_num_threads(numba_num_threads):
+                    average_tree_gains = self._compute_average_tree_gains(X, parallel)
+
+                importancesdf = pd.DataFrame(
+                    average_tree_gains,
+                    columns=self._feature_names,
+                    index=chunkdf.index,
+                )
+
+                if metadata_columns:
+                    importancesdf = importancesdf.join(chunkdf[metadata_columns])
+
+                yield importancesdf
+
+    def write_isoforest_importances(
+        self,
+        output_path: Union[str, pathlib.Path],
+        chunk_size: int = 10_000,
+        metadata_columns: Optional[list[str]] = None,
+    ) -> None:
+        """
+        Compute importances chunk-by-chunk and write each chunk to a parquet
+        file as soon as it is computed, without keeping all importances in memory.
+
+        Parameters
+        ----------
+        output_path : str | pathlib.Path
+            Parquet file to write the importances to.
+        chunk_size : int
+            Number of samples per chunk.
+        metadata_columns : list[str] | None
+            Columns of `morphology_data` to write alongside the importances.
+        """
+
+        writer = None
+
+        try:
+            for importancesdf in self.iter_isoforest_importances(
+                chunk_size=chunk_size, metadata_columns=metadata_columns
+            ):
+                table = pa.Table.from_pandas(importancesdf, preserve_index=False)
+
+                if writer is None:
+                    writer = pq.ParquetWriter(output_path, table.schema)
+
+                writer.write_table(table)
+
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def compute_isoforest_importances(self) -> pd.DataFrame:
+        """
+        Compute per-sample, per-feature split-gain contributions averaged over trees.
+
+        Returns
+        -------
+        pd.DataFrame
+            DataFrame of averaged contributions with sample index matching
+            `morphology_data` and columns matching feature names.
+        """
+
+        chunk_size = None if isinstance(self._morphology_data, pd.DataFrame) else 10_000
 
-        self._isoforest_importances = pd.DataFrame(
-            average_tree_gains, columns=feature_names, index=self._morphology_data.index
+        self._isoforest_importances = pd.concat(
+            self.iter_isoforest_importances(chunk_size=chunk_size)
         )
 
         return self._isoforest_importances
@@ -0,0 +1,205 @@
+import pathlib
+from typing import Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from anomaly_dataset import (
+    open_anomaly_dataset,
+    plate_filter,
+    read_plate_anomalies,
+    stream_top_k_anomalies,
+)
+from compiled_isolation_forest import CompiledIsolationForest
+from isolation_forest_data_feature_importance import IsoforestFeatureImportance
+
+# Columns which uniquely identify a cell in the anomaly and morphology data
+MERGE_COLS = [
+    "Metadata_Plate",
+    "Metadata_Well",
+    "Metadata_Site",
+    "Metadata_ObjectNumber",
+]
+
+
+def load_plate_anomaly_samples(
+    anomaly_dataset: ds.Dataset, plate: str, num_samples: int = 300
+) -> pd.DataFrame:
+    """
+    Read the least anomalous negative controls and the most anomalous treated
+    cells of one plate, with the plate and control filters pushed down to the scan.
+
+    Parameters
+    ----------
+    anomaly_dataset : ds.Dataset
+        Anomaly results from `open_anomaly_dataset`.
+    plate : str
+        Plate to read.
+    num_samples : int
+        Number of samples to read in each category (anomalous or inlier).
+        Use 0 to read every cell of the plate.
+
+    Returns
+    -------
+    pd.DataFrame
+        Anomaly results of the sampled cells.
+    """
+
+    if not num_samples:
+        return read_plate_anomalies(anomaly_dataset, plate)
+
+    control_type = ds.field("Metadata_control_type")
+
+    return pd.concat(
+        [
+            # Negative controls shouldn't be anomalous and vice versa
+            stream_top_k_anomalies(
+                anomaly_dataset,
+                k=num_samples,
+                largest=True,
+                filter_expr=plate_filter(plate) & (control_type == "negcon"),
+            ),
+            stream_top_k_anomalies(
+                anomaly_dataset,
+                k=num_samples,
+                largest=False,
+                filter_expr=plate_filter(plate)
+                & ((control_type != "negcon") | control_type.is_null()),
+            ),
+        ],
+        ignore_index=True,
+    )
+
+
+def compute_plate_feature_importances(
+    plate_anomdf: pd.DataFrame,
+    morphology_plate_path: Union[str, pathlib.Path],
+    anomalyze_model: CompiledIsolationForest,
+    output_path: Union[str, pathlib.Path],
+    num_samples: int = 300,
+    chunk_size: int = 10_000,
+    n_jobs: int = -1,
+) -> pathlib.Path:
+    """
+    Compute feature importances of the least anomalous negative controls and
+    the most anomalous treated cells of one plate, and write them to parquet
+    chunk-by-chunk.
+
+    Parameters
+    ----------
+    plate_anomdf : pd.DataFrame
+        Anomaly results (Metadata and Result columns) of the plate's cells.
+    morphology_plate_path : str | pathlib.Path
+        Parquet file with the plate's morphology features.
+    anomalyze_model : CompiledIsolationForest
+        Isolation forest the anomaly results were computed with.
+    output_path : str | pathlib.Path
+        Parquet file to write the feature importances to.
+    num_samples : int
+        Number of samples to compute feature importances for in each category
+        (anomalous or inlier). Use 0 to include every cell in each category.
+    chunk_size : int
+        Number of cells to compute feature importances for at a time.
+    n_jobs : int
+        Number of workers to compute feature importances with.
+
+    Returns
+    -------
+    pathlib.Path
+        Path of the written feature importances.
+    """
+
+    output_path = pathlib.Path(output_path)
+    feat_cols = anomalyze_model.feature_names_in_.tolist()
+
+    platedf = pd.read_parquet(morphology_plate_path, columns=MERGE_COLS + feat_cols)
+
+    # Importances are written chunk-by-chunk to bound memory when sampling many cells
+    writer = None
+
+    try:
+        for control_type in ["negcon", "anomalous"]:
+
+            # Negative controls shouldn't be anomalous and vice versa
+            if control_type == "negcon":
+                morphologydf = plate_anomdf.loc[
+                    plate_anomdf["Metadata_control_type"] == "negcon"
+                ]
+
+                if num_samples:
+                    morphologydf = morphologydf.nlargest(
+                        num_samples, "Result_anomaly_score"
+                    )
+
+            else:
+                morphologydf = plate_anomdf.loc[
+                    plate_anomdf["Metadata_control_type"] != "negcon"
+                ]
+
+                if num_samples:
+                    morphologydf = morphologydf.nsmallest(
+                        num_samples, "Result_anomaly_score"
+                    )
+
+            morphologyonlydf = pd.merge(
+                platedf, morphologydf, on=MERGE_COLS, how="inner"
+            )
+            meta_cols = morphologyonlydf.filter(regex="Metadata|Result").columns
+
+            feature_importances = IsoforestFeatureImportance(
+                estimators=anomalyze_model.estimators_,
+                estimators_features=anomalyze_model.estimators_features_,
+                morphology_data=morphologyonlydf,
+                feature_names=feat_cols,
+                n_jobs=n_jobs,
+            )
+
+            for resultdf in feature_importances.iter_isoforest_importances(
+                chunk_size=chunk_size,
+                metadata_columns=meta_cols.difference(feat_cols).tolist(),
+            ):
+                result_table = pa.Table.from_pandas(resultdf, preserve_index=False)
+
+                if writer is None:
+                    writer = pq.ParquetWriter(output_path, result_table.schema)
+
+                writer.write_table(result_table)
+
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return output_path
+
+
+def compute_dataset_plate_feature_importances(
+    anomaly_dataset_path: Union[str, pathlib.Path],
+    plate: str,
+    morphology_plate_path: Union[str, pathlib.Path],
+    anomalyze_model: CompiledIsolationForest,
+    output_path: Union[str, pathlib.Path],
+    num_samples: int = 300,
+    chunk_size: int = 10_000,
+    n_jobs: int = -1,
+) -> pathlib.Path:
+    """
+    Same as `compute_plate_feature_importances`, but only the plate's sampled
+    cells are read from the anomaly dataset at `anomaly_dataset_path`.
+    """
+
+    plate_anomdf = load_plate_anomaly_samples(
+        open_anomaly_dataset(anomaly_dataset_path, plate=plate),
+        plate=plate,
+        num_samples=num_samples,
+    )
+
+    return compute_plate_feature_importances(
+        plate_anomdf=plate_anomdf,
+        morphology_plate_path=morphology_plate_path,
+        anomalyze_model=anomalyze_model,
+        output_path=output_path,
+        num_samples=num_samples,
+        chunk_size=chunk_size,
+        n_jobs=n_jobs,
+    )
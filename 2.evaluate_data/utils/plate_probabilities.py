@@ -0,0 +1,102 @@
+import os
+import pathlib
+from typing import Union
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+
+def predict_plate_probabilities(
+    norm_plate_path: Union[str, pathlib.Path],
+    unnorm_plate_path: Union[str, pathlib.Path],
+    models: dict,
+    feature_cols: list[str],
+    meta_cols: list[str],
+    loc_cols: list[str],
+    output_path: Union[str, pathlib.Path],
+) -> pathlib.Path:
+    """
+    Predict the phenotype probabilities of every cell in a plate with each
+    model, and save them with the cells' metadata and nuclei locations.
+    Cells are matched to their unnormalized data once, by position, where
+    cells without unnormalized data are dropped.
+    The output is replaced atomically, so an existing output is complete.
+
+    Parameters
+    ----------
+    norm_plate_path : str | pathlib.Path
+        Normalized single-cell data of the plate.
+    unnorm_plate_path : str | pathlib.Path
+        Unnormalized single-cell data of the plate.
+    models : dict
+        Models by model type, which predict from `feature_cols`.
+    feature_cols : list[str]
+        Features of the models, where features missing from the plate are
+        set to zero.
+    meta_cols : list[str]
+        Metadata columns identifying each cell in both plate files.
+    loc_cols : list[str]
+        Columns of the unnormalized data added to the predictions
+        (e.g. nuclei locations).
+    output_path : str | pathlib.Path
+        Parquet file of the plate's predicted probabilities.
+
+    Returns
+    -------
+    pathlib.Path
+        Path of the predicted probabilities.
+    """
+
+    output_path = pathlib.Path(output_path)
+
+    # Only the features of the models and the metadata are read
+    plate_cols = pq.read_schema(norm_plate_path).names
+    df = pd.read_parquet(
+        norm_plate_path,
+        columns=[col for col in plate_cols if col in feature_cols or col in meta_cols],
+    )
+
+    # Set the features missing from the plate data to zero
+    df[[col for col in feature_cols if col not in df.columns]] = 0
+
+    df_unnorm = pd.read_parquet(unnorm_plate_path, columns=meta_cols + loc_cols)
+
+    unnorm_cell_index = pd.MultiIndex.from_frame(df_unnorm[meta_cols])
+    if not unnorm_cell_index.is_unique:
+        raise ValueError(f"Cells aren't uniquely identified in {unnorm_plate_path}")
+
+    # Position of each cell in the unnormalized data (-1 for missing cells)
+    unnorm_rows = unnorm_cell_index.get_indexer(pd.MultiIndex.from_frame(df[meta_cols]))
+    matched_rows = np.flatnonzero(unnorm_rows >= 0)
+
+    df = df.iloc[matched_rows].reset_index(drop=True)
+    df_loc = df_unnorm[loc_cols].iloc[unnorm_rows[matched_rows]].reset_index(drop=True)
+
+    modeldfs = []
+
+    for model_type, model in models.items():
+        modeldf = pd.DataFrame(
+            model.predict_proba(df[feature_cols].values), columns=model.classes_
+        )
+
+        modeldf["Metadata_model_type"] = model_type
+
+        for meta_col in [
+            "Metadata_ObjectNumber_cytoplasm",
+            "Metadata_Plate",
+            "Metadata_Well",
+            "Metadata_Site",
+        ]:
+            modeldf[meta_col] = df[meta_col]
+
+        # Add the nuclei locations (x,y)
+        modeldf[loc_cols] = df_loc
+
+        modeldfs.append(modeldf)
+
+    tmp_output_path = output_path.with_name(f".{output_path.name}.tmp")
+    pd.concat(modeldfs).to_parquet(tmp_output_path, index=True)
+    os.replace(tmp_output_path, output_path)
+
+    return output_path
@@ -0,0 +1,93 @@
+import os
+import pathlib
+from typing import Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+
+def sampled_plate_path(
+    store_path: Union[str, pathlib.Path], dataset_name: str, plate_name: str
+) -> pathlib.Path:
+    """Path of a plate's sampled cells in the sampled cell store."""
+
+    return pathlib.Path(store_path) / dataset_name / f"{plate_name}.parquet"
+
+
+def upsert_sampled_plate(
+    sampleddf: pd.DataFrame,
+    store_path: Union[str, pathlib.Path],
+    dataset_name: str,
+    plate_name: str,
+) -> pathlib.Path:
+    """
+    Add (or replace) the sampled cells of one plate in the sampled cell store,
+    which keeps one parquet file per plate under a directory per dataset.
+    Adding a plate only writes that plate's sample, and re-sampling a plate
+    replaces its previous sample instead of duplicating it.
+
+    Parameters
+    ----------
+    sampleddf : pd.DataFrame
+        Sampled cells of the plate.
+    store_path : str | pathlib.Path
+        Root directory of the sampled cell store.
+    dataset_name : str
+        Dataset the plate belongs to (e.g. feature_selected_sc_qc_data).
+    plate_name : str
+        Name of the plate file the cells were sampled from.
+
+    Returns
+    -------
+    pathlib.Path
+        Path of the plate's sampled cells.
+    """
+
+    plate_path = sampled_plate_path(store_path, dataset_name, plate_name)
+    plate_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Replaced atomically, so readers never see a partially written plate
+    tmp_plate_path = plate_path.with_name(f".{plate_path.name}.tmp")
+    sampleddf.to_parquet(tmp_plate_path, index=False)
+    os.replace(tmp_plate_path, plate_path)
+
+    return plate_path
+
+
+def open_sampled_dataset(
+    store_path: Union[str, pathlib.Path], dataset_name: str
+) -> ds.Dataset:
+    """
+    Open the union of the sampled cells of every plate in a dataset, without
+    reading any data.
+    Columns missing from some plates (e.g. treatment columns of different
+    perturbation types) are read as nulls for those plates.
+
+    Parameters
+    ----------
+    store_path : str | pathlib.Path
+        Root directory of the sampled cell store.
+    dataset_name : str
+        Dataset to open.
+
+    Returns
+    -------
+    ds.Dataset
+        Lazily scanned sampled cells, ordered by plate name.
+    """
+
+    plate_paths = sorted(
+        (pathlib.Path(store_path) / dataset_name).resolve(strict=True).glob("*.parquet")
+    )
+
+    if not plate_paths:
+        raise FileNotFoundError(f"No sampled plates of {dataset_name} in {store_path}")
+
+    # Only the footers are read to unify the plate schemas
+    return ds.dataset(
+        [str(path) for path in plate_paths],
+        schema=pa.unify_schemas([pq.read_schema(path) for path in plate_paths]),
+        format="parquet",
+    )
@@ -11,6 +11,7 @@
 
 
 import pathlib
+import sys
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -34,6 +35,13 @@ sc_anom_paths = (
     root_dir / "big_drive/sc_anomaly_data/feature_selected_sc_qc_data"
 ).resolve(strict=True)
 
+sys.path.append(str((root_dir / "2.evaluate_data" / "utils").resolve(strict=True)))
+from anomaly_dataset import (
+    list_anomaly_plates,
+    open_anomaly_dataset,
+    read_plate_anomalies,
+)
+
 
 # ## Outputs
 
@@ -51,15 +59,12 @@ figures_path.mkdir(parents=True, exist_ok=True)
 
 agg_platedf = []
 
-for plate_path in sc_anom_paths.iterdir():
+# Works with both the batched and the plate/well partitioned anomaly layouts
+for plate in list_anomaly_plates(open_anomaly_dataset(sc_anom_paths)):
 
     treatment_col_name = "Metadata_pert_iname"
-    platedf = pd.concat(
-        [
-            pd.read_parquet(data_path)
-            for data_path in plate_path.rglob("*.parquet")
-        ],
-        axis=0,
+    platedf = read_plate_anomalies(
+        open_anomaly_dataset(sc_anom_paths, plate=plate), plate=plate
     )
 
     result_cols = platedf.columns[platedf.columns.str.contains("Result")]
@@ -8,6 +8,7 @@
 
 
 import pathlib
+import sys
 
 import numpy as np
 import pandas as pd
@@ -22,6 +23,11 @@ import umap
 git_root_path = pathlib.Path("../../")
 big_drive_path = pathlib.Path("/mnt/big_drive").resolve(strict=True)
 feature_data_path = big_drive_path / "feature_selected_sc_qc_data"
+anomaly_dataset_path = big_drive_path / "sc_anomaly_data/feature_selected_sc_qc_data"
+
+sys.path.append(str((git_root_path / "2.evaluate_data" / "utils").resolve(strict=True)))
+from anomaly_dataset import open_anomaly_dataset, read_plate_anomalies
+
 plate_to_treat_typedf = pd.read_csv(
     (git_root_path / "reference_plate_data/barcode_platemap.csv").resolve(strict=True)
 )
@@ -84,13 +90,11 @@ for plate_path in feature_data_path.iterdir():
     plate_name = plate_path.stem.split("_")[0]
 
     print(f"Sampling Plate {plate_name}")
-    anomaly_path = (
-        big_drive_path
-        / f"sc_anomaly_data/feature_selected_sc_qc_data/{plate_name}_feature_selected_sc_qc"
-    )
 
-    anomalydf = pd.concat(
-        [pd.read_parquet(path) for path in anomaly_path.iterdir()], axis=0
+    # Works with both the batched and the plate/well partitioned anomaly layouts
+    anomalydf = read_plate_anomalies(
+        open_anomaly_dataset(anomaly_dataset_path, plate=plate_name),
+        plate=plate_name,
     )
 
     featdf = pd.read_parquet(